@@ -0,0 +1,47 @@
+""" Compare lock backends: acquire/release cycle and attempt on busy resource """
+import argparse
+import tempfile
+import timeit
+
+from lockable.lock_backend import BACKENDS
+
+
+def bench(name: str, lock_folder: str, number: int) -> dict:
+    """ Measure backend operations, returns microseconds per operation """
+    owner = BACKENDS[name](lock_folder)
+    # process local backend sees its own locks only
+    other = BACKENDS[name](lock_folder) if owner.shared else owner
+
+    def cycle():
+        owner.acquire('free').release()
+
+    handle = owner.acquire('busy')
+
+    def busy():
+        assert other.acquire('busy') is None
+
+    results = {
+        'acquire+release': timeit.timeit(cycle, number=number) / number * 1e6,
+        'busy attempt': timeit.timeit(busy, number=number) / number * 1e6,
+    }
+    handle.release()
+    owner.close()
+    if other is not owner:
+        other.close()
+    return results
+
+
+def main():
+    """ Entry point """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=2000, help='operations per measurement')
+    args = parser.parse_args()
+    for name in BACKENDS:
+        with tempfile.TemporaryDirectory() as lock_folder:
+            results = bench(name, lock_folder, args.number)
+        print(', '.join([f'{name:6}'] +
+                        [f'{operation}: {usec:8.1f} us' for operation, usec in results.items()]))
+
+
+if __name__ == '__main__':
+    main()
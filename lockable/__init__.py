@@ -1,4 +1,7 @@
 """ Lockable module """
 
 from lockable.lockable import Lockable, ResourceNotFound, Allocation, MODULE_LOGGER
+from lockable.async_lockable import AsyncLockable
 from lockable.provider import Provider, ProviderError
+from lockable.retry_policy import RetryPolicy, ConstantRetry, ExponentialBackoff, \
+    DecorrelatedJitter
@@ -0,0 +1,272 @@
+""" asyncio interface of lockable """
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+import logging
+import threading
+import time
+from typing import Union
+
+from lockable.allocation import Allocation
+from lockable.lock_backend import LockHandle
+from lockable.lockable import Lockable, DEFAULT_TIMEOUT
+from lockable.retry_policy import RetryPolicy, DEFAULT_RETRY_POLICY
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _Waiter:  # pylint: disable=too-few-public-methods
+    """ Allocation waiting for release of its candidates """
+
+    __slots__ = ('resource_ids', 'future')
+
+    def __init__(self, resource_ids: set):
+        self.resource_ids = resource_ids
+        # pending future while waiter sleeps, None while it is trying to lock
+        self.future = None
+
+
+class AsyncLockable(Lockable):
+    """
+    Lockable for asyncio applications. Waiting for resources does not block
+    the event loop, so any number of allocations can wait concurrently in one
+    thread. Providers are reloaded in a worker thread and concurrent
+    allocations share the same reload. Resource released by this instance is
+    handed over to the longest waiting allocation, which other allocations
+    cannot take in the meantime. Releases by other processes are noticed on
+    next retry.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        AsyncLockable constructor, see Lockable for arguments. fair_queue is not supported.
+        """
+        assert not kwargs.get('fair_queue'), 'fair_queue is not supported by AsyncLockable'
+        super().__init__(*args, **kwargs)
+        self._reloading = None
+        # resource id to waiters in arrival order, waiters keep their place until they are done
+        self._waiters = {}
+        # resource id to waiter which the released resource is handed over to
+        self._handoffs = {}
+        self._waiters_lock = threading.Lock()
+        # waiter whose lock round is running
+        self._turn = None
+
+    def _allocation(self, requirements, candidate, handle: LockHandle) -> Allocation:
+        resource_id = candidate.get("id")
+
+        def release():
+            # resource is handed over before it is free so that nobody else takes it
+            future = self._hand_over(resource_id)
+            handle.release()
+            if future is not None:
+                future.get_loop().call_soon_threadsafe(_wake, future)
+
+        return super()._allocation(requirements, candidate, LockHandle(handle.path, release))
+
+    def _hand_over(self, resource_id) -> Union[asyncio.Future, None]:
+        """
+        Hand resource over to longest sleeping waiter, may be called from any thread
+        :return: future which wakes the waiter, None when nobody is waiting
+        """
+        with self._waiters_lock:
+            for waiter in self._waiters.get(resource_id, ()):
+                if waiter.future is not None:
+                    future, waiter.future = waiter.future, None
+                    self._handoffs[resource_id] = waiter
+                    return future
+        return None
+
+    def _drop_handoffs(self, waiter: _Waiter, pass_on: bool) -> None:
+        """
+        Forget resources handed over to waiter
+        :param waiter: waiter
+        :param pass_on: hand resources which waiter did not take over to next waiters
+        """
+        with self._waiters_lock:
+            unused = [resource_id for resource_id, owner in self._handoffs.items()
+                      if owner is waiter]
+            for resource_id in unused:
+                del self._handoffs[resource_id]
+        if not pass_on:
+            return
+        for resource_id in unused:
+            if resource_id not in self._allocations:
+                future = self._hand_over(resource_id)
+                if future is not None:
+                    future.get_loop().call_soon_threadsafe(_wake, future)
+
+    def _reserve(self, resource_id) -> bool:
+        # resource handed over to other waiter is not available
+        owner = self._handoffs.get(resource_id)
+        if owner is not None and owner is not self._turn:
+            return False
+        return super()._reserve(resource_id)
+
+    def _try_lock_any(self, requirements, candidates) -> (Allocation or None):
+        owners = [(self._handoffs.get(candidate['id']), candidate) for candidate in candidates]
+        # resources handed over to this waiter are tried first, ones of other waiters never
+        candidates = [candidate for owner, candidate in owners
+                      if owner is not None and owner is self._turn] + \
+            [candidate for owner, candidate in owners if owner is None]
+        return super()._try_lock_any(requirements, candidates)
+
+    def _register(self, waiter: _Waiter) -> None:
+        with self._waiters_lock:
+            for resource_id in waiter.resource_ids:
+                self._waiters.setdefault(resource_id, {})[waiter] = None
+
+    def _unregister(self, waiter: _Waiter) -> None:
+        with self._waiters_lock:
+            waiter.future = None
+            for resource_id in waiter.resource_ids:
+                waiters = self._waiters[resource_id]
+                del waiters[waiter]
+                if not waiters:
+                    del self._waiters[resource_id]
+
+    async def _wait_release(self, waiter: _Waiter, timeout: float) -> None:
+        """ Wait until some of resources is handed over to waiter or timeout occurs """
+        future = asyncio.get_running_loop().create_future()
+        with self._waiters_lock:
+            waiter.future = future
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._waiters_lock:
+                waiter.future = None
+
+    async def _reload_async(self, deadline: float) -> None:
+        """ Reload provider in worker thread, concurrent callers share the reload """
+        if self._reloading is None or self._reloading.done():
+            self._reloading = asyncio.ensure_future(
+                asyncio.to_thread(self._provider.reload, deadline=deadline))
+        # cancelling one waiter does not cancel reload of others
+        await asyncio.shield(self._reloading)
+
+    async def _lock_some_async(self,  # pylint: disable=too-many-arguments
+                               requirements, candidates, timeout_s, retry_policy, atomic=False):
+        """
+        Lock free candidates for all requirements without blocking event loop
+        :param requirements: list of requirements
+        :param candidates: list of candidate resources per requirement
+        :param timeout_s: max duration to try to lock
+        :param retry_policy: delays between allocation attempts
+        :param atomic: do not hold partial allocations while waiting
+        :return: list of allocations in requirements order
+        """
+        resource_ids = {resource['id'] for resources in candidates for resource in resources}
+        MODULE_LOGGER.debug('Total match local resources: %d, timeout: %d',
+                            len(resource_ids), timeout_s)
+        schedule = retry_policy.schedule(timeout_s)
+        lock_round = self._lock_round_atomic if atomic else self._lock_round
+        allocations = {}
+        waiter = None
+        try:
+            while True:
+                self._turn = waiter
+                try:
+                    lock_round(requirements, candidates, allocations)
+                finally:
+                    self._turn = None
+                if len(requirements) == len(allocations):
+                    return [allocations[index] for index in range(len(requirements))]
+                if schedule.expired():
+                    MODULE_LOGGER.warning('Allocation timeout')
+                    raise TimeoutError(f'Allocation timeout ({timeout_s}s)')
+                if waiter is None:
+                    # waiter keeps its place in queues until allocation is done
+                    waiter = _Waiter(resource_ids)
+                    self._register(waiter)
+                else:
+                    # handed over resource was taken by other process meanwhile,
+                    # passing it on would only wake other waiters in vain
+                    self._drop_handoffs(waiter, pass_on=False)
+                MODULE_LOGGER.debug('waiting for busy resources release')
+                await self._wait_release(waiter, schedule.next_delay())
+        except BaseException:
+            # timeout or cancelled, unlock all already done allocations
+            for allocation in allocations.values():
+                allocation.unlock()
+            raise
+        finally:
+            if waiter is not None:
+                self._unregister(waiter)
+                # allocation is done or given up, resources it did not take are free
+                self._drop_handoffs(waiter, pass_on=True)
+
+    async def _lock_predicates(self, predicates: list, timeout_s: float,
+                               retry_policy: RetryPolicy, atomic: bool) -> list:
+        """ Lock resources for parsed requirements """
+        begin = datetime.now()
+        if self._broker:
+            MODULE_LOGGER.debug("Use lock broker: %s", self._broker.socket_path)
+            allocations = await asyncio.to_thread(self._lock_from_broker, predicates,
+                                                  timeout_s, atomic)
+        else:
+            deadline = time.monotonic() + timeout_s
+            await self._reload_async(deadline)
+            MODULE_LOGGER.debug("Use lock folder: %s", self._lock_folder)
+            candidates = self._candidates(predicates)
+            allocations = await self._lock_some_async(
+                predicates, candidates, max(0.0, deadline - time.monotonic()),
+                retry_policy or DEFAULT_RETRY_POLICY, atomic)
+        for allocation in allocations:
+            allocation.allocation_queue_time = datetime.now() - begin
+        return allocations
+
+    async def lock(self,  # pylint: disable=invalid-overridden-method
+                   requirements: (str or dict), timeout_s: int = DEFAULT_TIMEOUT,
+                   retry_policy: RetryPolicy = None) -> Allocation:
+        """
+        Lock resource
+        :param requirements: resource requirements
+        :param timeout_s: timeout while trying to lock
+        :param retry_policy: delays between allocation attempts, default 1s interval
+        :return: Allocation context
+        """
+        assert isinstance(self.resource_list, list), 'resources list is not loaded'
+        predicate = self._get_requirements(self.parse_requirements(requirements), self._hostname)
+        allocations = await self._lock_predicates([predicate], timeout_s, retry_policy, False)
+        return allocations[0]
+
+    async def lock_many(self,  # pylint: disable=invalid-overridden-method
+                        requirements: list, timeout_s: int = DEFAULT_TIMEOUT,
+                        retry_policy: RetryPolicy = None, atomic: bool = False) -> list:
+        """
+        Lock many resources
+        :param requirements: resource requirements, list of string or dicts
+        :param timeout_s: max duration to try to lock
+        :param retry_policy: delays between allocation attempts, default 1s interval
+        :param atomic: all-or-nothing allocation, partial allocations are not held while waiting
+        :return: List of allocation contexts
+        """
+        assert isinstance(self.resource_list, list), "resources list is not loaded"
+        predicates = [self._get_requirements(self.parse_requirements(req), self._hostname)
+                      for req in requirements]
+        return await self._lock_predicates(predicates, timeout_s, retry_policy, atomic)
+
+    @asynccontextmanager
+    async def auto_lock(self,  # pylint: disable=invalid-overridden-method
+                        requirements: (str or dict),
+                        timeout_s: int = DEFAULT_TIMEOUT,
+                        retry_policy: RetryPolicy = None) -> Allocation:
+        """
+        async contextmanaged lock method. Resource is released automatically after context ends.
+        :param requirements: requirements
+        :param timeout_s: timeout while trying to lock suitable resource
+        :param retry_policy: delays between allocation attempts, default 1s interval
+        :return: return Allocation object
+        """
+        allocation = await self.lock(requirements, timeout_s, retry_policy)
+        try:
+            yield allocation
+        finally:
+            allocation.unlock()
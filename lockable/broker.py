@@ -0,0 +1,185 @@
+""" Local lock broker serving allocations over unix domain socket """
+# pylint: disable=protected-access
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from lockable.broker_client import read_message, send_message
+from lockable.fair_queue import FairQueue
+from lockable.lockable import Lockable, ResourceNotFound
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ Threading unix socket server """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, broker: 'Broker'):
+        self.broker = broker
+        super().__init__(socket_path, _Handler)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """ Broker connection handler, leases are released when connection closes """
+
+    def handle(self):
+        broker = self.server.broker
+        leases = {}
+        try:
+            while True:
+                message = read_message(self.rfile)
+                if message is None:
+                    break
+                send_message(self.wfile, self._dispatch(broker, message, leases))
+        except (OSError, ValueError) as error:
+            MODULE_LOGGER.warning('Broker connection failed: %s', error)
+        finally:
+            for allocation in leases.values():
+                broker.release(allocation)
+
+    @staticmethod
+    def _dispatch(broker: 'Broker', message: dict, leases: dict) -> dict:
+        """ Handle single request """
+        try:
+            operation = message.get('op')
+            if operation == 'lock':
+                allocations = broker.allocate(message['requirements'],
+                                              message.get('timeout_s', 0),
+                                              message.get('atomic', False))
+                leases.update({allocation.resource_id: allocation for allocation in allocations})
+                return {'resources': [allocation.resource_info for allocation in allocations]}
+            if operation == 'unlock':
+                ResourceNotFound.invariant(message.get('resource_id') in leases,
+                                           'resource not locked')
+                broker.release(leases.pop(message['resource_id']))
+                return {}
+            raise ValueError(f'unknown operation: {operation}')
+        except Exception as error:  # pylint: disable=broad-except
+            return {'error': type(error).__name__, 'message': str(error)}
+
+
+class Broker:
+    """
+    Lock broker. Holds resources inventory in memory and arbitrates
+    allocations of all clients centrally: waiters with same requirements
+    are served in FIFO order and leases live as long as client connection.
+    """
+
+    # minimum interval between inventory reloads
+    RELOAD_INTERVAL_S = 5
+
+    def __init__(self, lockable: Lockable, socket_path: str):
+        """
+        Broker constructor
+        :param lockable: Lockable which owns the inventory and locks resources
+        :param socket_path: unix socket path
+        """
+        self._lockable = lockable
+        self.socket_path = socket_path
+        self._condition = threading.Condition()
+        self._waiters = []
+        self._reloaded = time.monotonic()
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def _reload(self) -> None:
+        if time.monotonic() - self._reloaded >= Broker.RELOAD_INTERVAL_S:
+            self._lockable._provider.reload()
+            self._reloaded = time.monotonic()
+
+    def _is_first(self, waiter: tuple) -> bool:
+        """ Check that no earlier waiter has same requirements """
+        for other in self._waiters:
+            if other is waiter:
+                return True
+            if other[0] == waiter[0]:
+                return False
+        return True  # pragma: no cover
+
+    def allocate(self, requirements: list, timeout_s: float, atomic: bool = False) -> list:
+        """
+        Allocate resources for requirements
+        :param requirements: list of requirements
+        :param timeout_s: max duration to wait for resources
+        :param atomic: lock resources in global order, see Lockable.lock_many.
+                       Broker never holds partial allocations while waiting.
+        :return: list of allocations in requirements order
+        """
+        deadline = time.monotonic() + timeout_s
+        with self._condition:
+            self._reload()
+            candidates = self._lockable._candidates(requirements)
+            waiter = (FairQueue.requirement_class(requirements), object())
+            self._waiters.append(waiter)
+            try:
+                while True:
+                    if self._is_first(waiter):
+                        allocations = self._lockable._try_lock_many(requirements, candidates,
+                                                                    atomic)
+                        if allocations:
+                            return allocations
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f'Allocation timeout ({timeout_s}s)')
+                    self._condition.wait(remaining)
+            finally:
+                self._waiters.remove(waiter)
+                self._condition.notify_all()
+
+    def release(self, allocation) -> None:
+        """ Release allocation and wake up waiters """
+        with self._condition:
+            allocation.unlock()
+            self._condition.notify_all()
+
+    def _bind(self) -> None:
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise OSError(f'broker already running in {self.socket_path}')
+            except ConnectionRefusedError:
+                # stale socket of crashed broker
+                os.unlink(self.socket_path)
+            finally:
+                probe.close()
+        self._server = _Server(self.socket_path, self)
+        MODULE_LOGGER.info('Broker listening %s', self.socket_path)
+
+    def serve_forever(self) -> None:
+        """ Serve clients until shutdown """
+        if self._server is None:
+            self._bind()
+        self._server.serve_forever()
+
+    def start(self) -> None:
+        """ Serve clients in background thread """
+        self._bind()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def shutdown(self) -> None:
+        """ Stop serving and remove socket """
+        if self._server is None:
+            return
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        self._server = None
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,144 @@
+""" Lock broker client """
+import json
+import logging
+import socket
+import threading
+from functools import partial
+from typing import Callable, List, Tuple, Union
+
+from lockable.compact import json_default
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+
+class BrokerError(Exception):
+    """ Error reported by lock broker """
+
+    def __init__(self, kind: str, message: str):
+        """
+        BrokerError constructor
+        :param kind: broker side exception name
+        :param message: error message
+        """
+        super().__init__(message)
+        self.kind = kind
+
+
+def send_message(wfile, message: dict) -> None:
+    """ Write single json line message """
+    wfile.write(json.dumps(message, default=json_default).encode('utf-8') + b'\n')
+    wfile.flush()
+
+
+def read_message(rfile) -> Union[dict, None]:
+    """ Read single json line message, None when connection is closed """
+    line = rfile.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+class _Connection:
+    """ Broker connection, leases are bound to its lifetime """
+
+    def __init__(self, socket_path: str):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(socket_path)
+        except OSError:
+            self._socket.close()
+            raise
+        self._file = self._socket.makefile('rwb')
+        self._lock = threading.Lock()
+        self.leases = 0
+
+    def request(self, message: dict) -> dict:
+        """ Send request and wait for response """
+        with self._lock:
+            send_message(self._file, message)
+            response = read_message(self._file)
+        if response is None:
+            raise BrokerError('ConnectionError', 'broker closed connection')
+        if 'error' in response:
+            raise BrokerError(response['error'], response.get('message', ''))
+        return response
+
+    def close(self) -> None:
+        """ Close connection, broker releases its leases """
+        self._file.close()
+        self._socket.close()
+
+
+class BrokerClient:
+    """
+    Lock broker client.
+    Connection is not shared with other requests while it holds leases so
+    that releasing never waits behind a pending allocation.
+    """
+
+    def __init__(self, socket_path: str):
+        """
+        BrokerClient constructor
+        :param socket_path: broker unix socket path
+        """
+        self.socket_path = socket_path
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _take(self) -> _Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return _Connection(self.socket_path)
+
+    def _put(self, connection: _Connection) -> None:
+        with self._lock:
+            self._idle.append(connection)
+
+    def lock(self, requirements: list, timeout_s: float,
+             atomic: bool = False) -> List[Tuple[dict, Callable[[], None]]]:
+        """
+        Allocate resources from broker
+        :param requirements: list of requirements
+        :param timeout_s: max duration to wait for resources
+        :param atomic: allocate all or nothing
+        :return: resource info and release function per requirement
+        """
+        connection = self._take()
+        try:
+            response = connection.request({'op': 'lock', 'requirements': requirements,
+                                           'timeout_s': float(timeout_s), 'atomic': atomic})
+        except BrokerError as error:
+            if error.kind == 'ConnectionError':
+                connection.close()
+            else:
+                self._put(connection)
+            raise
+        except OSError:
+            connection.close()
+            raise
+        resources = response['resources']
+        connection.leases += len(resources)
+        return [(resource, partial(self._unlock, connection, resource['id']))
+                for resource in resources]
+
+    def _unlock(self, connection: _Connection, resource_id) -> None:
+        """ Release lease of connection """
+        try:
+            connection.request({'op': 'unlock', 'resource_id': resource_id})
+        except (OSError, BrokerError) as error:
+            # lease is released by broker together with lost connection
+            MODULE_LOGGER.warning('Broker unlock failed: %s', error)
+            connection.close()
+            return
+        with self._lock:
+            connection.leases -= 1
+            if connection.leases == 0:
+                self._idle.append(connection)
+
+    def close(self) -> None:
+        """ Close idle connections """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
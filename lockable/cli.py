@@ -10,6 +10,8 @@ import sys
 import json
 import subprocess
 from lockable import Lockable
+from lockable.broker import Broker
+from lockable.provider_helpers import is_http_url
 
 
 def get_args():
@@ -39,6 +41,17 @@ def get_args():
     parser.add_argument('--requirements',
                         default="{}",
                         help='requirements as json string')
+    parser.add_argument('--snapshot-cache',
+                        action="store_true",
+                        default=False,
+                        help='Keep parsed resources file in binary snapshot in lock folder\n'
+                             'to speed up following invocations')
+    parser.add_argument('--serve-broker',
+                        metavar='SOCKET',
+                        help='Run lock broker serving resources in given unix socket')
+    parser.add_argument('--broker',
+                        metavar='SOCKET',
+                        help='Allocate resource from lock broker running in given unix socket')
     parser.add_argument('command', nargs='*',
                         help='Command to be execute during device allocation')
 
@@ -48,12 +61,29 @@ def get_args():
 def main():
     """ CLI application """
     args = get_args()
+    provider_options = {}
+    if args.snapshot_cache and not is_http_url(args.resources):
+        provider_options['snapshot_folder'] = args.lock_folder
+    if args.serve_broker:
+        # broker arbitrates all allocations itself, no lock files needed
+        lockable = Lockable(hostname=args.hostname,
+                            resource_list_file=args.resources,
+                            lock_folder=args.lock_folder,
+                            lock_backend='memory',
+                            provider_options=provider_options)
+        if not args.validate_only:
+            Broker(lockable, args.serve_broker).serve_forever()
+        sys.exit(0)
     if not args.command:
         print('command is mandatory')
         sys.exit(1)
-    lockable = Lockable(hostname=args.hostname,
-                        resource_list_file=args.resources,
-                        lock_folder=args.lock_folder)
+    if args.broker:
+        lockable = Lockable(hostname=args.hostname, broker=args.broker)
+    else:
+        lockable = Lockable(hostname=args.hostname,
+                            resource_list_file=args.resources,
+                            lock_folder=args.lock_folder,
+                            provider_options=provider_options)
 
     if args.validate_only:
         sys.exit(0)
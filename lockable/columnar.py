@@ -0,0 +1,224 @@
+""" Columnar requirement evaluation using numpy """
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping, Sequence
+import logging
+import math
+from typing import List, Union
+
+from mongoquery import Query
+
+from lockable.resource_index import is_indexable_key
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - optional dependency
+    numpy = None
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+# value kinds of a column
+MISSING, NUMBER, STRING, NULL, COMPLEX = range(5)
+
+VECTORIZED_OPERATORS = {'$eq', '$ne', '$in', '$gt', '$gte', '$lt', '$lte', '$exists'}
+# larger integers are not exactly representable as float64
+MAX_EXACT_INT = 2 ** 53
+
+_ABSENT = object()
+
+
+def is_available() -> bool:
+    """ Check if numpy is installed """
+    return numpy is not None
+
+
+def _is_number(value) -> bool:
+    """ Check if value can be compared exactly as float64 """
+    if isinstance(value, int):
+        return abs(value) <= MAX_EXACT_INT
+    return isinstance(value, float) and not math.isnan(value)
+
+
+class _Column:  # pylint: disable=too-few-public-methods
+    """ Values of single top-level attribute split to typed arrays """
+
+    def __init__(self, resources: list, key: str):
+        kinds = []
+        numbers = []
+        strings = {}
+        for position, resource in enumerate(resources):
+            value = resource.get(key, _ABSENT)
+            number = 0.0
+            if value is _ABSENT:
+                kind = MISSING
+            elif isinstance(value, str):
+                kind = STRING
+                strings.setdefault(value, []).append(position)
+            elif value is None:
+                kind = NULL
+            elif _is_number(value):
+                kind = NUMBER
+                number = value
+            else:
+                kind = COMPLEX
+            kinds.append(kind)
+            numbers.append(number)
+        self.kinds = numpy.array(kinds, dtype=numpy.int8)
+        self.numbers = numpy.array(numbers, dtype=numpy.float64)
+        # strings are replaced by their rank so that comparisons are integer comparisons
+        self.strings = sorted(strings)
+        self.codes = numpy.full(len(resources), -1, dtype=numpy.int64)
+        for code, value in enumerate(self.strings):
+            self.codes[strings[value]] = code
+        self.scalar = (self.kinds == NUMBER) | (self.kinds == STRING) | (self.kinds == NULL)
+        self.missing = self.kinds == MISSING
+        self.complex = numpy.flatnonzero(self.kinds == COMPLEX)
+
+    def _string_range(self, operator: str, value: str):
+        """ Mask of strings compared to value using string ranks """
+        if operator == '$gt':
+            return self.codes >= bisect_right(self.strings, value)
+        if operator == '$gte':
+            return self.codes >= bisect_left(self.strings, value)
+        if operator == '$lt':
+            return (self.codes >= 0) & (self.codes < bisect_left(self.strings, value))
+        return (self.codes >= 0) & (self.codes < bisect_right(self.strings, value))
+
+    def equal(self, value):
+        """ Mask of scalar values equal to value, None if value is not supported """
+        if isinstance(value, str):
+            code = bisect_left(self.strings, value)
+            if code < len(self.strings) and self.strings[code] == value:
+                return self.codes == code
+            return numpy.zeros(len(self.kinds), dtype=bool)
+        if value is None:
+            return self.kinds == NULL
+        if _is_number(value):
+            return (self.kinds == NUMBER) & (self.numbers == value)
+        return None
+
+    def compare(self, operator: str, value):
+        """ Mask of scalar values matching operator, None if it is not supported """
+        if operator == '$eq':
+            return self.equal(value)
+        if operator == '$ne':
+            equal = self.equal(value)
+            return None if equal is None else self.scalar & ~equal
+        if operator == '$in':
+            if not isinstance(value, Sequence) or isinstance(value, str):
+                return None
+            mask = numpy.zeros(len(self.kinds), dtype=bool)
+            for item in value:
+                equal = self.equal(item)
+                if equal is None:
+                    return None
+                mask |= equal
+            return mask
+        return self._ordering(operator, value)
+
+    def _ordering(self, operator: str, value):
+        """ Mask of $gt, $gte, $lt and $lte comparisons, None if value is not supported """
+        # ordering between different types raises TypeError in mongoquery, which is no match
+        if isinstance(value, str):
+            return self._string_range(operator, value)
+        if value is None:
+            return numpy.zeros(len(self.kinds), dtype=bool)
+        if not _is_number(value):
+            return None
+        numbers = self.numbers
+        compared = {'$gt': numbers > value, '$gte': numbers >= value,
+                    '$lt': numbers < value, '$lte': numbers <= value}[operator]
+        return (self.kinds == NUMBER) & compared
+
+
+class ColumnarEngine:
+    """
+    Evaluates requirements with vectorized masks over columns of top-level
+    scalar attributes. Rows with non-scalar values, dotted keys, logical
+    operators and other unsupported terms are evaluated row-wise with mongoquery,
+    so results are identical to mongoquery.
+    """
+
+    def __init__(self, resources: list):
+        """
+        ColumnarEngine constructor
+        :param resources: resources list, columns are built lazily on first use
+        """
+        if numpy is None:
+            raise ImportError('columnar engine requires numpy')
+        self._resources = resources
+        self._columns = {}
+
+    def _column(self, key: str) -> _Column:
+        column = self._columns.get(key)
+        if column is None:
+            column = self._columns[key] = _Column(self._resources, key)
+        return column
+
+    def filter(self, requirement: dict) -> List[dict]:
+        """
+        Filter resources matching requirement
+        :param requirement: mongoquery requirement
+        :return: matching resources in resources list order
+        """
+        positions = numpy.flatnonzero(self.mask(requirement))
+        return [self._resources[position] for position in positions]
+
+    def mask(self, requirement: dict):
+        """ Boolean array telling which resources match requirement """
+        mask = numpy.ones(len(self._resources), dtype=bool)
+        fallback = {}
+        for key, condition in requirement.items():
+            term = self._term(key, condition)
+            if term is None:
+                fallback[key] = condition
+            else:
+                mask &= term
+        if fallback:
+            MODULE_LOGGER.debug('Evaluate row-wise: %s', list(fallback.keys()))
+            query = Query(fallback)
+            for position in numpy.flatnonzero(mask):
+                mask[position] = query.match(self._resources[position])
+        return mask
+
+    @staticmethod
+    def _operators(key, condition) -> Union[Mapping, None]:
+        """ Operators of requirement term, None if term cannot be vectorized """
+        if not is_indexable_key(key):
+            return None
+        if isinstance(condition, Mapping):
+            if not condition or not set(condition.keys()) <= VECTORIZED_OPERATORS:
+                return None
+            if '$exists' in condition and len(condition) != 1:
+                return None
+            return condition
+        if isinstance(condition, (str, int, float, type(None))):
+            return {'$eq': condition}
+        return None
+
+    def _term(self, key, condition) -> Union[object, None]:
+        """ Mask of single requirement term, None if it cannot be vectorized """
+        operators = self._operators(key, condition)
+        if operators is None:
+            return None
+        column = self._column(key)
+        if '$exists' in operators:
+            exists = operators['$exists']
+            # mongoquery compares $exists value to key presence
+            mask = numpy.zeros(len(self._resources), dtype=bool)
+            if exists == True:  # pylint: disable=singleton-comparison
+                mask |= ~column.missing
+            if exists == False:  # pylint: disable=singleton-comparison
+                mask |= column.missing
+            return mask
+        mask = column.scalar.copy()
+        for operator, value in operators.items():
+            compared = column.compare(operator, value)
+            if compared is None:
+                return None
+            mask &= compared
+        query = Query({key: condition})
+        for position in column.complex:
+            mask[position] = query.match(self._resources[position])
+        if column.missing.any() and query.match({}):
+            mask |= column.missing
+        return mask
@@ -0,0 +1,106 @@
+""" Compact read-only resources """
+from collections.abc import ItemsView, Mapping
+import logging
+from typing import Iterable, Iterator, List
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+class CompactResource(Mapping):
+    """
+    Read-only resource. Resources with same keys share key layout and values
+    are stored in a tuple, which takes considerably less memory than dict.
+    Nested values are kept as they are and should not be modified.
+    """
+
+    __slots__ = ('_layout', '_values')
+
+    def __init__(self, layout: dict, values: tuple):
+        """
+        CompactResource constructor
+        :param layout: shared mapping of keys to value positions
+        :param values: values in layout order
+        """
+        self._layout = layout
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._layout[key]]
+
+    def __iter__(self) -> Iterator:
+        return iter(self._layout)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, key) -> bool:
+        return key in self._layout
+
+    def get(self, key, default=None):
+        position = self._layout.get(key)
+        return default if position is None else self._values[position]
+
+    def items(self) -> ItemsView:
+        return _CompactItems(self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+    def __reduce__(self):
+        # copies and pickles are plain dicts
+        return dict, (list(self.items()),)
+
+
+class _CompactItems(ItemsView):  # pylint: disable=too-many-ancestors
+    """ Items view which iterates layout and values side by side """
+
+    def __iter__(self):
+        # pylint: disable=protected-access
+        return zip(self._mapping._layout, self._mapping._values)
+
+
+class Compactor:
+    """ Creates compact resources, key layouts are shared between all created resources """
+
+    def __init__(self):
+        self._layouts = {}
+
+    def compact(self, resources: Iterable[Mapping]) -> Iterator[CompactResource]:
+        """
+        Create compact copies of resources. Equal scalar values are shared between
+        resources created by the same call.
+        :param resources: resources
+        :return: iterator of compact resources
+        """
+        values = {}
+        for resource in resources:
+            if not isinstance(resource, Mapping):
+                raise ValueError('Invalid json, resource is not an object')
+            keys = tuple(resource.keys())
+            layout = self._layouts.get(keys)
+            if layout is None:
+                layout = self._layouts[keys] = {key: position for position, key in enumerate(keys)}
+            shared = []
+            for value in resource.values():
+                if isinstance(value, SCALAR_TYPES):
+                    # type is part of the key so that True, 1 and 1.0 are not mixed
+                    value = values.setdefault((type(value), value), value)
+                shared.append(value)
+            yield CompactResource(layout, tuple(shared))
+
+    def compact_list(self, resources: Iterable[Mapping]) -> List[CompactResource]:
+        """ Create list of compact copies of resources """
+        return list(self.compact(resources))
+
+
+def json_default(value):
+    """
+    json.dumps() default which serializes compact resources
+    :param value: value which is not serializable by json
+    :return: serializable value
+    """
+    if isinstance(value, Mapping):
+        return dict(value.items())
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
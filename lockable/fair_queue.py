@@ -0,0 +1,162 @@
+""" Cross-process FIFO waiting queue """
+import hashlib
+import logging
+import os
+import time
+from typing import List, Union
+
+from lockable.process_helpers import pid_exists
+from lockable.query_cache import QueryCache
+from lockable.watcher import Watcher, create_watcher
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+TICKET_SUFFIX = '.ticket'
+# ticket without owner pid is considered abandoned after this many seconds
+STALE_EMPTY_TICKET_S = 10
+
+
+def list_tickets(folder: str) -> List[str]:
+    """ Ticket names in folder in queue order """
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if name.endswith(TICKET_SUFFIX))
+
+
+class Ticket:
+    """ Waiting ticket in FairQueue """
+
+    def __init__(self, folder: str, name: str, watcher: Watcher = None):
+        """
+        Ticket constructor
+        :param folder: requirement class queue folder
+        :param name: ticket file name
+        :param watcher: queue folder watcher, closed when ticket leaves
+        """
+        self.folder = folder
+        self.name = name
+        self._watcher = watcher
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.leave()
+
+    @property
+    def path(self) -> str:
+        """ Ticket file path """
+        return os.path.join(self.folder, self.name)
+
+    @staticmethod
+    def _is_stale(path: str) -> bool:
+        """ Check if ticket owner has crashed """
+        try:
+            with open(path, encoding='utf-8') as ticket_file:
+                content = ticket_file.read().strip()
+            if content:
+                return not pid_exists(int(content))
+            # ticket which is just being written has no owner yet
+            return os.path.getmtime(path) + STALE_EMPTY_TICKET_S < time.time()
+        except (OSError, ValueError):
+            return False
+
+    def ahead(self) -> Union[str, None]:
+        """
+        Get ticket of first alive waiter which is ahead of this ticket.
+        Tickets of crashed waiters are removed on the way.
+        :return: ticket name or None when this ticket is first in queue
+        """
+        for name in list_tickets(self.folder):
+            if name >= self.name:
+                return None
+            path = os.path.join(self.folder, name)
+            if self._is_stale(path):
+                MODULE_LOGGER.info('Remove stale queue ticket %s', name)
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            if os.path.exists(path):
+                return name
+        return None
+
+    def is_head(self) -> bool:
+        """ Check if ticket is first in queue """
+        return self.ahead() is None
+
+    def wait(self, ahead: str, timeout: float) -> bool:
+        """
+        Wait until ticket ahead leaves the queue
+        :param ahead: ticket name
+        :param timeout: maximum wait time in seconds
+        :return: True when ticket left, False when timeout occurs
+        """
+        if self._watcher is None:
+            self._watcher = create_watcher(self.folder)
+        return self._watcher.wait([ahead], timeout)
+
+    def leave(self) -> None:
+        """ Remove ticket from queue """
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+
+
+class FairQueue:
+    """
+    FIFO waiting queue shared by processes using same lock folder.
+    Waiters enqueue a ticket per requirement class and only the first
+    ticket holder of the class is allowed to try to allocate resources.
+    """
+
+    FOLDER = '.lockable-queue'
+
+    def __init__(self, lock_folder: str):
+        """
+        FairQueue constructor
+        :param lock_folder: lock folder shared by processes
+        """
+        self._folder = os.path.join(lock_folder, FairQueue.FOLDER)
+
+    @staticmethod
+    def requirement_class(requirements: list) -> str:
+        """ Identifier of requirements class """
+        key = QueryCache.canonical_key(requirements) or repr(requirements)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def class_folder(self, requirements: list) -> str:
+        """ Queue folder of requirements class """
+        return os.path.join(self._folder, self.requirement_class(requirements))
+
+    def enqueue(self, requirements: list) -> Ticket:
+        """
+        Enqueue new ticket for requirements
+        :param requirements: list of requirements
+        :return: Ticket
+        """
+        folder = self.class_folder(requirements)
+        os.makedirs(folder, exist_ok=True)
+        # watch queue before joining it so that no leaving waiter is missed
+        watcher = create_watcher(folder)
+        tickets = list_tickets(folder)
+        sequence = int(tickets[-1][:-len(TICKET_SUFFIX)]) + 1 if tickets else 0
+        while True:
+            name = f'{sequence:020d}{TICKET_SUFFIX}'
+            try:
+                descriptor = os.open(os.path.join(folder, name),
+                                     os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                sequence += 1
+                continue
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as ticket_file:
+                ticket_file.write(f'{os.getpid()}\n')
+            MODULE_LOGGER.debug('Enqueued ticket %s', name)
+            return Ticket(folder, name, watcher)
@@ -0,0 +1,87 @@
+""" Persistent last-known-good resources cache """
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Union
+
+from lockable.compact import json_default
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+
+class InventoryCache:
+    """
+    Resources list and its cache validators stored in a json file.
+    File is replaced atomically and its modification time tells when
+    resources were last validated against the source.
+    """
+
+    def __init__(self, path: str, source, max_age: float = None):
+        """
+        InventoryCache constructor
+        :param path: cache file path
+        :param source: resources source, cache of other source is ignored
+        :param max_age: resources not validated for this many seconds are not used,
+                        None for any age
+        """
+        self.path = path
+        self.max_age = max_age
+        self._source = source
+
+    def age(self) -> Union[float, None]:
+        """ Seconds since resources were last validated, None when there is no cache """
+        try:
+            return max(0.0, time.time() - os.path.getmtime(self.path))
+        except OSError:
+            return None
+
+    def usable(self) -> bool:
+        """ Check if cache exists and is not too old """
+        age = self.age()
+        return age is not None and (self.max_age is None or age <= self.max_age)
+
+    def load(self) -> Union[tuple, None]:
+        """
+        Load cached resources
+        :return: resources list and validators, None when cache is missing, invalid or too old
+        """
+        if not self.usable():
+            return None
+        try:
+            with open(self.path, encoding='utf-8') as cache_file:
+                content = json.load(cache_file)
+            if content.get('source') != self._source:
+                MODULE_LOGGER.debug('Ignore resources cache of other source')
+                return None
+            return content['resources'], content.get('validators', {})
+        except (OSError, ValueError, KeyError, AttributeError) as error:
+            MODULE_LOGGER.warning('Ignore invalid resources cache %s: %s', self.path, error)
+            return None
+
+    def save(self, resources: list, validators: dict) -> None:
+        """ Replace cache atomically """
+        folder = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(folder, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=folder, delete=False,
+                                             prefix='.lockable-cache-') as cache_file:
+                json.dump({'source': self._source, 'validators': validators,
+                           'resources': resources}, cache_file, default=json_default)
+                cache_file.flush()
+                os.fsync(cache_file.fileno())
+            os.replace(cache_file.name, self.path)
+        except OSError as error:
+            MODULE_LOGGER.warning('Could not write resources cache %s: %s', self.path, error)
+            try:
+                os.unlink(cache_file.name)
+            except (OSError, NameError):
+                pass
+
+    def touch(self) -> None:
+        """ Mark cached resources validated now """
+        try:
+            os.utime(self.path)
+        except OSError as error:
+            MODULE_LOGGER.debug('Could not touch resources cache: %s', error)
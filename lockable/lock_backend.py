@@ -0,0 +1,318 @@
+""" Resource lock backends """
+from abc import ABC, abstractmethod
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Iterable, Tuple, Union
+
+from pid import PidFile, PidFileError
+
+from lockable.process_helpers import pid_exists
+from lockable.watcher import RELEASE_EVENTS, IN_ATTRIB, IN_MODIFY
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on windows
+    fcntl = None
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+
+class LockHandle:  # pylint: disable=too-few-public-methods
+    """ Acquired resource lock """
+
+    def __init__(self, path: str, release: Callable[[], None]):
+        """
+        LockHandle constructor
+        :param path: lock file path
+        :param release: function which releases the lock
+        """
+        self.path = path
+        self._release = release
+
+    def release(self) -> None:
+        """ Release lock """
+        self._release()
+
+
+class LockBackend(ABC):
+    """ Abstract lock backend """
+
+    # watcher events emitted when lock is released
+    release_events = RELEASE_EVENTS
+    # locks are shared by all backend instances and processes using same lock folder
+    shared = True
+
+    def __init__(self, lock_folder: str):
+        """
+        LockBackend constructor
+        :param lock_folder: folder where locks are stored
+        """
+        self._lock_folder = lock_folder
+
+    @property
+    def lock_folder(self) -> str:
+        """ Get lock folder """
+        return self._lock_folder
+
+    @abstractmethod
+    def lock_file_name(self, resource_id) -> str:  # pragma: no cover
+        """ Name of lock file of resource in lock folder """
+
+    @abstractmethod
+    def acquire(self, resource_id) -> Union[LockHandle, None]:  # pragma: no cover
+        """
+        Try to lock resource without blocking
+        :param resource_id: resource id
+        :return: LockHandle or None when resource is locked by someone else
+        """
+
+    def acquire_any(self, resource_ids: Iterable) -> Union[Tuple[object, LockHandle], None]:
+        """
+        Try to lock first free resource
+        :param resource_ids: resource ids in preference order
+        :return: tuple of resource id and LockHandle, None if all resources are locked
+        """
+        for resource_id in resource_ids:
+            handle = self.acquire(resource_id)
+            if handle is not None:
+                return resource_id, handle
+        return None
+
+    def close(self) -> None:
+        """ Release backend resources, acquired locks are not released """
+
+
+class PidFileBackend(LockBackend):
+    """ Lock backend using pid files created with pid package """
+
+    def lock_file_name(self, resource_id) -> str:
+        return f"{resource_id}.pid"
+
+    def acquire(self, resource_id) -> Union[LockHandle, None]:
+        pid_file = self.lock_file_name(resource_id)
+        MODULE_LOGGER.debug('Trying lock using: %s', os.path.join(self._lock_folder, pid_file))
+        # signal handlers can be registered only from main thread
+        in_main_thread = threading.current_thread() is threading.main_thread()
+        _lockable = PidFile(pidname=pid_file, piddir=self._lock_folder,
+                            register_term_signal_handler='auto' if in_main_thread else False)
+        try:
+            _lockable.create()
+        except PidFileError:
+            return None
+        return LockHandle(_lockable.filename, _lockable.close)
+
+
+class FlockBackend(LockBackend):
+    """
+    Lock backend using flock(2) on lock files.
+    Kernel releases the lock when owner process dies. Lock file descriptors
+    are kept open between attempts so retrying a busy resource is a single
+    non-blocking flock call. Lock files are never removed.
+    """
+
+    # release touches lock file, failed attempts and acquisitions do not change attributes
+    release_events = IN_ATTRIB
+    MAX_CACHED_FDS = 1024
+
+    def __init__(self, lock_folder: str):
+        if fcntl is None:  # pragma: no cover
+            raise NotImplementedError('flock is not supported on this platform')
+        super().__init__(lock_folder)
+        self._fds = {}
+        self._fds_lock = threading.Lock()
+
+    def lock_file_name(self, resource_id) -> str:
+        return f"{resource_id}.lock"
+
+    def _open(self, resource_id) -> int:
+        with self._fds_lock:
+            fd = self._fds.pop(resource_id, None)
+        if fd is None:
+            path = os.path.join(self._lock_folder, self.lock_file_name(resource_id))
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        return fd
+
+    def _cache(self, resource_id, fd: int) -> None:
+        # concurrent attempts of threads open own descriptors, only one is kept per resource
+        with self._fds_lock:
+            if resource_id not in self._fds and len(self._fds) < self.MAX_CACHED_FDS:
+                self._fds[resource_id] = fd
+                return
+        os.close(fd)
+
+    def acquire(self, resource_id) -> Union[LockHandle, None]:
+        path = os.path.join(self._lock_folder, self.lock_file_name(resource_id))
+        fd = self._open(resource_id)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._cache(resource_id, fd)
+            return None
+        try:
+            if os.fstat(fd).st_ino != os.stat(path).st_ino:
+                raise FileNotFoundError(path)
+        except FileNotFoundError:
+            # lock file was replaced while descriptor was cached, retry with fresh one
+            os.close(fd)
+            return self.acquire(resource_id)
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, f"{os.getpid()}\n".encode(), 0)
+
+        def release():
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            self._cache(resource_id, fd)
+            # notify waiters
+            os.utime(path)
+        return LockHandle(path, release)
+
+    def close(self) -> None:
+        with self._fds_lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds.clear()
+
+
+class SqliteBackend(LockBackend):
+    """
+    Lock backend storing locks in SQLite database in lock folder.
+    Database runs in WAL mode and first free resource of candidates is
+    picked in single transaction. Locks of dead processes are reclaimed
+    in bulk when all candidates seem to be locked.
+    """
+
+    DATABASE = 'lockable.sqlite'
+    # every committed change is appended to write-ahead log
+    release_events = IN_MODIFY
+
+    def __init__(self, lock_folder: str):
+        super().__init__(lock_folder)
+        self.path = os.path.join(lock_folder, SqliteBackend.DATABASE)
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS locks ('
+                               'resource_id TEXT PRIMARY KEY, '
+                               'pid INTEGER NOT NULL, '
+                               'token TEXT NOT NULL, '
+                               'created REAL NOT NULL)')
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Connection of current thread """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # transactions are controlled explicitly
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def lock_file_name(self, resource_id) -> str:
+        return f'{SqliteBackend.DATABASE}-wal'
+
+    @staticmethod
+    def _reclaim(connection: sqlite3.Connection, pids: set) -> int:
+        """ Remove locks of dead processes, returns number of removed locks """
+        dead = [(pid,) for pid in pids if not pid_exists(pid)]
+        if not dead:
+            return 0
+        MODULE_LOGGER.info('Reclaim locks of dead processes: %s', [pid for pid, in dead])
+        before = connection.total_changes
+        connection.executemany('DELETE FROM locks WHERE pid = ?', dead)
+        return connection.total_changes - before
+
+    def acquire(self, resource_id) -> Union[LockHandle, None]:
+        result = self.acquire_any([resource_id])
+        return result[1] if result else None
+
+    def acquire_any(self, resource_ids: Iterable) -> Union[Tuple[object, LockHandle], None]:
+        resource_ids = list(resource_ids)
+        if not resource_ids:
+            return None
+        connection = self._connection()
+        token = uuid.uuid4().hex
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            locked = dict(connection.execute('SELECT resource_id, pid FROM locks'))
+            free = [resource_id for resource_id in resource_ids
+                    if str(resource_id) not in locked]
+            if not free and self._reclaim(connection, {locked[str(resource_id)]
+                                                       for resource_id in resource_ids}):
+                locked = dict(connection.execute('SELECT resource_id, pid FROM locks'))
+                free = [resource_id for resource_id in resource_ids
+                        if str(resource_id) not in locked]
+            if free:
+                connection.execute('INSERT INTO locks VALUES (?, ?, ?, ?)',
+                                   (str(free[0]), os.getpid(), token, time.time()))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        if not free:
+            return None
+        key = str(free[0])
+
+        def release():
+            self._connection().execute('DELETE FROM locks WHERE resource_id = ? AND token = ?',
+                                       (key, token))
+        return free[0], LockHandle(self.path, release)
+
+    def close(self) -> None:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class MemoryBackend(LockBackend):
+    """
+    Process local locks without any file I/O.
+    Suitable only when single process arbitrates all allocations, like lock broker.
+    """
+
+    release_events = 0
+    shared = False
+
+    def __init__(self, lock_folder: str):
+        super().__init__(lock_folder)
+        self._locked = set()
+        self._lock = threading.Lock()
+
+    def lock_file_name(self, resource_id) -> str:
+        return str(resource_id)
+
+    def acquire(self, resource_id) -> Union[LockHandle, None]:
+        with self._lock:
+            if resource_id in self._locked:
+                return None
+            self._locked.add(resource_id)
+
+        def release():
+            with self._lock:
+                self._locked.discard(resource_id)
+        return LockHandle(f'memory:{resource_id}', release)
+
+
+BACKENDS = {
+    'pid': PidFileBackend,
+    'flock': FlockBackend,
+    'sqlite': SqliteBackend,
+    'memory': MemoryBackend,
+}
+
+
+def create(backend: Union[str, LockBackend, None], lock_folder: str) -> LockBackend:
+    """
+    Create lock backend
+    :param backend: backend name, LockBackend instance or None for default pid backend
+    :param lock_folder: lock folder
+    :return: LockBackend object
+    """
+    if isinstance(backend, LockBackend):
+        return backend
+    backend = backend or 'pid'
+    assert backend in BACKENDS, f'unknown lock backend: {backend}'
+    return BACKENDS[backend](lock_folder)
@@ -1,20 +1,25 @@
 """ lockable library """
-from contextlib import contextmanager
+from contextlib import contextmanager, ExitStack, nullcontext
 from datetime import datetime
 import json
 import logging
-import os
 import random
 import socket
-import time
 import tempfile
-
-from mongoquery import Query, QueryError
-from pid import PidFile, PidFileError
+import threading
+import time
 
 from lockable.allocation import Allocation
+from lockable.broker_client import BrokerClient, BrokerError
+from lockable.compact import json_default
+from lockable.fair_queue import FairQueue
+from lockable.lock_backend import LockBackend, LockHandle, create as create_lock_backend
+from lockable.matching import hopcroft_karp
 from lockable.provider_helpers import create as create_provider
+from lockable.query_cache import QueryCache
+from lockable.retry_policy import RetryPolicy, DEFAULT_RETRY_POLICY
 from lockable.unflatten import unflatten
+from lockable.watcher import create_watcher
 
 MODULE_LOGGER = logging.getLogger(__name__)
 DEFAULT_TIMEOUT = 1000
@@ -30,27 +35,64 @@ class ResourceNotFound(Exception):
             raise ResourceNotFound(message)
 
 
-class Lockable:
+class Lockable:  # pylint: disable=too-many-instance-attributes
     """
     Base class for Lockable. It handle low-level functionality.
     """
 
-    def __init__(self,
+    def __init__(self,  # pylint: disable=too-many-arguments
                  hostname=socket.gethostname(),
                  resource_list_file=None,
                  resource_list=None,
-                 lock_folder=tempfile.gettempdir()):
+                 lock_folder=tempfile.gettempdir(),
+                 *,
+                 provider_options: dict = None,
+                 fair_queue: bool = False,
+                 lock_backend: (str or LockBackend) = None,
+                 broker: str = None,
+                 columnar: bool = False,
+                 thread_safe: bool = False):
         self._allocations = {}
+        # resources which some thread of this instance is trying to lock
+        self._reserved = set()
+        self._thread_safe = thread_safe
+        self._state_lock = threading.Lock() if thread_safe else nullcontext()
+        self._query_lock = threading.Lock() if thread_safe else nullcontext()
+        self._reload_lock = threading.Lock() if thread_safe else None
+        self._query_cache = QueryCache(columnar=columnar)
         MODULE_LOGGER.debug('Initialized lockable')
         self._hostname = hostname
         self._lock_folder = lock_folder
+        self._fair_queue = FairQueue(lock_folder) if fair_queue else None
+        self._lock_backend = create_lock_backend(lock_backend, lock_folder)
+        self._broker = BrokerClient(broker) if broker else None
         assert not (isinstance(resource_list, list) and
                     resource_list_file), 'only one of resource_list or ' \
                                          'resource_list_file is accepted, not both'
+        provider_options = provider_options or {}
         if resource_list is None and resource_list_file is None:
-            self._provider = create_provider([])
+            self._provider = create_provider([], **provider_options)
         else:
-            self._provider = create_provider(resource_list_file or resource_list)
+            self._provider = create_provider(resource_list_file or resource_list,
+                                             **provider_options)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Stop background threads and release connections and file descriptors
+        of resources provider, lock backend and broker client.
+        Held allocations are not released.
+        """
+        MODULE_LOGGER.debug('Close lockable')
+        self._provider.close()
+        self._lock_backend.close()
+        if self._broker:
+            self._broker.close()
 
     @property
     def resource_list(self) -> list:
@@ -93,114 +135,314 @@ class Lockable:
                 raise ValueError(str(error)) from error
         return Lockable.parse_str_requirements(requirements_str)
 
-    @staticmethod
-    def _filter_resources(resources, requirement):
-        """Filter resources using mongoquery."""
-        try:
-            query = Query(requirement)
-        except QueryError as error:
-            raise ValueError(str(error)) from error
-        return list(filter(query.match, resources))
+    def _filter_resources(self, requirement):
+        """Filter provider resources using cached mongoquery predicates."""
+        snapshot = self._provider.snapshot
+        with self._query_lock:
+            return self._query_cache.filter(snapshot.resources, requirement,
+                                            snapshot.version, snapshot.index)
+
+    def _reload(self, deadline: float) -> None:
+        """ Reload provider, in thread safe mode only one thread reloads at a time """
+        if self._reload_lock is None:
+            self._provider.reload(deadline=deadline)
+        elif self._reload_lock.acquire(blocking=False):  # pylint: disable=consider-using-with
+            try:
+                self._provider.reload(deadline=deadline)
+            finally:
+                self._reload_lock.release()
+        else:
+            # other threads use current resources while one thread reloads
+            MODULE_LOGGER.debug('Resources are being reloaded by other thread')
 
-    def _try_lock(self, requirements, candidate):
-        """ Function that tries to lock given candidate resource """
+    def _allocation(self, requirements, candidate, handle: LockHandle) -> Allocation:
+        """ Create allocation of locked candidate resource """
         resource_id = candidate.get("id")
-        try:
-            pid_file = f"{resource_id}.pid"
-            MODULE_LOGGER.debug('Trying lock using: %s', os.path.join(self._lock_folder, pid_file))
+        MODULE_LOGGER.info('Allocated: %s, lockfile: %s', resource_id, handle.path)
 
-            _lockable = PidFile(pidname=pid_file, piddir=self._lock_folder)
-            _lockable.create()
-            MODULE_LOGGER.info('Allocated: %s, lockfile: %s', resource_id, pid_file)
-
-            def release():
-                nonlocal self, resource_id, _lockable
-                MODULE_LOGGER.info('Release resource: %s', resource_id)
-                _lockable.close()
+        def release():
+            nonlocal self, resource_id, handle
+            MODULE_LOGGER.info('Release resource: %s', resource_id)
+            # forget allocation first so that thread woken by release can reserve resource
+            with self._state_lock:
                 del self._allocations[resource_id]
+            handle.release()
+
+        allocation = Allocation(requirements=requirements,
+                                resource_info=candidate,
+                                _release=release,
+                                pid_file=handle.path)
+        with self._state_lock:
+            self._allocations[resource_id] = allocation
+            self._reserved.discard(resource_id)
+        return allocation
 
-            return Allocation(requirements=requirements,
-                              resource_info=candidate,
-                              _release=release,
-                              pid_file=_lockable.filename)
-        except PidFileError as error:
-            raise AssertionError('no success') from error
+    def _reserve(self, resource_id) -> bool:
+        """ Reserve resource for current thread before trying to lock it """
+        with self._state_lock:
+            if resource_id in self._allocations or resource_id in self._reserved:
+                return False
+            self._reserved.add(resource_id)
+            return True
 
-    def _lock_some(self, requirements, candidates, timeout_s, retry_interval):
-        """ Contextmanager that lock some candidate that is free and release it finally """
-        MODULE_LOGGER.debug('Total match local resources: %d, timeout: %d',
-                            len(candidates), timeout_s)
-        if not isinstance(requirements, list):
-            requirements = [requirements]
-        abort_after = timeout_s
-        start = time.time()
-
-        current_allocations = []
-        fulfilled_requirement_indexes = []
+    def _try_lock(self, requirements, candidate):
+        """ Function that tries to lock given candidate resource """
+        resource_id = candidate.get("id")
+        if not self._reserve(resource_id):
+            raise AssertionError('no success')
+        handle = None
+        try:
+            handle = self._lock_backend.acquire(resource_id)
+        finally:
+            if handle is None:
+                with self._state_lock:
+                    self._reserved.discard(resource_id)
+        if handle is None:
+            raise AssertionError('no success')
+        return self._allocation(requirements, candidate, handle)
+
+    def _try_lock_any(self, requirements, candidates) -> (Allocation or None):
+        """ Try to lock first free candidate resource, None if all are busy """
+        if self._thread_safe:
+            # threads reserve candidates one by one so they do not try same resources
+            for candidate in candidates:
+                try:
+                    return self._try_lock(requirements, candidate)
+                except AssertionError:
+                    continue
+            return None
+        resources_by_id = {resource['id']: resource for resource in candidates}
+        result = self._lock_backend.acquire_any(resources_by_id)
+        if result is None:
+            return None
+        resource_id, handle = result
+        return self._allocation(requirements, resources_by_id[resource_id], handle)
+
+    def _lock_file_names(self, resource_ids) -> set:
+        """ Lock file names of resources in lock folder """
+        return {self._lock_backend.lock_file_name(resource_id) for resource_id in resource_ids}
+
+    def _candidate_graph(self, candidates, pool: dict, busy: set) -> dict:
+        """ Requirement index to ids of candidates which can be locked """
+        graph = {}
+        for index, resources in enumerate(candidates):
+            # Skip resources that are already allocated by same lockable instance
+            # unless they are held for this same allocation.
+            graph[index] = [resource['id'] for resource in resources
+                            if resource['id'] not in busy and
+                            (resource['id'] not in self._allocations or resource['id'] in pool)]
+        return graph
+
+    def _lock_round(self, requirements, candidates, allocations: dict) -> set:
+        """
+        Lock maximum assignment of requirements to free candidates
+        :param requirements: list of requirements
+        :param candidates: list of candidate resources per requirement
+        :param allocations: requirement index to Allocation, updated in place
+        :return: lock file names of busy candidates
+        """
+        resources_by_id = {resource['id']: resource
+                           for resources in candidates for resource in resources}
+        if len(requirements) == 1 and not allocations:
+            # single requirement, let backend pick first free candidate at once
+            free = self._candidate_graph(candidates, {}, set())[0]
+            allocation = self._try_lock_any(requirements[0],
+                                            [resources_by_id[resource_id] for resource_id in free])
+            if allocation is None:
+                return self._lock_file_names(free)
+            MODULE_LOGGER.debug('resource %s allocated (%s), alloc_id: (%s)',
+                                allocation.resource_id,
+                                json.dumps(allocation.resource_info, default=json_default),
+                                allocation.alloc_id)
+            allocations[0] = allocation
+            return set()
+        pool = {allocation.resource_id: allocation for allocation in allocations.values()}
+        assignment = {index: allocation.resource_id for index, allocation in allocations.items()}
+        busy = set()
         while True:
-            for index, req in enumerate(requirements):
-                if index in fulfilled_requirement_indexes:
+            graph = self._candidate_graph(candidates, pool, busy)
+            assignment = hopcroft_karp(graph, assignment)
+            failed = False
+            for index, resource_id in assignment.items():
+                if resource_id in pool:
                     continue
-                for candidate in candidates:
-                    # Skip resources that are already allocated by same lockable instance.
-                    if candidate.get('id') in self._allocations:
-                        continue
-
-                    try:
-                        allocation = self._try_lock(req, candidate)
-                        MODULE_LOGGER.debug('resource %s allocated (%s), alloc_id: (%s)',
-                                            allocation.resource_id,
-                                            json.dumps(allocation.resource_info),
-                                            allocation.alloc_id)
-                        self._allocations[allocation.resource_id] = allocation
-                        current_allocations.append(allocation)
-                        fulfilled_requirement_indexes.append(index)
-                        break
-                    except AssertionError:
-                        pass
-
-            # All resources allocated
-            if len(requirements) == len(current_allocations):
+                try:
+                    allocation = self._try_lock(requirements[index], resources_by_id[resource_id])
+                except AssertionError:
+                    busy.add(resource_id)
+                    failed = True
+                    continue
+                MODULE_LOGGER.debug('resource %s allocated (%s), alloc_id: (%s)',
+                                    allocation.resource_id,
+                                    json.dumps(allocation.resource_info, default=json_default),
+                                    allocation.alloc_id)
+                pool[resource_id] = allocation
+            if not failed:
                 break
 
-            # Check if timeout occurs. No need to be high resolution timeout.
-            # in first loop we should first check before giving up.
-            delta = time.time() - start
-            if delta >= abort_after:
-                # Unlock all already done allocations
-                # pylint: disable=expression-not-assigned
-                [allocation.unlock() for allocation in current_allocations]
-                MODULE_LOGGER.warning('Allocation timeout')
-                raise TimeoutError(f'Allocation timeout ({timeout_s}s)')
+        allocations.clear()
+        for index, resource_id in assignment.items():
+            allocation = pool.pop(resource_id)
+            allocation.requirements = requirements[index]
+            allocations[index] = allocation
+        # release resources which were re-assigned away while computing assignment
+        for allocation in pool.values():
+            allocation.unlock()
+        return self._lock_file_names(busy)
 
-            MODULE_LOGGER.debug('trying to lock after short period')
-            time.sleep(retry_interval)
+    @staticmethod
+    def _resource_order(resource_id) -> tuple:
+        """ Globally consistent locking order of resources """
+        return str(resource_id), type(resource_id).__name__
 
-        return current_allocations
+    def _lock_round_atomic(self, requirements, candidates, allocations: dict) -> set:
+        """
+        Lock all requirements or nothing. Resources are acquired in global
+        resource id order and already acquired ones are released immediately
+        when some resource is busy, so nothing is held while waiting.
+        :param requirements: list of requirements
+        :param candidates: list of candidate resources per requirement
+        :param allocations: requirement index to Allocation, updated in place
+        :return: lock file names of busy candidates
+        """
+        resources_by_id = {resource['id']: resource
+                           for resources in candidates for resource in resources}
+        busy = set()
+        while True:
+            assignment = hopcroft_karp(self._candidate_graph(candidates, {}, busy))
+            if len(assignment) < len(requirements):
+                return self._lock_file_names(busy)
+            acquired = {}
+            for index, resource_id in sorted(assignment.items(),
+                                             key=lambda item: self._resource_order(item[1])):
+                try:
+                    allocation = self._try_lock(requirements[index], resources_by_id[resource_id])
+                except AssertionError:
+                    busy.add(resource_id)
+                    break
+                acquired[index] = allocation
+            if len(acquired) == len(requirements):
+                MODULE_LOGGER.debug('resources %s allocated atomically',
+                                    [allocation.resource_id for allocation in acquired.values()])
+                allocations.update(acquired)
+                return set()
+            MODULE_LOGGER.debug('rollback partial allocation: %s',
+                                [allocation.resource_id for allocation in acquired.values()])
+            for allocation in acquired.values():
+                allocation.unlock()
+
+    def _lock_some(self,  # pylint: disable=too-many-arguments,too-many-locals
+                   requirements, candidates, timeout_s, retry_policy, atomic=False):
+        """
+        Lock free candidates for all requirements
+        :param requirements: list of requirements
+        :param candidates: list of candidate resources per requirement
+        :param timeout_s: max duration to try to lock
+        :param retry_policy: delays between allocation attempts
+        :param atomic: do not hold partial allocations while waiting
+        :return: list of allocations in requirements order
+        """
+        MODULE_LOGGER.debug('Total match local resources: %d, timeout: %d',
+                            len({resource['id'] for resources in candidates
+                                 for resource in resources}), timeout_s)
+        schedule = retry_policy.schedule(timeout_s)
+        lock_round = self._lock_round_atomic if atomic else self._lock_round
+        # busy candidates exclude resources held by this instance, which other threads release
+        candidate_lock_files = self._lock_file_names(
+            resource['id'] for resources in candidates for resource in resources) \
+            if self._thread_safe else None
+
+        allocations = {}
+        with ExitStack() as stack:
+            watcher = stack.enter_context(create_watcher(self._lock_folder,
+                                                              self._lock_backend.release_events))
+            ticket = stack.enter_context(self._fair_queue.enqueue(requirements)) \
+                if self._fair_queue else None
+            while True:
+                # In fair queue mode only first waiter of requirements class tries to lock
+                ahead = ticket.ahead() if ticket else None
+                if ahead is None:
+                    busy_lock_files = lock_round(requirements, candidates, allocations)
+                    # All resources allocated
+                    if len(requirements) == len(allocations):
+                        break
 
-    def _lock(self, requirements, timeout_s, retry_interval=1) -> Allocation:
+                # Check if timeout occurs.
+                # in first loop we should first check before giving up.
+                if schedule.expired():
+                    # Unlock all already done allocations
+                    for allocation in allocations.values():
+                        allocation.unlock()
+                    MODULE_LOGGER.warning('Allocation timeout')
+                    raise TimeoutError(f'Allocation timeout ({timeout_s}s)')
+
+                # Wake up as soon as some busy candidate is released or waiter
+                # ahead leaves the queue, but never sleep beyond the timeout
+                if ahead is None:
+                    MODULE_LOGGER.debug('waiting for busy resources release')
+                    watcher.wait(candidate_lock_files or busy_lock_files,
+                                 schedule.next_delay())
+                else:
+                    MODULE_LOGGER.debug('waiting for turn after %s', ahead)
+                    ticket.wait(ahead, schedule.next_delay())
+
+        return [allocations[index] for index in range(len(requirements))]
+
+    def _lock(self, requirements, timeout_s, retry_policy=DEFAULT_RETRY_POLICY) -> Allocation:
         """ Lock resource """
-        local_resources = self._filter_resources(self.resource_list, requirements)
+        local_resources = self._filter_resources(requirements)
         random.shuffle(local_resources)
         ResourceNotFound.invariant(local_resources,
                                    f"Suitable resource not available, {requirements=}")
-        return self._lock_some(requirements, local_resources, timeout_s, retry_interval)[0]
+        return self._lock_some([requirements], [local_resources], timeout_s, retry_policy)[0]
 
-    def _lock_many(self, requirements, timeout_s, retry_interval=1) -> [Allocation]:
-        """ Lock resource """
-        local_resources = []
+    def _candidates(self, requirements) -> list:
+        """ Candidate resources per requirement, in random order """
+        candidates = []
         for req in requirements:
-            resources = self._filter_resources(self.resource_list, req)
+            resources = self._filter_resources(req)
             ResourceNotFound.invariant(resources,
                                        f"Suitable resource not available, {requirements=}")
-            local_resources += resources
-        # Unique resources by id
-        local_resources = list({v['id']: v for v in local_resources}.values())
+            random.shuffle(resources)
+            candidates.append(resources)
+        graph = {index: [resource['id'] for resource in resources]
+                 for index, resources in enumerate(candidates)}
         ResourceNotFound.invariant(
-            len(local_resources) >= len(requirements),
+            len(hopcroft_karp(graph)) == len(requirements),
             f"Suitable resource not available, {requirements=}")
-        random.shuffle(local_resources)
-        return self._lock_some(requirements, local_resources, timeout_s, retry_interval)
+        return candidates
+
+    def _try_lock_many(self, requirements, candidates, atomic=False) -> ([Allocation] or None):
+        """ Single all-or-nothing allocation attempt, None when some resource is busy """
+        allocations = {}
+        lock_round = self._lock_round_atomic if atomic else self._lock_round
+        lock_round(requirements, candidates, allocations)
+        if len(allocations) < len(requirements):
+            for allocation in allocations.values():
+                allocation.unlock()
+            return None
+        return [allocations[index] for index in range(len(requirements))]
+
+    def _lock_many(self, requirements, timeout_s,
+                   retry_policy=DEFAULT_RETRY_POLICY, atomic=False) -> [Allocation]:
+        """ Lock resources, each requirement gets a distinct resource """
+        candidates = self._candidates(requirements)
+        return self._lock_some(requirements, candidates, timeout_s, retry_policy, atomic)
+
+    def _lock_from_broker(self, requirements, timeout_s, atomic=False) -> [Allocation]:
+        """ Lock resources from lock broker """
+        try:
+            leases = self._broker.lock(requirements, timeout_s, atomic)
+        except BrokerError as error:
+            ResourceNotFound.invariant(error.kind != 'ResourceNotFound', str(error))
+            if error.kind == 'TimeoutError':
+                raise TimeoutError(str(error)) from error
+            raise
+        allocations = []
+        for requirement, (resource, release) in zip(requirements, leases):
+            allocations.append(self._allocation(requirement, resource,
+                                                LockHandle(self._broker.socket_path, release)))
+        return allocations
 
     @staticmethod
     def _get_requirements(requirements, hostname):
@@ -215,44 +457,67 @@ class Lockable:
                 del merged[key]
         return merged
 
-    def lock(self, requirements: (str or dict), timeout_s: int = DEFAULT_TIMEOUT) -> Allocation:
+    def lock(self, requirements: (str or dict), timeout_s: int = DEFAULT_TIMEOUT,
+             retry_policy: RetryPolicy = None) -> Allocation:
         """
         Lock resource
         :param requirements: resource requirements
         :param timeout_s: timeout while trying to lock
+        :param retry_policy: delays between allocation attempts, default 1s interval
         :return: Allocation context
         """
         assert isinstance(self.resource_list, list), 'resources list is not loaded'
         requirements = self.parse_requirements(requirements)
         predicate = self._get_requirements(requirements, self._hostname)
-        # Refresh resources data
-        self._provider.reload()
+        if self._broker:
+            begin = datetime.now()
+            MODULE_LOGGER.debug("Use lock broker: %s", self._broker.socket_path)
+            allocation = self._lock_from_broker([predicate], timeout_s)[0]
+            allocation.allocation_queue_time = datetime.now() - begin
+            return allocation
+        # Refresh resources data within same time budget as allocation
+        deadline = time.monotonic() + timeout_s
+        self._reload(deadline)
         begin = datetime.now()
         MODULE_LOGGER.debug("Use lock folder: %s", self._lock_folder)
-        MODULE_LOGGER.debug("Requirements: %s", json.dumps(predicate))
-        MODULE_LOGGER.debug("Resource list: %s", json.dumps(self.resource_list))
-        allocation = self._lock(predicate, timeout_s)
+        if MODULE_LOGGER.isEnabledFor(logging.DEBUG):
+            MODULE_LOGGER.debug("Requirements: %s", json.dumps(predicate))
+            MODULE_LOGGER.debug("Resource list: %s",
+                                json.dumps(self.resource_list, default=json_default))
+        allocation = self._lock(predicate, max(0.0, deadline - time.monotonic()),
+                                retry_policy or DEFAULT_RETRY_POLICY)
         allocation.allocation_queue_time = datetime.now() - begin
         return allocation
 
-    def lock_many(self, requirements: list, timeout_s: int = DEFAULT_TIMEOUT) -> list:
+    def lock_many(self, requirements: list, timeout_s: int = DEFAULT_TIMEOUT,
+                  retry_policy: RetryPolicy = None, atomic: bool = False) -> list:
         """
         Lock many resources
         :param requirements: resource requirements, list of string or dicts
         :param timeout_s: max duration to try to lock
+        :param retry_policy: delays between allocation attempts, default 1s interval
+        :param atomic: all-or-nothing allocation, partial allocations are not held while waiting
         :return: List of allocation contexts
         """
         assert isinstance(self.resource_list, list), "resources list is not loaded"
         predicates = []
         for req in requirements:
             predicates.append(self._get_requirements(self.parse_requirements(req), self._hostname))
-        self._provider.reload()
-        begin = datetime.now()
-        MODULE_LOGGER.debug("Use lock folder: %s", self._lock_folder)
-        MODULE_LOGGER.debug("Requirements: %s", json.dumps(predicates))
-        MODULE_LOGGER.debug("Resource list: %s", json.dumps(self.resource_list))
-
-        allocations = self._lock_many(predicates, timeout_s)
+        if self._broker:
+            begin = datetime.now()
+            MODULE_LOGGER.debug("Use lock broker: %s", self._broker.socket_path)
+            allocations = self._lock_from_broker(predicates, timeout_s, atomic)
+        else:
+            deadline = time.monotonic() + timeout_s
+            self._reload(deadline)
+            begin = datetime.now()
+            MODULE_LOGGER.debug("Use lock folder: %s", self._lock_folder)
+            if MODULE_LOGGER.isEnabledFor(logging.DEBUG):
+                MODULE_LOGGER.debug("Requirements: %s", json.dumps(predicates))
+                MODULE_LOGGER.debug("Resource list: %s",
+                                    json.dumps(self.resource_list, default=json_default))
+            allocations = self._lock_many(predicates, max(0.0, deadline - time.monotonic()),
+                                          retry_policy or DEFAULT_RETRY_POLICY, atomic)
         for allocation in allocations:
             allocation.allocation_queue_time = datetime.now() - begin
         return allocations
@@ -266,21 +531,24 @@ class Lockable:
         assert 'id' in allocation.resource_info, 'missing "id" -key'
         MODULE_LOGGER.info('Release: %s', allocation.resource_id)
         resource_id = allocation.resource_id
-        ResourceNotFound.invariant(resource_id in self._allocations, 'resource not locked')
-        reservation = self._allocations[resource_id]
+        reservation = self._allocations.get(resource_id)
+        ResourceNotFound.invariant(reservation is not None, 'resource not locked')
         reservation.release(allocation.alloc_id)
 
     @contextmanager
     def auto_lock(self,
                   requirements: (str or dict),
-                  timeout_s: int = DEFAULT_TIMEOUT) -> Allocation:
+                  timeout_s: int = DEFAULT_TIMEOUT,
+                  retry_policy: RetryPolicy = None) -> Allocation:
         """
         contextmanaged lock method. Resource is released automatically after context ends.
         :param requirements: requirements
         :param timeout_s: timeout while trying to lock suitable resource
+        :param retry_policy: delays between allocation attempts, default 1s interval
         :return: return Allocation object
         """
-        allocator = self.lock(requirements=requirements, timeout_s=timeout_s)
+        allocator = self.lock(requirements=requirements, timeout_s=timeout_s,
+                              retry_policy=retry_policy)
         try:
             yield allocator
         finally:
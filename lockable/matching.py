@@ -0,0 +1,62 @@
+""" Maximum bipartite matching between requirements and resources """
+from collections import deque
+from typing import Dict, Hashable, List
+
+INFINITY = float('inf')
+
+
+def hopcroft_karp(graph: Dict[Hashable, List[Hashable]],
+                  initial: Dict[Hashable, Hashable] = None) -> Dict[Hashable, Hashable]:
+    """
+    Compute maximum bipartite matching using Hopcroft-Karp algorithm.
+    Left vertices matched in initial matching stay matched, but may get
+    another right vertex when that is needed to grow the matching.
+    :param graph: left vertex to list of adjacent right vertices, in preference order
+    :param initial: initial matching from left vertex to right vertex
+    :return: matching from left vertex to right vertex
+    """
+    match_left = {}
+    match_right = {}
+    for left, right in (initial or {}).items():
+        if right in graph.get(left, ()) and right not in match_right:
+            match_left[left] = right
+            match_right[right] = left
+
+    def bfs(dist: dict) -> bool:
+        """ Build layers from free left vertices, True if augmenting path exists """
+        queue = deque()
+        for left in graph:
+            if left in match_left:
+                dist[left] = INFINITY
+            else:
+                dist[left] = 0
+                queue.append(left)
+        found = False
+        while queue:
+            left = queue.popleft()
+            for right in graph[left]:
+                other = match_right.get(right)
+                if other is None:
+                    found = True
+                elif dist[other] == INFINITY:
+                    dist[other] = dist[left] + 1
+                    queue.append(other)
+        return found
+
+    def dfs(left, dist: dict) -> bool:
+        """ Find augmenting path along layers and flip it """
+        for right in graph[left]:
+            other = match_right.get(right)
+            if other is None or (dist[other] == dist[left] + 1 and dfs(other, dist)):
+                match_left[left] = right
+                match_right[right] = left
+                return True
+        dist[left] = INFINITY
+        return False
+
+    dist = {}
+    while bfs(dist):
+        for left in graph:
+            if left not in match_left:
+                dfs(left, dist)
+    return match_left
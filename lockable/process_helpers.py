@@ -0,0 +1,20 @@
+""" Process helpers """
+import os
+import sys
+
+
+def pid_exists(pid: int) -> bool:
+    """ Check if process with given pid is running """
+    if pid <= 0:
+        return False
+    if sys.platform == 'win32':  # pragma: no cover
+        # os.kill would terminate the process on windows, pid package brings psutil
+        import psutil  # pylint: disable=import-outside-toplevel,import-error
+        return psutil.pid_exists(pid)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
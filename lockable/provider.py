@@ -2,10 +2,15 @@
 from abc import ABC, abstractmethod
 import json
 import logging
+import math
 import typing
-from typing import List
+from typing import Iterable, List, NamedTuple
 
 from collections import Counter
+from collections.abc import Mapping
+
+from lockable.compact import Compactor, json_default
+from lockable.resource_index import ResourceIndex
 
 MODULE_LOGGER = logging.getLogger(__name__)
 
@@ -14,31 +19,194 @@ class ProviderError(Exception):
     """ Provider error """
 
 
+class ProviderSnapshot(NamedTuple):
+    """ Consistent view of loaded resources data """
+    resources: list
+    version: int
+    index: ResourceIndex
+
+
 class Provider(ABC):
     """ Abstract Provider """
-    def __init__(self, uri: typing.Union[str, list]):
-        """ Provider constructor """
+    def __init__(self, uri: typing.Union[str, list], index_keys: typing.Iterable[str] = None,
+                 compact: bool = False):
+        """
+        Provider constructor
+        :param uri: resources source
+        :param index_keys: resource attributes to be indexed, None picks automatically
+        :param compact: store resources as read-only CompactResource mappings
+                        which share keys and values to save memory
+        """
         self._uri = uri
-        self._resources = []
+        self._index_keys = index_keys
+        self._compactor = Compactor() if compact else None
+        # replaced as a whole so that readers never see partially updated data
+        self._snapshot = ProviderSnapshot([], 0, ResourceIndex(keys=index_keys))
         self.reload()
 
+    @property
+    def snapshot(self) -> ProviderSnapshot:
+        """ Get resources list, its version and indexes at once """
+        return self._snapshot
+
     @property
     def data(self) -> list:
         """ Get resources list """
-        return self._resources
+        return self._snapshot.resources
+
+    @property
+    def data_version(self) -> int:
+        """ Get resources data version, changes whenever loaded data changes """
+        return self._snapshot.version
+
+    @property
+    def index(self) -> ResourceIndex:
+        """ Get secondary indexes of resources list """
+        return self._snapshot.index
 
     @abstractmethod
-    def reload(self) -> None:  # pragma: no cover
-        """ Reload resources data"""
+    def reload(self, deadline: float = None) -> None:  # pragma: no cover
+        """
+        Reload resources data
+        :param deadline: time.monotonic() time by which reload should be done, None for no limit
+        """
+
+    def close(self) -> None:
+        """ Release provider resources """
 
     def set_resources_list(self, resources_list: list):
-        """ Load resources list """
+        """
+        Load resources list. List is compared to loaded resources by id and
+        only added, changed and removed resources are logged and re-indexed.
+        """
         assert isinstance(resources_list, list), 'resources_list is not an list'
-        Provider._validate_json(resources_list)
-        self._resources = resources_list
-        MODULE_LOGGER.debug('Resources loaded: ')
-        for resource in self._resources:
-            MODULE_LOGGER.debug(json.dumps(resource))
+        if self._compactor:
+            resources_list = self._compactor.compact_list(resources_list)
+        snapshot = self._snapshot
+        diff = self._diff(snapshot.index, resources_list) if snapshot.resources else None
+        if diff is None:
+            Provider._validate_json(resources_list)
+            self._replace_resources(resources_list,
+                                    lambda: ResourceIndex(resources_list, keys=self._index_keys))
+            return
+        resources, upserts, removes = diff
+        if not (upserts or removes):
+            MODULE_LOGGER.debug('Resources not changed')
+            return
+        if len(upserts) + len(removes) > len(resources) // 2:
+            # rebuilding is cheaper than patching most of the index
+            index = ResourceIndex(resources, keys=self._index_keys)
+        else:
+            index = snapshot.index.updated(removes, upserts)
+        self._snapshot = ProviderSnapshot(resources, snapshot.version + 1, index)
+        MODULE_LOGGER.debug('Resources changed: %d upserts, %d removes',
+                            len(upserts), len(removes))
+        if MODULE_LOGGER.isEnabledFor(logging.DEBUG):
+            for resource in upserts:
+                MODULE_LOGGER.debug(json.dumps(resource, default=json_default))
+
+    @staticmethod
+    def _diff(index: ResourceIndex, resources_list: list) -> typing.Union[tuple, None]:
+        """
+        Compare resources list to indexed resources by id
+        :return: resources list where unchanged resources are the indexed ones, upserted
+                 resources and removed ids. None when order of resources has changed.
+        """
+        resources = []
+        upserts = []
+        seen = set()
+        last_ordinal = -1
+        for resource in resources_list:
+            resource_id = resource.get('id')
+            if resource_id is None or resource_id in seen:
+                # raises with details
+                Provider._validate_json(resources_list)
+            seen.add(resource_id)
+            found = index.lookup(resource_id)
+            if found is None:
+                # added resources are indexed last
+                last_ordinal = math.inf
+                resources.append(resource)
+                upserts.append(resource)
+                continue
+            ordinal, current = found
+            if ordinal < last_ordinal:
+                return None
+            last_ordinal = ordinal
+            if current == resource:
+                resources.append(current)
+            else:
+                resources.append(resource)
+                upserts.append(resource)
+        removes = [resource_id for resource_id in index.ids() if resource_id not in seen]
+        return resources, upserts, removes
+
+    def load_resources(self, resources: Iterable[dict]) -> None:
+        """
+        Load resources one by one, they are validated and indexed on the fly
+        so that resources can be streamed without intermediate copies
+        :param resources: resources iterable
+        """
+        resources_list = []
+        ids = set()
+        if self._compactor:
+            resources = self._compactor.compact(resources)
+
+        def validated():
+            for resource in resources:
+                if not isinstance(resource, Mapping):
+                    raise ValueError('Invalid json, resource is not an object')
+                resource_id = resource.get('id')
+                if resource_id is None:
+                    raise ValueError('Invalid json, id property is missing')
+                if resource_id in ids:
+                    MODULE_LOGGER.warning('Duplicates: %s', [resource_id])
+                    raise ValueError(f"Invalid json, duplicate ids in {[resource_id]}")
+                ids.add(resource_id)
+                resources_list.append(resource)
+                yield resource
+        index = ResourceIndex(validated(), keys=self._index_keys)
+        self._replace_resources(resources_list, lambda: index)
+
+    def _replace_resources(self, resources_list: list, index_factory) -> None:
+        """ Swap validated resources list, version is changed only if resources changed """
+        snapshot = self._snapshot
+        if resources_list != snapshot.resources:
+            self._snapshot = ProviderSnapshot(resources_list, snapshot.version + 1,
+                                              index_factory())
+        else:
+            self._snapshot = snapshot._replace(resources=resources_list)
+        MODULE_LOGGER.debug('Resources loaded: %d', len(resources_list))
+        if MODULE_LOGGER.isEnabledFor(logging.DEBUG):
+            for resource in resources_list:
+                MODULE_LOGGER.debug(json.dumps(resource, default=json_default))
+
+    def apply_changes(self, upserts: List[dict] = (), removes: list = ()) -> None:
+        """
+        Apply incremental changes to resources list and its indexes
+        :param upserts: resources to be replaced by id or added last
+        :param removes: ids of resources to be removed, applied before upserts
+        """
+        upserts = self._compactor.compact_list(upserts) if self._compactor else list(upserts)
+        Provider._validate_json(upserts)
+        removes = set(removes)
+        snapshot = self._snapshot
+        known = {resource.get('id') for resource in snapshot.resources}
+        changed_ids = {resource['id'] for resource in upserts}
+        if not (removes & known or changed_ids):
+            return
+        pending = {resource['id']: resource for resource in upserts}
+        resources_list = []
+        for resource in snapshot.resources:
+            resource_id = resource.get('id')
+            if resource_id in removes:
+                continue
+            resources_list.append(pending.pop(resource_id, resource))
+        resources_list.extend(pending.values())
+        self._snapshot = ProviderSnapshot(resources_list, snapshot.version + 1,
+                                          snapshot.index.updated(removes, upserts))
+        MODULE_LOGGER.debug('Resources changed: %d upserts, %d removes',
+                            len(upserts), len(removes & known))
 
     @staticmethod
     def _validate_json(data: List[dict]):
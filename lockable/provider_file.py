@@ -1,47 +1,258 @@
 """ resources Provider for file """
+import codecs
+import hashlib
 import json
 import logging
 import os
-from typing import List
+import threading
+from typing import BinaryIO, Iterator, List, TextIO
 
 from lockable.provider import Provider
+from lockable.snapshot_cache import SnapshotCache
+from lockable.watcher import create_watcher, IN_CLOSE_WRITE, IN_MOVED_TO, RELEASE_EVENTS
 
 MODULE_LOGGER = logging.getLogger(__name__)
 
+# file is completely written, replaced or removed
+CHANGE_EVENTS = IN_CLOSE_WRITE | IN_MOVED_TO | RELEASE_EVENTS
+CHUNK_SIZE = 64 * 1024
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_json_array(stream: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator:
+    """
+    Parse json array incrementally, only current chunk and item are kept in memory
+    :param stream: text stream containing json array
+    :param chunk_size: number of characters read at once
+    :return: iterator of array items
+    """
+    # object keys are shared between items like json.load does within single document
+    keys = {}
+    decoder = json.JSONDecoder(
+        object_pairs_hook=lambda pairs: {keys.setdefault(key, key): value for key, value in pairs})
+    buffer = ''
+    position = 0
+    eof = False
+
+    def peek():
+        """ Skip whitespace and return next character, empty string at end of stream """
+        nonlocal buffer, position, eof
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position < len(buffer) or eof:
+                return buffer[position:position + 1]
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+
+    def expect(characters: str) -> str:
+        character = peek()
+        if not character or character not in characters:
+            raise json.JSONDecodeError(f'Expecting one of {characters!r}', buffer, position)
+        return character
+
+    expect('[')
+    position += 1
+    if peek() == ']':
+        position += 1
+    else:
+        while True:
+            peek()
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    item, end = None, len(buffer)
+                # item may be incomplete when it reaches end of buffer
+                if end < len(buffer) or eof:
+                    break
+                chunk = stream.read(chunk_size)
+                eof = not chunk
+                buffer, position = buffer[position:] + chunk, 0
+            position = end
+            yield item
+            if expect(',]') == ']':
+                position += 1
+                break
+            position += 1
+    if peek():
+        raise json.JSONDecodeError('Extra data', buffer, position)
+
+
+class _HashingReader:  # pylint: disable=too-few-public-methods
+    """ utf-8 text reader of binary stream which hashes bytes it reads """
+
+    def __init__(self, stream: BinaryIO):
+        self._stream = stream
+        self._hash = hashlib.sha256()
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def read(self, size: int) -> str:
+        """ Read at most size bytes decoded, empty string at end of stream """
+        while True:
+            chunk = self._stream.read(size)
+            self._hash.update(chunk)
+            text = self._decoder.decode(chunk, final=not chunk)
+            # chunk may end in middle of multi-byte character
+            if text or not chunk:
+                return text
+
+    def digest(self) -> bytes:
+        """ sha256 digest of bytes read so far """
+        return self._hash.digest()
+
 
 class ProviderFile(Provider):
     """ ProviderFile interface """
 
-    def __init__(self, uri: str):
+    WATCH_TIMEOUT = 1
+
+    def __init__(self, uri: str, watch: bool = False, streaming: bool = False,
+                 snapshot_folder: str = None, **kwargs):
         """
         ProviderFile constructor
         :param uri: file path
+        :param watch: watch file changes in background thread, reload() does not touch
+                      file system while file is not changed
+        :param streaming: parse and index resources incrementally without reading
+                          whole file in memory, suits very large files
+        :param snapshot_folder: store parsed resources and their indexes in binary
+                                snapshot in this folder, later providers of same
+                                unchanged file load the snapshot instead of parsing
+        :param kwargs: Provider options
         """
         MODULE_LOGGER.debug('Creating ProviderFile using %s', uri)
+        self._streaming = streaming
+        if snapshot_folder and kwargs.get('compact'):
+            MODULE_LOGGER.warning('Snapshot is not supported with compact resources')
+            snapshot_folder = None
+        self._snapshot_cache = SnapshotCache(snapshot_folder, uri) if snapshot_folder else None
         self._resource_list_file_mtime = None
-        super().__init__(uri)
+        self._digest = None
+        self._changed = threading.Event()
+        self._changed.set()
+        self._stop = threading.Event()
+        self._watcher = None
+        self._thread = None
+        if watch:
+            self._watcher = create_watcher(os.path.dirname(os.path.abspath(uri)), CHANGE_EVENTS)
+            # remember initial state before file is read
+            self._watcher.wait([os.path.basename(uri)], 0)
+            self._thread = threading.Thread(target=self._watch_loop, args=(uri,),
+                                            daemon=True, name='lockable-watch')
+            self._thread.start()
+        super().__init__(uri, **kwargs)
 
-    def reload(self):
+    def reload(self, deadline: float = None):
         """ Load resources list file"""
+        if self._watcher and not self._changed.is_set():
+            return
         self.reload_resource_list_file()
         MODULE_LOGGER.warning('Use resources from %s file', self._uri)
 
     def reload_resource_list_file(self):
-        """ Reload resources from file if file has been modified """
-        mtime = os.path.getmtime(self._uri)
-        if self._resource_list_file_mtime != mtime:
+        """ Reload resources from file if file content has been modified """
+        if self._watcher:
+            self._changed.clear()
+        else:
+            stat = os.stat(self._uri)
+            mtime = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            if self._resource_list_file_mtime == mtime:
+                return
             self._resource_list_file_mtime = mtime
-            data = self._read_resources_list_file(self._uri)
-            self.set_resources_list(data)
+        MODULE_LOGGER.debug('Read resource list file: %s', self._uri)
+        try:
+            with open(self._uri, 'rb') as json_file:
+                self._reload_from(json_file)
+        except OSError:
+            # retried on next reload
+            self._changed.set()
+            self._resource_list_file_mtime = None
+            raise
+
+    def _reload_from(self, json_file: BinaryIO) -> None:
+        """
+        Load resources from opened resources file unless same content is already loaded.
+        Content is hashed and parsed from same file object, so loaded resources always
+        match the digest even if the file is replaced meanwhile.
+        """
+        content, digest, stat = self._read_resources_list_file(json_file, self._streaming)
+        if digest == self._digest:
+            MODULE_LOGGER.debug('Resources file content not changed')
+            return
+        cached = self._snapshot_cache.load(stat, digest, self._index_keys) \
+            if self._snapshot_cache else None
+        if cached:
+            MODULE_LOGGER.debug('Resources loaded from snapshot %s', self._snapshot_cache.path)
+            resources_list, index = cached
+            self._replace_resources(resources_list, lambda: index)
+        else:
+            if content is None:
+                # content may be rewritten in place after hashing, digest is of parsed content
+                json_file.seek(0)
+                digest = self._load_stream(json_file)
+            else:
+                self.set_resources_list(self._parse_resources_list(content))
+            if self._snapshot_cache:
+                snapshot = self.snapshot
+                self._snapshot_cache.save(stat, digest, snapshot.resources, snapshot.index,
+                                          self._index_keys)
+        self._digest = digest
+
+    def _load_stream(self, json_file: BinaryIO) -> bytes:
+        """
+        Parse and load resources incrementally from file
+        :return: sha256 digest of parsed content
+        """
+        reader = _HashingReader(json_file)
+        try:
+            self.load_resources(iter_json_array(reader))
+        except (json.decoder.JSONDecodeError, UnicodeDecodeError) as error:
+            raise ValueError(f'invalid resources json file: {error}') from error
+        return reader.digest()
+
+    @staticmethod
+    def _read_resources_list_file(json_file: BinaryIO, streaming: bool) -> tuple:
+        """
+        Read resources file content and its hash
+        :return: content, or None when streaming, sha256 digest of content and file stat
+        """
+        stat = os.fstat(json_file.fileno())
+        if not streaming:
+            content = json_file.read()
+            return content, hashlib.sha256(content).digest(), stat
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: json_file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+        return None, digest.digest(), stat
+
+    def _watch_loop(self, uri: str) -> None:
+        """ Mark resources changed when file is written """
+        name = os.path.basename(uri)
+        while not self._stop.is_set():
+            if self._watcher.wait([name], self.WATCH_TIMEOUT):
+                MODULE_LOGGER.debug('Resources file %s changed', uri)
+                self._changed.set()
+
+    def close(self) -> None:
+        """ Stop watching resources file """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._watcher:
+            self._watcher.close()
+            self._watcher = None
 
     @staticmethod
-    def _read_resources_list_file(filename: str) -> List[dict]:
-        """ Read resources json file """
-        MODULE_LOGGER.debug('Read resource list file: %s', filename)
-        with open(filename, encoding="utf-8") as json_file:
-            try:
-                data = json.load(json_file)
-                assert isinstance(data, list), 'data is not an list'
-            except (json.decoder.JSONDecodeError, AssertionError) as error:
-                raise ValueError(f'invalid resources json file: {error}') from error
+    def _parse_resources_list(content: bytes) -> List[dict]:
+        """ Parse resources json """
+        try:
+            data = json.loads(content)
+            assert isinstance(data, list), 'data is not an list'
+        except (json.decoder.JSONDecodeError, UnicodeDecodeError, AssertionError) as error:
+            raise ValueError(f'invalid resources json file: {error}') from error
         return data
@@ -5,19 +5,21 @@ from lockable.provider_file import ProviderFile
 from lockable.provider_http import ProviderHttp
 
 
-def create(uri):
+def create(uri, **kwargs):
     """
     Create provider instance from uri
-    :param uri: list of string for provider
+    :param uri: resources list, file path, http uri or list of http uris of replicas
+    :param kwargs: provider options
     :return: Provider object
     :rtype: Provider
     """
-    if is_http_url(uri):
-        return ProviderHttp(uri)
+    if is_http_url(uri) or (isinstance(uri, list) and uri and
+                            all(isinstance(item, str) and is_http_url(item) for item in uri)):
+        return ProviderHttp(uri, **kwargs)
     if isinstance(uri, str):
-        return ProviderFile(uri)
+        return ProviderFile(uri, **kwargs)
     if isinstance(uri, list):
-        return ProviderList(uri)
+        return ProviderList(uri, **kwargs)
     raise AssertionError('uri should be list or string')
 
 
@@ -1,13 +1,21 @@
 """ resources Provider for HTTP """
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import contextvars
 import logging
+import statistics
+import threading
+import time
+from typing import List, NamedTuple, Union
 
 import requests
 from requests import HTTPError, ConnectionError as RequestConnectionError
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from urllib3.util import parse_url
-from urllib3.exceptions import MaxRetryError
+from urllib3.exceptions import MaxRetryError, ResponseError
 
+from lockable.inventory_cache import InventoryCache
 from lockable.provider import Provider, ProviderError
 
 try:
@@ -24,9 +32,55 @@ _USER_AGENT = f'py-lockable/v{_MAJOR_VERSION}'
 
 MODULE_LOGGER = logging.getLogger(__name__)
 
+# delta protocol headers
+VERSION_HEADER = 'X-Lockable-Version'  # response: version token of resources
+DELTA_SINCE_HEADER = 'X-Lockable-Delta-Since'  # request: changes since version token
+DELTA_HEADER = 'X-Lockable-Delta'  # response: body is delta instead of full list
+
+
+class ResourcesDelta(NamedTuple):
+    """ Changes since previous resources version """
+    upserts: list
+    removes: list
+
+
+# time.monotonic() deadline of ongoing resources request
+_DEADLINE = contextvars.ContextVar('lockable_http_deadline', default=None)
+
 
 class RetryWithLogging(Retry):
-    """ urllib3.util.retry Retry overwrite to add logging """
+    """
+    urllib3.util.retry Retry overwrite to add logging.
+    Retries are bounded by deadline of ongoing request.
+    """
+
+    @staticmethod
+    def _remaining() -> float:
+        deadline = _DEADLINE.get()
+        return None if deadline is None else deadline - time.monotonic()
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        remaining = self._remaining()
+        return backoff if remaining is None else max(0.0, min(backoff, remaining))
+
+    def is_exhausted(self) -> bool:
+        remaining = self._remaining()
+        # no time left for next attempt after backoff
+        if remaining is not None and remaining <= super().get_backoff_time():
+            return True
+        return super().is_exhausted()
+
+    def sleep_for_retry(self, response=None) -> bool:
+        retry_after = self.get_retry_after(response)
+        remaining = self._remaining()
+        # server asks to retry after the deadline, give up instead of sleeping past it
+        if retry_after and remaining is not None and retry_after >= remaining:
+            url = self.history[-1].url if self.history else None
+            raise MaxRetryError(None, url, ResponseError(
+                f'Retry-After {retry_after:.1f}s exceeds remaining {max(0.0, remaining):.1f}s'))
+        return super().sleep_for_retry(response)
+
     def increment(self, *args, **kwargs):
         try:
             error = kwargs['error']
@@ -37,21 +91,131 @@ class RetryWithLogging(Retry):
         return super().increment(*args, **kwargs)
 
 
-class ProviderHttp(Provider):
+class Endpoint:
+    """ Resources API replica with health and latency statistics """
+
+    SAMPLES = 50  # latencies kept for percentiles
+
+    def __init__(self, url: str, session: requests.Session):
+        """
+        Endpoint constructor
+        :param url: resources uri
+        :param session: http session used for this endpoint
+        """
+        self.url = url
+        self.session = session
+        self.failures = 0  # consecutive failures
+        self.in_flight = 0  # requests not yet completed
+        self._latencies = deque(maxlen=Endpoint.SAMPLES)
+        self._lock = threading.Lock()
+
+    def request_started(self) -> None:
+        """ Record request start """
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self) -> None:
+        """ Record request end, whatever the result """
+        with self._lock:
+            self.in_flight -= 1
+
+    def record_success(self, latency: float) -> None:
+        """ Record latency of successful request """
+        with self._lock:
+            self._latencies.append(latency)
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        """ Record failed request """
+        with self._lock:
+            self.failures += 1
+
+    def latency(self, percentile: float = 0.5) -> Union[float, None]:
+        """ Latency percentile in seconds, None when not enough samples """
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 2:
+            return samples[0] if samples else None
+        return statistics.quantiles(samples, n=100, method='inclusive')[
+            min(98, max(0, round(percentile * 100) - 1))]
+
+    def priority(self) -> tuple:
+        """
+        Sort key, healthy and fast endpoints first. Endpoints which are still
+        busy with earlier request and endpoints without latency samples are
+        tried after healthy measured ones.
+        """
+        latency = self.latency()
+        return (self.failures > 0, self.in_flight > 0, latency is None,
+                self.failures, latency or 0.0)
+
+
+class ProviderHttp(Provider):  # pylint: disable=too-many-instance-attributes
     """ ProviderHttp interface"""
 
     TOTAL_RETRIES = 9  # This should be enough even we update server with short service break
     REDIRECT = 5  # redirect max count
     BACKOFF_FACTOR = 1  # [0.0s, 1s, 2s, 4s, 8s, 16s, 32s, 1min4s, 2min8s]
+    CONNECT_TIMEOUT = 10  # per attempt
+    READ_TIMEOUT = 30  # per attempt
+    # per attempt timeouts are never cut below this so that at least one attempt can succeed
+    MIN_ATTEMPT_TIMEOUT = 1
+    # with many endpoints, request is hedged to next endpoint when response
+    # takes longer than this latency percentile of the endpoint
+    HEDGE_PERCENTILE = 0.95
+    HEDGE_DEFAULT_DELAY = 0.5  # used before endpoint has latency samples
+    REVALIDATE_TIMEOUT = 60  # max duration of cached resources revalidation
 
-    def __init__(self, uri: str):
-        """ ProviderHttp constructor """
+    # pylint: disable=too-many-arguments
+    def __init__(self, uri: Union[str, List[str]], refresh_interval: float = None,
+                 max_staleness: float = None, delta: bool = False, *,
+                 cache_file: str = None, cache_max_age: float = 86400, **kwargs):
+        """
+        ProviderHttp constructor
+        :param uri: resources list uri, or list of uris of replicas
+        :param refresh_interval: refresh resources in background thread on this interval
+                                 in seconds, reload() serves last loaded list immediately
+        :param max_staleness: in background refresh mode reload() refreshes synchronously
+                              when resources are older than this many seconds
+        :param delta: request only changes since previously loaded version from server
+                      which supports delta protocol
+        :param cache_file: keep last loaded resources in this file. Provider starts from
+                           cached resources and revalidates them in background, and
+                           cached resources are used when server is not available
+        :param cache_max_age: cached resources older than this many seconds are not used
+        """
         MODULE_LOGGER.debug('Creating ProviderHTTP using %s', uri)
-        self._configure_http_strategy(uri)
-        super().__init__(uri)
+        # cache validators of currently loaded resources list
+        self._validators = {}
+        self._delta = delta
+        self._refresh_interval = refresh_interval
+        self._max_staleness = max_staleness
+        self._loaded_at = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        urls = [uri] if isinstance(uri, str) else list(uri)
+        assert urls, 'at least one uri is required'
+        self._cache = InventoryCache(cache_file, urls, cache_max_age) if cache_file else None
+        self._endpoints = [Endpoint(url, self._create_session(url)) for url in urls]
+        # losing requests keep running, headroom lets hedged requests start immediately
+        self._executor = ThreadPoolExecutor(max_workers=2 * len(urls),
+                                            thread_name_prefix='lockable-http') \
+            if len(urls) > 1 else None
+        super().__init__(uri, **kwargs)
+        if refresh_interval:
+            self._thread = threading.Thread(target=self._refresh_loop, daemon=True,
+                                            name='lockable-refresh')
+            self._thread.start()
 
-    def _configure_http_strategy(self, uri):
-        """ configure http Strategy """
+    @property
+    def endpoints(self) -> List[Endpoint]:
+        """ Get endpoints """
+        return self._endpoints
+
+    @staticmethod
+    def _create_session(uri) -> requests.Session:
+        """ create http session with retry strategy """
         retry_strategy = RetryWithLogging(
             total=ProviderHttp.TOTAL_RETRIES,
             redirect=ProviderHttp.REDIRECT,
@@ -70,42 +234,236 @@ class ProviderHttp(Provider):
 
         #  create http adapter with retry strategy
         adapter = HTTPAdapter(max_retries=retry_strategy)
-        self._http = requests.Session()
+        session = requests.Session()
 
         # set default User-Agent header
-        self._http.headers.update({'User-Agent': _USER_AGENT})
+        session.headers.update({'User-Agent': _USER_AGENT})
 
         url = parse_url(uri)
-        self._http.mount(f'{url.scheme}://', adapter)
+        session.mount(f'{url.scheme}://', adapter)
+        return session
 
-    def reload(self) -> None:
-        """ Reload resources list from web server """
-        self.set_resources_list(self._get_list())
+    def reload(self, deadline: float = None) -> None:
+        """
+        Reload resources list from web server
+        :param deadline: time.monotonic() time after which request is not retried anymore
+        """
+        if self._refresh_interval and self._loaded_at is not None:
+            age = time.monotonic() - self._loaded_at
+            if self._max_staleness is None or age <= self._max_staleness:
+                return
+            MODULE_LOGGER.warning('Resources are %.1fs old, refresh synchronously', age)
+        if self._loaded_at is None and self._load_cache():
+            return
+        try:
+            self._refresh(deadline)
+        except ProviderError as error:
+            if not (self._cache and self._loaded_at is not None and self._cache.usable()):
+                raise
+            MODULE_LOGGER.warning('Use %.1fs old cached resources: %s', self._cache.age(), error)
 
-    def _get_list(self) -> list:
-        """ Internal method to get http json data"""
+    def _load_cache(self) -> bool:
+        """ Start from cached resources and revalidate them in background """
+        cached = self._cache.load() if self._cache else None
+        if cached is None:
+            return False
+        resources, validators = cached
         try:
-            response = self._http.get(self._uri)
+            self.set_resources_list(resources)
+        except (ValueError, AssertionError, TypeError, AttributeError) as error:
+            MODULE_LOGGER.warning('Ignore invalid cached resources: %s', error)
+            return False
+        MODULE_LOGGER.info('Resources loaded from cache %s', self._cache.path)
+        self._validators = validators
+        self._loaded_at = time.monotonic() - self._cache.age()
+        threading.Thread(target=self._revalidate, daemon=True,
+                         name='lockable-revalidate').start()
+        return True
 
-            # could utilise ETag or Last-Modified headers to optimize performance
-            # etag = response.headers.get("ETag")
-            # last_modified = response.headers.get("Last-Modified")
+    def _revalidate(self) -> None:
+        """ Revalidate cached resources """
+        try:
+            self._refresh(time.monotonic() + ProviderHttp.REVALIDATE_TIMEOUT)
+        except (ProviderError, ValueError, AssertionError) as error:
+            MODULE_LOGGER.warning('Cached resources revalidation failed: %s', error)
+
+    def _acquire_refresh(self, deadline: float = None) -> bool:
+        """
+        Wait for ongoing refresh of other thread to finish
+        :param deadline: time.monotonic() time after which refresh is not waited anymore
+        :return: True when refresh lock is acquired
+        """
+        if self._cache and self._loaded_at is not None and self._cache.usable():
+            # cached resources are served instead of waiting
+            return self._refresh_lock.acquire(blocking=False)
+        if deadline is None:
+            return self._refresh_lock.acquire()
+        return self._refresh_lock.acquire(timeout=max(0.0, deadline - time.monotonic()))
+
+    def _refresh(self, deadline: float = None) -> None:
+        """
+        Load resources list from web server
+        :param deadline: time.monotonic() time after which request is not retried
+                         and ongoing refresh is not waited anymore
+        """
+        if not self._acquire_refresh(deadline):
+            raise ProviderError('Resources are being refreshed by other thread')
+        try:
+            payload, validators = self._get_list(deadline)
+            delta = payload if isinstance(payload, ResourcesDelta) else None
+            if delta:
+                try:
+                    self.apply_changes(delta.upserts, delta.removes)
+                except (ValueError, AssertionError, TypeError, AttributeError) as error:
+                    MODULE_LOGGER.warning('Invalid resources delta, load full list: %s', error)
+                    delta = None
+                    self._validators = {}
+                    payload, validators = self._get_list(deadline)
+            if delta:
+                MODULE_LOGGER.debug('Resources delta applied')
+            elif payload is None:
+                MODULE_LOGGER.debug('Resources not modified')
+            else:
+                self.set_resources_list(payload)
+            # remember validators only when resources are accepted
+            self._validators = validators
+            if self._cache and payload is None:
+                self._cache.touch()
+            elif self._cache:
+                self._cache.save(self.data, validators)
+            self._loaded_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh_loop(self) -> None:
+        """ Background refresh, failures keep serving last loaded resources """
+        while not self._stop.wait(self._refresh_interval):
+            try:
+                # retries never outlast the interval, next refresh tries again
+                self._refresh(time.monotonic() + self._refresh_interval)
+            except (ProviderError, ValueError, AssertionError) as error:
+                MODULE_LOGGER.warning('Background resources refresh failed: %s', error)
+
+    def close(self) -> None:
+        """ Stop background refresh and pending requests, close connections """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        for endpoint in self._endpoints:
+            endpoint.session.close()
+
+    def _conditional_headers(self) -> dict:
+        """ Conditional request headers for currently loaded resources list """
+        headers = {}
+        if 'ETag' in self._validators:
+            headers['If-None-Match'] = self._validators['ETag']
+        if 'Last-Modified' in self._validators:
+            headers['If-Modified-Since'] = self._validators['Last-Modified']
+        if self._delta and VERSION_HEADER in self._validators:
+            headers[DELTA_SINCE_HEADER] = self._validators[VERSION_HEADER]
+        return headers
+
+    def _timeouts(self, deadline: float = None) -> tuple:
+        """ Connect and read timeouts of single attempt """
+        if deadline is None:
+            return ProviderHttp.CONNECT_TIMEOUT, ProviderHttp.READ_TIMEOUT
+        remaining = max(ProviderHttp.MIN_ATTEMPT_TIMEOUT, deadline - time.monotonic())
+        return (min(ProviderHttp.CONNECT_TIMEOUT, remaining),
+                min(ProviderHttp.READ_TIMEOUT, remaining))
+
+    def _get_list(self, deadline: float = None) -> tuple:
+        """
+        Internal method to get http json data
+        :param deadline: time.monotonic() time after which request is not retried anymore
+        :return: resources list and its cache validators,
+                 resources list is None when it is not modified
+        """
+        if len(self._endpoints) == 1:
+            return self._get_from(self._endpoints[0], deadline)
+        return self._get_hedged(deadline)
+
+    def _get_hedged(self, deadline: float = None) -> tuple:
+        """
+        Request endpoints in priority order. Next endpoint is requested when
+        previous one fails or is slower than usual, first response wins.
+        """
+        endpoints = sorted(self._endpoints, key=Endpoint.priority)
+        pending = {}
+        last_error = ProviderError('no endpoints')
+        while True:
+            # first endpoint, failover after failure or hedge after hedge delay
+            if endpoints:
+                endpoint = endpoints.pop(0)
+                MODULE_LOGGER.debug('Request resources from %s', endpoint.url)
+                pending[self._executor.submit(self._get_from, endpoint, deadline)] = endpoint
+                hedge_delay = endpoint.latency(ProviderHttp.HEDGE_PERCENTILE)
+                if hedge_delay is None:
+                    hedge_delay = ProviderHttp.HEDGE_DEFAULT_DELAY
+            if not pending:
+                raise last_error
+            done, _ = wait(pending, timeout=hedge_delay if endpoints else None,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    result = future.result()
+                except ProviderError as error:
+                    MODULE_LOGGER.warning('Endpoint %s failed: %s', endpoint.url, error)
+                    last_error = error
+                    continue
+                MODULE_LOGGER.debug('Resources received from %s', endpoint.url)
+                return result
+
+    def _get_from(self, endpoint: Endpoint, deadline: float = None) -> tuple:
+        """
+        Get http json data from single endpoint
+        :param endpoint: endpoint
+        :param deadline: time.monotonic() time after which request is not retried anymore
+        :return: resources list or ResourcesDelta and cache validators,
+                 resources list is None when it is not modified
+        """
+        token = _DEADLINE.set(deadline)
+        endpoint.request_started()
+        start = time.monotonic()
+        try:
+            response = endpoint.session.get(endpoint.url, headers=self._conditional_headers(),
+                                            timeout=self._timeouts(deadline))
+            if response.status_code == 304 and self._validators:
+                endpoint.record_success(time.monotonic() - start)
+                return None, self._validators
 
             # if we get non retry_strategy based response we still
             # have to check if response is success, e.g. not 404..
             response.raise_for_status()
 
+            validators = {key: response.headers[key]
+                          for key in ('ETag', 'Last-Modified', VERSION_HEADER)
+                          if key in response.headers}
             # access JSON content
-            return response.json()
+            payload = response.json()
+            if DELTA_HEADER in response.headers:
+                payload = ResourcesDelta(payload.get('upserts', []), payload.get('removes', []))
+            endpoint.record_success(time.monotonic() - start)
+            return payload, validators
         except HTTPError as http_err:
             MODULE_LOGGER.error('HTTP error occurred %s', http_err)
+            endpoint.record_failure()
             raise ProviderError(http_err.response.reason) from http_err
         except RequestConnectionError as error:
             MODULE_LOGGER.error('Connection error: %s', error)
+            endpoint.record_failure()
             raise ProviderError(error) from error
         except MaxRetryError as error:
             MODULE_LOGGER.error('Max retries error: %s', error)
+            endpoint.record_failure()
             raise ProviderError(error) from error
         except Exception as error:
             MODULE_LOGGER.error('Other error occurred: %s', error)
+            endpoint.record_failure()
             raise ProviderError(error) from error
+        finally:
+            endpoint.request_finished()
+            _DEADLINE.reset(token)
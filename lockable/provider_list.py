@@ -9,11 +9,11 @@ MODULE_LOGGER = logging.getLogger(__name__)
 class ProviderList(Provider):
     """ ProviderList implementation """
 
-    def __init__(self, uri: list):
+    def __init__(self, uri: list, **kwargs):
         """ ProviderList constructor """
         MODULE_LOGGER.debug('Creating ProviderList')
-        super().__init__(uri)
+        super().__init__(uri, **kwargs)
         self.set_resources_list(self._uri)
 
-    def reload(self):
+    def reload(self, deadline: float = None):
         """ Nothing to do """
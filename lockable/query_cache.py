@@ -0,0 +1,134 @@
+""" Compiled requirement cache """
+from collections import OrderedDict
+import json
+import logging
+from typing import Union
+
+from mongoquery import Query, QueryError
+
+from lockable.columnar import ColumnarEngine, is_available as columnar_available
+from lockable.query_planner import QueryPlanner
+from lockable.resource_index import ResourceIndex
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+
+class _CacheEntry:  # pylint: disable=too-few-public-methods
+    """ Compiled query and its memoized matches """
+    __slots__ = ('query', 'version', 'matches')
+
+    def __init__(self, query: Query):
+        self.query = query
+        self.version = None
+        self.matches = ()
+
+
+class QueryCache:
+    """
+    Bounded LRU cache of compiled requirement queries.
+    Match results are memoized per provider data version so repeated lookups
+    skip both query compilation and the resources scan until data changes.
+    """
+
+    DEFAULT_MAXSIZE = 128
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, columnar: bool = False):
+        """
+        QueryCache constructor
+        :param maxsize: maximum number of cached requirements
+        :param columnar: evaluate requirements with numpy based ColumnarEngine
+        """
+        assert maxsize > 0, 'maxsize should be positive'
+        if columnar and not columnar_available():
+            raise ImportError('columnar engine requires numpy')
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._columnar = columnar
+        # engine of latest resources data version
+        self._engine = (None, None, None)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def canonical_key(requirement: dict) -> Union[str, None]:
+        """ Canonical form of requirement, None when it cannot be serialized """
+        try:
+            return json.dumps(requirement, sort_keys=True, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def compile(requirement: dict) -> Query:
+        """ Compile requirement to mongoquery Query """
+        try:
+            return Query(requirement)
+        except QueryError as error:
+            raise ValueError(str(error)) from error
+
+    def clear(self) -> None:
+        """ Drop all cached queries """
+        self._entries.clear()
+
+    def _get_entry(self, requirement: dict) -> Union[_CacheEntry, None]:
+        key = self.canonical_key(requirement)
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _CacheEntry(self.compile(requirement))
+            self._entries[key] = entry
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+    def filter(self, resources: list, requirement: dict, version: int = None,
+               index: ResourceIndex = None) -> list:
+        """
+        Filter resources matching requirement
+        :param resources: resources list
+        :param requirement: mongoquery requirement
+        :param version: resources data version, None disables match memoization
+        :param index: optional secondary index used to plan the query
+        :return: new list of matching resources
+        """
+        entry = self._get_entry(requirement)
+        if entry is None:
+            MODULE_LOGGER.debug('requirement is not cacheable, compiling directly')
+            return list(self._match(resources, requirement, self.compile(requirement), index))
+        if version is None or entry.version != version:
+            self.misses += 1
+            entry.matches = tuple(self._match(resources, requirement, entry.query, index,
+                                              version))
+            entry.version = version
+        else:
+            self.hits += 1
+        return list(entry.matches)
+
+    def _columnar_engine(self, resources: list, version: int) -> ColumnarEngine:
+        """ Engine of resources, reused while data version does not change """
+        engine_version, engine_resources, engine = self._engine
+        if version is None or engine_version != version or engine_resources is not resources:
+            engine = ColumnarEngine(resources)
+            self._engine = (version, resources, engine)
+        return engine
+
+    def _match(self, resources: list, requirement: dict, query: Query,
+               index: ResourceIndex = None, version: int = None):
+        """ Match resources using columnar engine or query plan when index is available """
+        if self._columnar:
+            return self._columnar_engine(resources, version).filter(requirement)
+        if index is None:
+            return filter(query.match, resources)
+        plan = QueryPlanner(index).plan(requirement)
+        if plan.candidates is None:
+            return filter(query.match, resources)
+        if not plan.residual:
+            return plan.candidates
+        if plan.residual != requirement:
+            query = self.compile(plan.residual)
+        return filter(query.match, plan.candidates)
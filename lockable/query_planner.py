@@ -0,0 +1,167 @@
+""" Query planner for resource requirements """
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+import logging
+from typing import Callable, List, Union
+
+from lockable.resource_index import ResourceIndex, is_indexable_value, value_family
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+LOWER_BOUND_OPERATORS = {'$gt': False, '$gte': True}
+UPPER_BOUND_OPERATORS = {'$lt': False, '$lte': True}
+INDEXABLE_OPERATORS = {'$eq', '$in', *LOWER_BOUND_OPERATORS, *UPPER_BOUND_OPERATORS}
+
+
+@dataclass
+class QueryPlan:
+    """
+    Query plan
+    candidates: resources which may match, None when index could not be used
+    residual: remaining requirement to be evaluated with mongoquery
+    """
+    candidates: Union[List[dict], None]
+    residual: dict
+
+
+@dataclass
+class _Term:
+    """ Indexable requirement term """
+    key: str
+    estimate: int
+    exact: bool
+    resolve: Callable[[], set]
+    cost: int = 0  # resources to be materialized when resolved
+
+
+class QueryPlanner:  # pylint: disable=too-few-public-methods
+    """
+    Split requirement to indexable terms, evaluate them in selectivity order
+    and leave only residual predicate for mongoquery.
+    """
+
+    # Term is left for mongoquery when resolving it would materialize this
+    # many times more resources than what already selected candidates contain
+    SKIP_FACTOR = 8
+
+    def __init__(self, index: ResourceIndex):
+        """
+        QueryPlanner constructor
+        :param index: resources index
+        """
+        self._index = index
+
+    def plan(self, requirement: dict) -> QueryPlan:
+        """ Create query plan for requirement """
+        terms = []
+        for key, condition in requirement.items():
+            term = self._term(key, condition)
+            if term is not None:
+                terms.append(term)
+        if not terms:
+            return QueryPlan(candidates=None, residual=requirement)
+
+        terms.sort(key=lambda term: term.estimate)
+        ordinals = None
+        resolved_keys = set()
+        for term in terms:
+            if ordinals is not None:
+                if not ordinals:
+                    break
+                if term.cost > self.SKIP_FACTOR * len(ordinals):
+                    continue
+            term_ordinals = term.resolve()
+            ordinals = set(term_ordinals) if ordinals is None else ordinals & term_ordinals
+            if term.exact:
+                resolved_keys.add(term.key)
+
+        residual = {key: value for key, value in requirement.items()
+                    if key not in resolved_keys}
+        return QueryPlan(candidates=self._index.rows(ordinals), residual=residual)
+
+    def _term(self, key, condition) -> Union[_Term, None]:
+        """ Create term for key, None if it is not indexable """
+        if not self._index.is_indexed(key):
+            return None
+        if isinstance(condition, Mapping):
+            return self._operators_term(key, condition)
+        if is_indexable_value(condition):
+            return self._equal_term(key, condition, include_residual=True)
+        return None
+
+    def _equal_term(self, key, value, include_residual) -> _Term:
+        """ Term for equality, non-scalar values are compared with mongoquery """
+        bucket = self._index.equal(key, value)
+        residual = self._index.residual(key) if include_residual else set()
+        estimate = len(bucket) + len(residual)
+        return _Term(key=key,
+                     estimate=estimate,
+                     exact=not residual,
+                     resolve=lambda: bucket | residual if residual else bucket,
+                     cost=estimate if residual else 0)
+
+    def _in_term(self, key, values) -> Union[_Term, None]:
+        """ Term for $in operator """
+        if not isinstance(values, Sequence) or isinstance(values, str):
+            return None
+        buckets = [self._index.equal(key, value) for value in values
+                   if is_indexable_value(value)]
+        residual = self._index.residual(key)
+
+        def resolve():
+            return set().union(residual, *buckets)
+        estimate = sum(len(bucket) for bucket in buckets) + len(residual)
+        return _Term(key=key, estimate=estimate, exact=not residual,
+                     resolve=resolve, cost=estimate)
+
+    def _range_term(self, key, condition) -> Union[_Term, None]:
+        """ Term for $gt, $gte, $lt and $lte operators """
+        families = {value_family(value) for value in condition.values()}
+        if len(families) != 1 or None in families:
+            return None
+        lower = upper = None
+        lower_inclusive = upper_inclusive = True
+        for operator, value in condition.items():
+            if operator in LOWER_BOUND_OPERATORS:
+                inclusive = LOWER_BOUND_OPERATORS[operator]
+                if lower is None or value > lower or (value == lower and not inclusive):
+                    lower, lower_inclusive = value, inclusive
+            elif operator in UPPER_BOUND_OPERATORS:
+                inclusive = UPPER_BOUND_OPERATORS[operator]
+                if upper is None or value < upper or (value == upper and not inclusive):
+                    upper, upper_inclusive = value, inclusive
+        column = self._index.sorted_column(key, families.pop())
+        estimate = column.count(lower, lower_inclusive, upper, upper_inclusive)
+        return _Term(key=key, estimate=estimate, exact=True,
+                     resolve=lambda: set(column.range(lower, lower_inclusive,
+                                                      upper, upper_inclusive)),
+                     cost=estimate)
+
+    def _operators_term(self, key, condition: Mapping) -> Union[_Term, None]:
+        """ Combine operator terms of single key """
+        if not condition or not set(condition.keys()) <= INDEXABLE_OPERATORS:
+            return None
+        terms = []
+        if '$eq' in condition:
+            if not is_indexable_value(condition['$eq']):
+                return None
+            # list values are compared as a whole with $eq, so they never match scalar
+            terms.append(self._equal_term(key, condition['$eq'], include_residual=False))
+        if '$in' in condition:
+            terms.append(self._in_term(key, condition['$in']))
+        ranges = {operator: value for operator, value in condition.items()
+                  if operator in LOWER_BOUND_OPERATORS or operator in UPPER_BOUND_OPERATORS}
+        if ranges:
+            terms.append(self._range_term(key, ranges))
+        if None in terms:
+            return None
+        if len(terms) == 1:
+            return terms[0]
+
+        def resolve():
+            return set.intersection(*(term.resolve() for term in terms))
+        return _Term(key=key,
+                     estimate=min(term.estimate for term in terms),
+                     exact=all(term.exact for term in terms),
+                     resolve=resolve,
+                     cost=sum(term.cost for term in terms))
@@ -0,0 +1,338 @@
+""" Secondary indexes over resources list """
+from bisect import bisect_left, bisect_right
+import logging
+import math
+from typing import Iterable, List, Union
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def is_indexable_value(value) -> bool:
+    """ Check if value can be stored in hash index """
+    if not isinstance(value, SCALAR_TYPES):
+        return False
+    return not (isinstance(value, float) and math.isnan(value))
+
+
+def is_indexable_key(key) -> bool:
+    """ Check if requirement key refers top-level resource attribute """
+    return isinstance(key, str) and not key.startswith('$') and '.' not in key
+
+
+def value_family(value) -> Union[str, None]:
+    """ Get family of mutually comparable values, None if value is not range indexable """
+    if isinstance(value, str):
+        return 'str'
+    if isinstance(value, (int, float)) and is_indexable_value(value):
+        return 'number'
+    return None
+
+
+class SortedColumn:
+    """ Sorted values of single attribute and value family for range lookups """
+
+    def __init__(self, pairs: Iterable[tuple] = ()):
+        pairs = sorted(pairs)
+        self.values = [value for value, _ in pairs]
+        self.ordinals = [ordinal for _, ordinal in pairs]
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def from_sorted(cls, values: list, ordinals: list) -> 'SortedColumn':
+        """ Create column from already sorted values and their ordinals """
+        column = cls()
+        column.values = values
+        column.ordinals = ordinals
+        return column
+
+    def position(self, value, ordinal) -> int:
+        """ Position of (value, ordinal) pair in sort order """
+        start = bisect_left(self.values, value)
+        end = bisect_right(self.values, value, start)
+        return bisect_left(self.ordinals, ordinal, start, end)
+
+    def patched(self, removes: Iterable[tuple], adds: Iterable[tuple]) -> 'SortedColumn':
+        """
+        Copy of column with few changes
+        :param removes: (value, ordinal) pairs to be removed
+        :param adds: (value, ordinal) pairs to be added
+        """
+        column = SortedColumn.from_sorted(list(self.values), list(self.ordinals))
+        for value, ordinal in removes:
+            position = column.position(value, ordinal)
+            del column.values[position]
+            del column.ordinals[position]
+        for value, ordinal in adds:
+            position = column.position(value, ordinal)
+            column.values.insert(position, value)
+            column.ordinals.insert(position, ordinal)
+        return column
+
+    def _bounds(self, lower, lower_inclusive, upper, upper_inclusive) -> tuple:
+        start, end = 0, len(self.values)
+        if lower is not None:
+            bisect = bisect_left if lower_inclusive else bisect_right
+            start = bisect(self.values, lower)
+        if upper is not None:
+            bisect = bisect_right if upper_inclusive else bisect_left
+            end = bisect(self.values, upper)
+        return start, max(start, end)
+
+    def count(self, lower=None, lower_inclusive=True, upper=None, upper_inclusive=True) -> int:
+        """ Count values in range """
+        start, end = self._bounds(lower, lower_inclusive, upper, upper_inclusive)
+        return end - start
+
+    def range(self, lower=None, lower_inclusive=True, upper=None, upper_inclusive=True) -> list:
+        """ Ordinals of values in range """
+        start, end = self._bounds(lower, lower_inclusive, upper, upper_inclusive)
+        return self.ordinals[start:end]
+
+
+class ResourceIndex:
+    """
+    Hash and sorted indexes over top-level scalar resource attributes.
+    Resources which have non-scalar value for indexed key are kept in a
+    residual set and are always returned as candidates for equality terms.
+    """
+
+    # sorted columns with at most this many changes are patched instead of sorted again
+    PATCH_LIMIT = 64
+
+    def __init__(self, resources: Iterable[dict] = (), keys: Iterable[str] = None):
+        """
+        ResourceIndex constructor
+        :param resources: resources to be indexed
+        :param keys: attributes to be indexed, None picks all top-level attributes
+        """
+        self._keys = None if keys is None else frozenset(keys)
+        self._rows = {}
+        self._ids = {}
+        self._buckets = {}
+        self._residual = {}
+        self._sorted = {}
+        self._next_ordinal = 0
+        # containers which may be modified, None when all are private to this index
+        self._owned = None
+        pairs = {}
+        for resource in resources:
+            ordinal = self._add_row(resource)
+            for key, value in self._indexed_items(resource):
+                family = value_family(value)
+                if family:
+                    pairs.setdefault((key, family), []).append((value, ordinal))
+        for (key, family), values in pairs.items():
+            self._sorted.setdefault(key, {})[family] = SortedColumn(values)
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def keys(self) -> List[str]:
+        """ Get indexed attributes """
+        return sorted(self._buckets.keys() | self._residual.keys())
+
+    def is_indexed(self, key) -> bool:
+        """ Check if key is indexed attribute """
+        return is_indexable_key(key) and (self._keys is None or key in self._keys)
+
+    def _indexed_items(self, resource: dict):
+        return ((key, value) for key, value in resource.items() if self.is_indexed(key))
+
+    def _writable(self, container: dict, owner, key, factory):
+        """ Get container[key] for modification, copying it first if it is shared """
+        item = container.get(key)
+        if self._owned is None or (owner, key) in self._owned:
+            if item is None:
+                item = container[key] = factory()
+            return item
+        self._owned.add((owner, key))
+        item = container[key] = factory() if item is None else factory(item)
+        return item
+
+    def _bucket_add(self, key: str, value, ordinal: int) -> None:
+        """ Add ordinal to equality bucket, single ordinal is stored without set """
+        values = self._writable(self._buckets, 'buckets', key, dict)
+        bucket = values.get(value)
+        if bucket is None:
+            values[value] = ordinal
+        elif isinstance(bucket, int):
+            values[value] = {bucket, ordinal}
+            if self._owned is not None:
+                self._owned.add((('bucket', key), value))
+        else:
+            self._writable(values, ('bucket', key), value, set).add(ordinal)
+
+    def _bucket_remove(self, key: str, value, ordinal: int) -> None:
+        """ Remove ordinal from equality bucket """
+        values = self._writable(self._buckets, 'buckets', key, dict)
+        bucket = values[value]
+        if isinstance(bucket, int):
+            del values[value]
+            if not values:
+                del self._buckets[key]
+            return
+        bucket = self._writable(values, ('bucket', key), value, set)
+        bucket.discard(ordinal)
+        if len(bucket) == 1:
+            values[value] = next(iter(bucket))
+
+    def _add_row(self, resource: dict, ordinal: int = None) -> int:
+        if ordinal is None:
+            ordinal = self._next_ordinal
+            self._next_ordinal += 1
+        self._rows[ordinal] = resource
+        self._ids[resource.get('id')] = ordinal
+        for key, value in self._indexed_items(resource):
+            if is_indexable_value(value):
+                self._bucket_add(key, value, ordinal)
+            else:
+                self._writable(self._residual, 'residual', key, set).add(ordinal)
+        return ordinal
+
+    def _remove_row(self, ordinal: int) -> dict:
+        resource = self._rows.pop(ordinal)
+        del self._ids[resource.get('id')]
+        for key, value in self._indexed_items(resource):
+            if is_indexable_value(value):
+                self._bucket_remove(key, value, ordinal)
+            else:
+                residual = self._writable(self._residual, 'residual', key, set)
+                residual.discard(ordinal)
+                if not residual:
+                    del self._residual[key]
+        return resource
+
+    def updated(self, removes: Iterable = (), upserts: Iterable[dict] = ()) -> 'ResourceIndex':
+        """
+        Create index with incremental changes, this index is not modified.
+        Unchanged parts are shared with this index.
+        :param removes: ids of resources to be removed
+        :param upserts: resources to be replaced by id or added, replaced resources keep
+                        their position and added ones are placed last
+        :return: ResourceIndex
+        """
+        # pylint: disable=protected-access
+        index = ResourceIndex.__new__(ResourceIndex)
+        index._keys = self._keys
+        index._rows = dict(self._rows)
+        index._ids = dict(self._ids)
+        index._buckets = dict(self._buckets)
+        index._residual = dict(self._residual)
+        index._sorted = dict(self._sorted)
+        index._next_ordinal = self._next_ordinal
+        index._owned = set()
+        removed = {}
+        added = {}
+
+        def remove(ordinal):
+            for key, value in index._indexed_items(index._remove_row(ordinal)):
+                family = value_family(value)
+                if family:
+                    removed.setdefault((key, family), []).append((value, ordinal))
+
+        for resource_id in removes:
+            if resource_id in index._ids:
+                remove(index._ids[resource_id])
+        for resource in upserts:
+            ordinal = index._ids.get(resource.get('id'))
+            if ordinal is not None:
+                remove(ordinal)
+            ordinal = index._add_row(resource, ordinal)
+            for key, value in index._indexed_items(resource):
+                family = value_family(value)
+                if family:
+                    added.setdefault((key, family), []).append((value, ordinal))
+
+        index._update_sorted(self, removed, added)
+        index._owned = None
+        return index
+
+    def ids(self) -> Iterable:
+        """ Ids of indexed resources """
+        return self._ids.keys()
+
+    def lookup(self, resource_id) -> Union[tuple, None]:
+        """ Ordinal and resource of given id, None if resource is not indexed """
+        ordinal = self._ids.get(resource_id)
+        return None if ordinal is None else (ordinal, self._rows[ordinal])
+
+    def to_state(self) -> dict:
+        """ Index content as builtin containers only, see from_state() """
+        return {
+            'keys': self._keys,
+            'rows': self._rows,
+            'ids': self._ids,
+            'buckets': self._buckets,
+            'residual': self._residual,
+            'sorted': {key: {family: (column.values, column.ordinals)
+                             for family, column in families.items()}
+                       for key, families in self._sorted.items()},
+            'next_ordinal': self._next_ordinal
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'ResourceIndex':
+        """ Restore index from to_state() content without re-indexing resources """
+        # pylint: disable=protected-access
+        index = cls.__new__(cls)
+        index._keys = state['keys']
+        index._rows = state['rows']
+        index._ids = state['ids']
+        index._buckets = state['buckets']
+        index._residual = state['residual']
+        index._sorted = {key: {family: SortedColumn.from_sorted(values, ordinals)
+                               for family, (values, ordinals) in families.items()}
+                         for key, families in state['sorted'].items()}
+        index._next_ordinal = state['next_ordinal']
+        index._owned = None
+        return index
+
+    def _update_sorted(self, base: 'ResourceIndex', removed: dict, added: dict) -> None:
+        """
+        Rebuild changed sorted columns from columns of base index
+        :param base: index this index was derived from
+        :param removed: (key, family) to removed (value, ordinal) pairs
+        :param added: (key, family) to added (value, ordinal) pairs
+        """
+        for key, family in removed.keys() | added.keys():
+            column = base.sorted_column(key, family)
+            gone = removed.get((key, family), [])
+            new = added.get((key, family), [])
+            if len(gone) + len(new) <= self.PATCH_LIMIT:
+                column = column.patched(gone, new)
+            else:
+                gone = {ordinal for _, ordinal in gone}
+                column = SortedColumn([(value, ordinal) for value, ordinal
+                                       in zip(column.values, column.ordinals)
+                                       if ordinal not in gone] + new)
+            families = dict(self._sorted.get(key, {}))
+            if column:
+                families[family] = column
+            else:
+                families.pop(family, None)
+            if families:
+                self._sorted[key] = families
+            else:
+                self._sorted.pop(key, None)
+
+    def equal(self, key: str, value) -> set:
+        """ Ordinals of resources which have scalar value equal to given value """
+        bucket = self._buckets.get(key, {}).get(value, set())
+        return {bucket} if isinstance(bucket, int) else bucket
+
+    def residual(self, key: str) -> set:
+        """ Ordinals of resources which have non-scalar value for key """
+        return self._residual.get(key, set())
+
+    def sorted_column(self, key: str, family: str) -> SortedColumn:
+        """ Sorted values of key for given value family """
+        return self._sorted.get(key, {}).get(family, SortedColumn())
+
+    def rows(self, ordinals: Iterable[int]) -> List[dict]:
+        """ Resources by ordinals, in original order """
+        return [self._rows[ordinal] for ordinal in sorted(ordinals)]
@@ -0,0 +1,142 @@
+""" Retry policies for allocation loops """
+from abc import ABC, abstractmethod
+import random
+import time
+from typing import Iterator
+
+
+class RetryPolicy(ABC):  # pylint: disable=too-few-public-methods
+    """
+    Abstract retry policy.
+    Policy object is stateless, each allocation loop iterates its own delays().
+    """
+
+    def __init__(self, cap: float = None):
+        """
+        RetryPolicy constructor
+        :param cap: maximum delay between retries in seconds, None for no cap
+        """
+        assert cap is None or cap >= 0, 'cap should not be negative'
+        self.cap = cap
+
+    def _capped(self, delay: float) -> float:
+        return delay if self.cap is None else min(self.cap, delay)
+
+    @abstractmethod
+    def _delays(self) -> Iterator[float]:  # pragma: no cover
+        """ Generate uncapped delays """
+
+    def delays(self) -> Iterator[float]:
+        """ Generate delays between allocation attempts in seconds """
+        for delay in self._delays():
+            yield self._capped(max(0.0, delay))
+
+    def schedule(self, timeout_s: float) -> 'RetrySchedule':
+        """ Create delays schedule for single allocation loop """
+        return RetrySchedule(self, timeout_s)
+
+
+class RetrySchedule:
+    """ Delays of single allocation loop bounded by its timeout """
+
+    def __init__(self, policy: RetryPolicy, timeout_s: float):
+        """
+        RetrySchedule constructor
+        :param policy: retry policy
+        :param timeout_s: allocation loop timeout in seconds
+        """
+        self.deadline = time.monotonic() + timeout_s
+        self._delays = policy.delays()
+
+    def remaining(self) -> float:
+        """ Remaining time before timeout in seconds """
+        return self.deadline - time.monotonic()
+
+    def expired(self) -> bool:
+        """ Check if timeout has occurred """
+        return self.remaining() <= 0
+
+    def next_delay(self) -> float:
+        """ Next delay, never beyond the timeout """
+        return max(0.0, min(next(self._delays), self.remaining()))
+
+
+class ConstantRetry(RetryPolicy):
+    """ Retry on fixed interval """
+
+    def __init__(self, interval: float = 1.0, cap: float = None):
+        """
+        ConstantRetry constructor
+        :param interval: delay between retries in seconds
+        :param cap: maximum delay between retries in seconds
+        """
+        super().__init__(cap)
+        self.interval = interval
+
+    def _delays(self) -> Iterator[float]:
+        while True:
+            yield self.interval
+
+    def __repr__(self):
+        return f'ConstantRetry(interval={self.interval}, cap={self.cap})'
+
+
+class ExponentialBackoff(RetryPolicy):
+    """ Exponentially growing delay with optional full jitter """
+
+    def __init__(self,  # pylint: disable=too-many-arguments
+                 base: float = 0.05,
+                 factor: float = 2.0,
+                 cap: float = 5.0,
+                 jitter: bool = True,
+                 rand: random.Random = None):
+        """
+        ExponentialBackoff constructor
+        :param base: first delay in seconds
+        :param factor: multiplier for following delays
+        :param cap: maximum delay between retries in seconds
+        :param jitter: pick random delay between 0 and exponential delay
+        :param rand: random generator
+        """
+        super().__init__(cap)
+        self.base = base
+        self.factor = factor
+        self.jitter = jitter
+        self._random = rand or random.Random()
+
+    def _delays(self) -> Iterator[float]:
+        delay = self.base
+        while True:
+            yield self._random.uniform(0, delay) if self.jitter else delay
+            delay = self._capped(delay * self.factor)
+
+    def __repr__(self):
+        return f'ExponentialBackoff(base={self.base}, factor={self.factor}, ' \
+               f'cap={self.cap}, jitter={self.jitter})'
+
+
+class DecorrelatedJitter(RetryPolicy):
+    """ Decorrelated jitter: next delay is random between base and 3x previous delay """
+
+    def __init__(self, base: float = 0.05, cap: float = 5.0, rand: random.Random = None):
+        """
+        DecorrelatedJitter constructor
+        :param base: minimum delay in seconds
+        :param cap: maximum delay between retries in seconds
+        :param rand: random generator
+        """
+        super().__init__(cap)
+        self.base = base
+        self._random = rand or random.Random()
+
+    def _delays(self) -> Iterator[float]:
+        delay = self.base
+        while True:
+            delay = self._capped(self._random.uniform(self.base, delay * 3))
+            yield delay
+
+    def __repr__(self):
+        return f'DecorrelatedJitter(base={self.base}, cap={self.cap})'
+
+
+DEFAULT_RETRY_POLICY = ConstantRetry(interval=1.0)
@@ -0,0 +1,121 @@
+""" Binary cache of parsed and indexed resources files """
+import gc
+import hashlib
+import logging
+import marshal
+import mmap
+import os
+import sys
+import tempfile
+from typing import Iterable, Union
+
+from lockable.resource_index import ResourceIndex
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+# marshal format is specific to python version
+FORMAT = ('lockable-snapshot', 1, sys.version_info[:2])
+
+
+class SnapshotCache:
+    """
+    Parsed and validated resources list with its prebuilt indexes stored with marshal.
+    Snapshot is keyed by resources file path, size, modification time and content hash.
+    Snapshots which are not owned by current user or are writable by others are ignored.
+    """
+
+    def __init__(self, folder: str, filename: str):
+        """
+        SnapshotCache constructor
+        :param folder: folder where snapshot is stored
+        :param filename: resources file
+        """
+        filename = os.path.abspath(filename)
+        name = hashlib.sha256(os.fsencode(filename)).hexdigest()[:16]
+        self.path = os.path.join(folder, f'.lockable-snapshot-{name}')
+        self._filename = filename
+
+    def _key(self, stat: os.stat_result, digest: bytes, index_keys) -> tuple:
+        keys = None if index_keys is None else tuple(sorted(index_keys))
+        return FORMAT, self._filename, stat.st_size, stat.st_mtime_ns, digest, keys
+
+    @staticmethod
+    def _trusted(stat: os.stat_result) -> bool:
+        """ Check that snapshot was not written by someone else """
+        if not hasattr(os, 'getuid'):  # pragma: no cover
+            return True
+        return stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+
+    def load(self, stat: os.stat_result, digest: bytes,
+             index_keys: Iterable[str] = None) -> Union[tuple, None]:
+        """
+        Load snapshot of resources file
+        :param stat: resources file stat
+        :param digest: resources file content hash
+        :param index_keys: indexed attributes
+        :return: resources list and ResourceIndex, None if there is no valid snapshot
+        """
+        try:
+            with open(self.path, 'rb') as snapshot_file:
+                if not self._trusted(os.fstat(snapshot_file.fileno())):
+                    MODULE_LOGGER.warning('Ignore snapshot %s of other user', self.path)
+                    return None
+                # key is stored first so that outdated snapshot is not loaded
+                if marshal.load(snapshot_file) != self._key(stat, digest, index_keys):
+                    MODULE_LOGGER.debug('Snapshot %s is outdated', self.path)
+                    return None
+                resources, state = self._read(snapshot_file)
+            return resources, ResourceIndex.from_state(state)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, TypeError, KeyError) as error:
+            MODULE_LOGGER.warning('Ignore invalid snapshot %s: %s', self.path, error)
+            return None
+
+    @staticmethod
+    def _read(snapshot_file) -> tuple:
+        """ Unmarshal snapshot content from current file position, memory mapped when possible """
+        # millions of containers are created at once, collecting them meanwhile is wasted time
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            offset = snapshot_file.tell()
+            try:
+                with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as content, \
+                        memoryview(content) as view:
+                    return marshal.loads(view[offset:])
+            except (ValueError, OSError):
+                # mmap not supported
+                return marshal.loads(snapshot_file.read())
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def save(self, stat: os.stat_result, digest: bytes, resources: list,
+             index: ResourceIndex, index_keys: Iterable[str] = None) -> None:
+        """
+        Replace snapshot atomically
+        :param stat: resources file stat
+        :param digest: resources file content hash
+        :param resources: validated resources list
+        :param index: index of resources
+        :param index_keys: indexed attributes
+        """
+        folder = os.path.dirname(self.path)
+        try:
+            content = marshal.dumps(self._key(stat, digest, index_keys)) + \
+                marshal.dumps((resources, index.to_state()))
+        except ValueError as error:
+            MODULE_LOGGER.debug('Resources can not be stored to snapshot: %s', error)
+            return
+        try:
+            with tempfile.NamedTemporaryFile('wb', dir=folder, delete=False,
+                                             prefix='.lockable-snapshot-') as snapshot_file:
+                snapshot_file.write(content)
+            os.replace(snapshot_file.name, self.path)
+        except OSError as error:
+            MODULE_LOGGER.warning('Could not write snapshot %s: %s', self.path, error)
+            try:
+                os.unlink(snapshot_file.name)
+            except (OSError, NameError):
+                pass
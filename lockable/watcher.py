@@ -0,0 +1,198 @@
+""" Folder change notifications """
+from abc import ABC, abstractmethod
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from typing import Iterable, Union
+
+MODULE_LOGGER = logging.getLogger(__name__)
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+
+# events which are emitted when lock file is released
+RELEASE_EVENTS = IN_DELETE | IN_MOVED_FROM
+
+_EVENT_HEADER = struct.Struct('iIII')
+_LIBC = None
+
+
+def _libc():
+    """ Load libc with inotify support, None if not available """
+    global _LIBC  # pylint: disable=global-statement
+    if _LIBC is None:
+        _LIBC = False
+        if sys.platform.startswith('linux'):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+                if hasattr(libc, 'inotify_init1'):
+                    _LIBC = libc
+            except OSError as error:  # pragma: no cover
+                MODULE_LOGGER.debug('libc not available: %s', error)
+    return _LIBC or None
+
+
+class Watcher(ABC):
+    """ Abstract folder watcher """
+
+    def __init__(self, folder: str, mask: int = RELEASE_EVENTS):
+        """
+        Watcher constructor
+        :param folder: folder to be watched
+        :param mask: inotify events to be waited
+        """
+        self._folder = folder
+        self._mask = mask
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @abstractmethod
+    def wait(self, names: Iterable[str], timeout: float) -> bool:  # pragma: no cover
+        """
+        Wait until any of given files in folder changes
+        :param names: file names in folder
+        :param timeout: maximum wait time in seconds
+        :return: True when change was detected, False when timeout occurs
+        """
+
+    def close(self) -> None:
+        """ Release watcher resources """
+
+
+class InotifyWatcher(Watcher):
+    """ Linux inotify based watcher. Events are queued since watcher creation. """
+
+    def __init__(self, folder: str, mask: int = RELEASE_EVENTS):
+        super().__init__(folder, mask)
+        libc = _libc()
+        if libc is None:
+            raise OSError('inotify is not available')
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self._fd, os.fsencode(folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f'inotify_add_watch failed for {folder}')
+
+    def _read_names(self) -> Union[set, None]:
+        """ Read pending events and return affected file names, None on queue overflow """
+        names = set()
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buffer):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & self._mask:
+                names.add(os.fsdecode(name))
+        return names
+
+    def wait(self, names: Iterable[str], timeout: float) -> bool:
+        names = set(names)
+        deadline = time.monotonic() + max(timeout, 0)
+        while True:
+            changed = self._read_names()
+            if changed is None or changed & names:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                return False
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class PollingWatcher(Watcher):
+    """ Portable watcher which polls state of waited files """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, folder: str, mask: int = RELEASE_EVENTS):
+        super().__init__(folder, mask)
+        self._states = {}
+
+    @staticmethod
+    def _stat(path: str) -> Union[tuple, None]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _event_mask(self, before, after) -> int:
+        """ Map state transition to inotify event mask """
+        if before == after:
+            return 0
+        if after is None:
+            return IN_DELETE | IN_MOVED_FROM
+        if before is None:
+            return IN_CREATE | IN_MOVED_TO
+        return IN_MODIFY | IN_CLOSE_WRITE | IN_ATTRIB
+
+    def _poll(self, names: Iterable[str]) -> bool:
+        """ Update files state and check if any waited event occurred """
+        changed = False
+        for name in names:
+            state = self._stat(os.path.join(self._folder, name))
+            if name not in self._states:
+                # file which is already gone when first observed is treated as released
+                self._states[name] = state
+                changed |= state is None and bool(self._mask & RELEASE_EVENTS)
+                continue
+            changed |= bool(self._event_mask(self._states[name], state) & self._mask)
+            self._states[name] = state
+        return changed
+
+    def wait(self, names: Iterable[str], timeout: float) -> bool:
+        names = list(names)
+        deadline = time.monotonic() + max(timeout, 0)
+        while True:
+            if self._poll(names):
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.POLL_INTERVAL, remaining))
+
+
+def create_watcher(folder: str, mask: int = RELEASE_EVENTS) -> Watcher:
+    """
+    Create best available watcher for folder
+    :param folder: folder to be watched
+    :param mask: inotify events to be waited
+    :return: Watcher object
+    """
+    try:
+        return InotifyWatcher(folder, mask)
+    except OSError as error:
+        MODULE_LOGGER.debug('inotify not available (%s), fallback to polling', error)
+        return PollingWatcher(folder, mask)
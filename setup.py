@@ -58,7 +58,8 @@ setup(
     ],
     extras_require={
         'dev': ['pynose', 'coveralls', 'pylint', 'coverage', 'mock'],
-        'optional': ['pytest-metadata']
+        'optional': ['pytest-metadata'],
+        'columnar': ['numpy']
     },
 
     project_urls={  # Optional
@@ -1,15 +1,57 @@
 import dataclasses
+import gc
 from datetime import timedelta
 import json
 import logging
 import mock
+import multiprocessing
 import os
+import threading
 import time
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from tempfile import TemporaryDirectory
 from unittest import TestCase
 
+from lockable.fair_queue import TICKET_SUFFIX
+from lockable.lock_backend import LockHandle
 from lockable.lockable import Lockable, ResourceNotFound, Allocation
+from lockable.query_planner import QueryPlan
+from lockable.retry_policy import ConstantRetry, ExponentialBackoff
+import httptest
+
+
+def open_fd_count() -> int:
+    """ Number of open file descriptors of this process """
+    folder = '/proc/self/fd' if os.path.isdir('/proc/self/fd') else '/dev/fd'
+    return len(os.listdir(folder))
+
+
+class TestHTTPServerResources(httptest.Handler):
+
+    def do_GET(self):
+        contents = json.dumps([{"id": 1, "hostname": "myhost", "online": True}]).encode()
+        self.send_response(200)
+        self.send_header("Content-type", "text/json")
+        self.send_header("Content-length", len(contents))
+        self.end_headers()
+        self.wfile.write(contents)
+
+
+def queued_tickets(lock_folder) -> int:
+    """ Number of fair queue tickets in lock folder """
+    return sum(1 for _, _, names in os.walk(lock_folder)
+               for name in names if name.endswith(TICKET_SUFFIX))
+
+
+def fair_queue_worker(lock_folder, name, acquired):
+    """ Lock resource in fair queue mode and report acquisition """
+    lockable = Lockable(hostname='myhost', resource_list=[{"id": 1, "hostname": "myhost",
+                                                           "online": True}],
+                        lock_folder=lock_folder, fair_queue=True)
+    allocation = lockable.lock({}, timeout_s=30, retry_policy=ConstantRetry(0.01))
+    acquired.put(name)
+    time.sleep(0.05)
+    allocation.unlock()
 
 
 @contextmanager
@@ -63,17 +105,17 @@ class LockableTests(TestCase):
             # mtime has at worst 1 second precision
             time.sleep(1)
             lockable = Lockable(hostname='myhost', resource_list_file=list_file, lock_folder=tmpdirname)
-            lockable._provider._read_resources_list_file = mock.MagicMock(return_value=[])
-            self.assertEqual(lockable._provider._read_resources_list_file.call_count, 0)
+            lockable._provider._parse_resources_list = mock.MagicMock(return_value=[])
+            self.assertEqual(lockable._provider._parse_resources_list.call_count, 0)
             lockable._provider.reload()
-            self.assertEqual(lockable._provider._read_resources_list_file.call_count, 0)
+            self.assertEqual(lockable._provider._parse_resources_list.call_count, 0)
             with open(list_file, 'w') as fp:
                 fp.write('[1]')
             lockable._provider.reload()
-            self.assertEqual(lockable._provider._read_resources_list_file.call_count, 1)
+            self.assertEqual(lockable._provider._parse_resources_list.call_count, 1)
             # Check that stored mtime value is updated
             lockable._provider.reload()
-            self.assertEqual(lockable._provider._read_resources_list_file.call_count, 1)
+            self.assertEqual(lockable._provider._parse_resources_list.call_count, 1)
 
     def test_invalid_constructor(self):
         with self.assertRaises(AssertionError):
@@ -155,7 +197,7 @@ class LockableTests(TestCase):
     def test_lock_timeout_0_success(self):
         with create_lockable([{"id": 1, "hostname": "myhost", "online": True}],
                              lock_folder='.') as lockable:
-            lockable._provider._read_resources_list_file = mock.MagicMock(return_value=[])
+            lockable._provider._parse_resources_list = mock.MagicMock(return_value=[])
             lock_file = os.path.join(".", "1.pid")
             object = lockable.lock({}, timeout_s=0)
             self.assertTrue(os.path.exists(lock_file))
@@ -280,3 +322,366 @@ class LockableTests(TestCase):
             self.assertTrue(end - start < 2 and end - start > 1)
             self.assertTrue(os.path.exists(os.path.join(tmpdirname, 'a.pid')))
             self.assertFalse(os.path.exists(os.path.join(tmpdirname, 'b.pid')))
+
+    def test_lock_uses_index(self):
+        resources = [{"id": str(i), "hostname": "myhost" if i % 2 else "other", "online": True}
+                     for i in range(10)]
+        with create_lockable(resources) as lockable:
+            with mock.patch('lockable.query_cache.QueryPlanner') as planner:
+                planner.return_value.plan.return_value = QueryPlan(
+                    candidates=[resources[3]], residual={"id": "3"})
+                allocation = lockable.lock({"id": "3"}, timeout_s=0)
+                self.assertEqual(allocation.resource_id, "3")
+                planner.assert_called_once_with(lockable._provider.index)
+                planner.return_value.plan.assert_called_once_with(
+                    {"id": "3", "hostname": "myhost", "online": True})
+                allocation.unlock()
+
+    def test_provider_options(self):
+        with TemporaryDirectory() as tmpdirname:
+            lockable = Lockable(hostname='myhost', resource_list=[{"id": 1}],
+                                lock_folder=tmpdirname, provider_options={"index_keys": ["id"]})
+            self.assertEqual(lockable._provider.index.keys, ["id"])
+
+    def test_lock_wakes_up_on_release(self):
+        with create_lockable([{"id": 1, "hostname": "myhost", "online": True}]) as lockable:
+            lock_file = os.path.join(lockable._lock_folder, "1.pid")
+            with open(lock_file, 'w') as fp:
+                fp.write(f'{os.getpid()}')
+            timer = threading.Timer(0.2, os.unlink, [lock_file])
+            timer.start()
+            start = time.time()
+            allocation = lockable.lock({}, timeout_s=5)
+            self.assertLess(time.time() - start, 0.9)
+            timer.join()
+            allocation.unlock()
+
+    def test_lock_timeout_respected_with_retry_policy(self):
+        with create_lockable([{"id": 1, "hostname": "myhost", "online": True}]) as lockable:
+            lock_file = os.path.join(lockable._lock_folder, "1.pid")
+            with open(lock_file, 'w') as fp:
+                fp.write(f'{os.getpid()}')
+            start = time.time()
+            with self.assertRaises(TimeoutError):
+                lockable.lock({}, timeout_s=0.3, retry_policy=ConstantRetry(10))
+            self.assertLess(time.time() - start, 1)
+            os.unlink(lock_file)
+
+    def test_auto_lock_retry_policy(self):
+        with create_lockable([{"id": 1, "hostname": "myhost", "online": True}]) as lockable:
+            policy = ExponentialBackoff(base=0.01, cap=0.1)
+            with mock.patch.object(policy, 'delays', wraps=policy.delays) as delays:
+                with lockable.auto_lock({}, timeout_s=0, retry_policy=policy) as allocation:
+                    self.assertEqual(allocation.resource_id, 1)
+                delays.assert_called_once_with()
+
+    def test_lock_many_assignment(self):
+        resources = [{"id": "1", "hostname": "myhost", "online": True, "narrow": True},
+                     {"id": "2", "hostname": "myhost", "online": True, "narrow": False}]
+        with create_lockable(resources) as lockable:
+            for _ in range(10):
+                allocations = lockable.lock_many([{}, {"narrow": True}], timeout_s=0)
+                self.assertEqual(allocations[0].resource_id, "2")
+                self.assertEqual(allocations[1].resource_id, "1")
+                self.assertEqual(allocations[1].requirements,
+                                 {"hostname": "myhost", "online": True, "narrow": True})
+                for allocation in allocations:
+                    allocation.unlock()
+
+    def test_lock_many_reassigns_busy(self):
+        resources = [{"id": "1", "hostname": "myhost", "online": True, "group": "a"},
+                     {"id": "2", "hostname": "myhost", "online": True, "group": "a"},
+                     {"id": "3", "hostname": "myhost", "online": True, "group": "b"}]
+        with create_lockable(resources) as lockable:
+            lock_file = os.path.join(lockable._lock_folder, "1.pid")
+            with open(lock_file, 'w') as fp:
+                fp.write(f'{os.getpid()}')
+            allocations = lockable.lock_many(["group=a", {"id": {"$in": ["1", "2", "3"]}}],
+                                             timeout_s=0)
+            self.assertEqual(allocations[0].resource_id, "2")
+            self.assertEqual(allocations[1].resource_id, "3")
+            for allocation in allocations:
+                allocation.unlock()
+            os.unlink(lock_file)
+
+    def test_lock_many_atomic(self):
+        resources = [{"id": "1", "hostname": "myhost", "online": True},
+                     {"id": "2", "hostname": "myhost", "online": True}]
+        with create_lockable(resources) as lockable:
+            lock_file = os.path.join(lockable._lock_folder, "2.pid")
+            with open(lock_file, 'w') as fp:
+                fp.write(f'{os.getpid()}')
+            result = {}
+            thread = threading.Thread(target=lambda: result.update(
+                allocations=lockable.lock_many(['id=1', 'id=2'], timeout_s=5, atomic=True,
+                                               retry_policy=ConstantRetry(0.05))))
+            thread.start()
+            time.sleep(0.3)
+            # partial allocation is not held while waiting
+            self.assertFalse(os.path.exists(os.path.join(lockable._lock_folder, "1.pid")))
+            os.unlink(lock_file)
+            thread.join()
+            self.assertEqual([a.resource_id for a in result['allocations']], ["1", "2"])
+            for allocation in result['allocations']:
+                allocation.unlock()
+
+    def test_lock_many_atomic_order(self):
+        resources = [{"id": "b", "hostname": "myhost", "online": True},
+                     {"id": "a", "hostname": "myhost", "online": True},
+                     {"id": "c", "hostname": "myhost", "online": True}]
+        with create_lockable(resources) as lockable:
+            with mock.patch.object(lockable, '_try_lock', wraps=lockable._try_lock) as try_lock:
+                allocations = lockable.lock_many(['id=c', 'id=a', 'id=b'], timeout_s=0,
+                                                 atomic=True)
+            self.assertEqual([call[0][1]['id'] for call in try_lock.call_args_list],
+                             ["a", "b", "c"])
+            self.assertEqual([a.resource_id for a in allocations], ["c", "a", "b"])
+            for allocation in allocations:
+                allocation.unlock()
+
+    def test_lock_many_atomic_timeout(self):
+        resources = [{"id": "1", "hostname": "myhost", "online": True},
+                     {"id": "2", "hostname": "myhost", "online": True}]
+        with create_lockable(resources) as lockable:
+            lock_file = os.path.join(lockable._lock_folder, "2.pid")
+            with open(lock_file, 'w') as fp:
+                fp.write(f'{os.getpid()}')
+            with self.assertRaises(TimeoutError):
+                lockable.lock_many(['id=1', 'id=2'], timeout_s=0, atomic=True)
+            self.assertFalse(os.path.exists(os.path.join(lockable._lock_folder, "1.pid")))
+            self.assertEqual(lockable._allocations, {})
+            os.unlink(lock_file)
+
+    def test_lock_fair_queue(self):
+        resources = [{"id": 1, "hostname": "myhost", "online": True}]
+        with TemporaryDirectory() as tmpdirname:
+            lock_file = os.path.join(tmpdirname, "1.pid")
+            with open(lock_file, 'w') as fp:
+                fp.write(f'{os.getpid()}')
+            order = []
+
+            def worker(name):
+                lockable = Lockable(hostname='myhost', resource_list=resources,
+                                    lock_folder=tmpdirname, fair_queue=True)
+                allocation = lockable.lock({}, timeout_s=10, retry_policy=ConstantRetry(0.01))
+                order.append(name)
+                time.sleep(0.05)
+                allocation.unlock()
+
+            threads = []
+            for name in range(3):
+                thread = threading.Thread(target=worker, args=(name,))
+                thread.start()
+                threads.append(thread)
+                time.sleep(0.1)
+            os.unlink(lock_file)
+            for thread in threads:
+                thread.join()
+            self.assertEqual(order, [0, 1, 2])
+
+    def test_lock_fair_queue_processes(self):
+        with TemporaryDirectory() as tmpdirname:
+            lock_file = os.path.join(tmpdirname, "1.pid")
+            with open(lock_file, 'w') as fp:
+                fp.write(f'{os.getpid()}')
+            context = multiprocessing.get_context('spawn')
+            acquired = context.Queue()
+            processes = []
+            for name in range(3):
+                process = context.Process(target=fair_queue_worker,
+                                          args=(tmpdirname, name, acquired))
+                process.start()
+                processes.append(process)
+                # next process arrives after this one is queued
+                end = time.monotonic() + 30
+                while queued_tickets(tmpdirname) < name + 1:
+                    self.assertLess(time.monotonic(), end, 'waiter not queued')
+                    time.sleep(0.01)
+            os.unlink(lock_file)
+            order = [acquired.get(timeout=30) for _ in processes]
+            for process in processes:
+                process.join(timeout=30)
+                self.assertEqual(process.exitcode, 0)
+            self.assertEqual(order, [0, 1, 2])
+
+    def test_lock_flock_backend(self):
+        resources = [{"id": 1, "hostname": "myhost", "online": True}]
+        with TemporaryDirectory() as tmpdirname:
+            lockable = Lockable(hostname='myhost', resource_list=resources,
+                                lock_folder=tmpdirname, lock_backend='flock')
+            other = Lockable(hostname='myhost', resource_list=resources,
+                             lock_folder=tmpdirname, lock_backend='flock')
+            allocation = lockable.lock({}, timeout_s=0)
+            self.assertEqual(allocation.pid_file, os.path.join(tmpdirname, "1.lock"))
+            with self.assertRaises(TimeoutError):
+                other.lock({}, timeout_s=0)
+            timer = threading.Timer(0.2, allocation.unlock)
+            timer.start()
+            start = time.time()
+            other_allocation = other.lock({}, timeout_s=5)
+            self.assertLess(time.time() - start, 0.9)
+            timer.join()
+            other_allocation.unlock()
+
+    def test_lock_sqlite_backend(self):
+        resources = [{"id": 1, "hostname": "myhost", "online": True},
+                     {"id": 2, "hostname": "myhost", "online": True}]
+        with TemporaryDirectory() as tmpdirname:
+            lockable = Lockable(hostname='myhost', resource_list=resources,
+                                lock_folder=tmpdirname, lock_backend='sqlite')
+            other = Lockable(hostname='myhost', resource_list=resources,
+                             lock_folder=tmpdirname, lock_backend='sqlite')
+            allocation = lockable.lock({}, timeout_s=0)
+            other_allocation = other.lock({}, timeout_s=0)
+            self.assertNotEqual(allocation.resource_id, other_allocation.resource_id)
+            with self.assertRaises(TimeoutError):
+                other.lock({}, timeout_s=0)
+            allocation.unlock()
+            allocations = other.lock_many([{}], timeout_s=0)
+            self.assertEqual(allocations[0].resource_id, allocation.resource_id)
+            other.unlock(allocations[0])
+            other_allocation.unlock()
+
+    def test_lock_passes_deadline_to_provider(self):
+        with create_lockable() as lockable:
+            with mock.patch.object(lockable._provider, 'reload') as reload:
+                start = time.monotonic()
+                lockable.lock({}, timeout_s=10).unlock()
+                deadline = reload.call_args[1]['deadline']
+                self.assertAlmostEqual(deadline, start + 10, delta=1)
+                lockable.lock_many([{}], timeout_s=5)[0].unlock()
+                self.assertAlmostEqual(reload.call_args[1]['deadline'], start + 5, delta=1)
+
+    def test_lock_timeout_includes_reload(self):
+        with create_lockable() as lockable:
+            lock_file = os.path.join(lockable._lock_folder, "1.pid")
+            with open(lock_file, 'w') as fp:
+                fp.write(f'{os.getpid()}')
+            with mock.patch.object(lockable._provider, 'reload',
+                                   side_effect=lambda deadline: time.sleep(0.3)):
+                start = time.monotonic()
+                with self.assertRaises(TimeoutError):
+                    lockable.lock({}, timeout_s=0.5, retry_policy=ConstantRetry(0.05))
+                self.assertLess(time.monotonic() - start, 0.7)
+            os.unlink(lock_file)
+
+    def test_thread_safe_stress(self):
+        resources = [{"id": index, "hostname": "myhost", "online": True} for index in range(8)]
+        # memory backend does not emit release events, other threads are woken by lock files
+        retry_intervals = {'pid': 5, 'flock': 5, 'sqlite': 5, 'memory': 0.01}
+        for backend, interval in retry_intervals.items():
+            with self.subTest(backend=backend), TemporaryDirectory() as tmpdirname:
+                lockable = Lockable(hostname='myhost', resource_list=resources,
+                                    lock_folder=tmpdirname, lock_backend=backend,
+                                    thread_safe=True)
+                retry_policy = ConstantRetry(interval)
+                holders = {}
+                holders_lock = threading.Lock()
+                errors = []
+
+                def worker(index):
+                    try:
+                        for iteration in range(6):
+                            if iteration % 2:
+                                context = lockable.auto_lock({}, timeout_s=60,
+                                                             retry_policy=retry_policy)
+                            else:
+                                context = nullcontext(lockable.lock({}, timeout_s=60,
+                                                                    retry_policy=retry_policy))
+                            with context as allocation:
+                                with holders_lock:
+                                    if allocation.resource_id in holders:
+                                        errors.append(f'{allocation.resource_id} allocated twice')
+                                    holders[allocation.resource_id] = index
+                                time.sleep(0.001)
+                                with holders_lock:
+                                    del holders[allocation.resource_id]
+                            if not iteration % 2:
+                                lockable.unlock(allocation)
+                    except Exception as error:  # pylint: disable=broad-except
+                        errors.append(repr(error))
+
+                fd_counts = []
+                for _ in range(3):
+                    threads = [threading.Thread(target=worker, args=(index,))
+                               for index in range(64)]
+                    start = time.monotonic()
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                    self.assertEqual(errors, [])
+                    self.assertEqual(lockable._allocations, {})
+                    self.assertEqual(lockable._reserved, set())
+                    # waiters are woken by releases of other threads instead of retry interval
+                    self.assertLess(time.monotonic() - start, 30)
+                    gc.collect()
+                    # descriptors cached by backend are bounded by number of resources
+                    fd_counts.append(open_fd_count() -
+                                     len(getattr(lockable._lock_backend, '_fds', {})))
+                # no descriptors are leaked between rounds
+                self.assertEqual(len(set(fd_counts)), 1, fd_counts)
+                lockable._lock_backend.close()
+
+    def test_thread_safe_reservation(self):
+        resources = [{"id": 1, "hostname": "myhost", "online": True}]
+        with TemporaryDirectory() as tmpdirname:
+            lockable = Lockable(hostname='myhost', resource_list=resources,
+                                lock_folder=tmpdirname, thread_safe=True)
+            # resource which other thread is trying to lock is busy
+            self.assertTrue(lockable._reserve(1))
+            with self.assertRaises(TimeoutError):
+                lockable.lock({}, timeout_s=0)
+            lockable._reserved.clear()
+
+            released = []
+
+            def acquire(resource_id):
+                return LockHandle('lock', lambda: released.append(resource_id in lockable._allocations))
+
+            with mock.patch.object(lockable._lock_backend, 'acquire', side_effect=acquire):
+                allocation = lockable.lock({}, timeout_s=0)
+            self.assertEqual(lockable._reserved, set())
+            allocation.unlock()
+            # allocation is forgotten before lock is released, so woken thread can take it
+            self.assertEqual(released, [False])
+
+    def test_thread_safe_reload(self):
+        with TemporaryDirectory() as tmpdirname:
+            lockable = Lockable(hostname='myhost', resource_list=[], lock_folder=tmpdirname,
+                                thread_safe=True)
+            with mock.patch.object(lockable._provider, 'reload') as reload:
+                with lockable._reload_lock:
+                    # other thread is reloading, current resources are used
+                    lockable._reload(deadline=None)
+                reload.assert_not_called()
+                lockable._reload(deadline=None)
+                reload.assert_called_once_with(deadline=None)
+
+    def test_close(self):
+        with TemporaryDirectory() as tmpdirname:
+            resources_file = os.path.join(tmpdirname, 'resources.json')
+            with open(resources_file, 'w', encoding='utf-8') as file:
+                json.dump([{"id": 1, "hostname": "myhost", "online": True}], file)
+            with Lockable(hostname='myhost', resource_list_file=resources_file,
+                          lock_folder=tmpdirname, lock_backend='flock',
+                          provider_options={'watch': True}) as lockable:
+                watch = lockable._provider._thread
+                self.assertTrue(watch.is_alive())
+                lockable.lock({"id": 1}, timeout_s=0).unlock()
+                self.assertEqual(len(lockable._lock_backend._fds), 1)
+            self.assertFalse(watch.is_alive())
+            self.assertIsNone(lockable._provider._watcher)
+            self.assertEqual(lockable._lock_backend._fds, {})
+
+    @httptest.Server(TestHTTPServerResources)
+    def test_close_http(self, ts=httptest.NoServer()):
+        with TemporaryDirectory() as tmpdirname:
+            lockable = Lockable(hostname='myhost', resource_list_file=ts.url(),
+                                lock_folder=tmpdirname,
+                                provider_options={'refresh_interval': 0.05})
+            refresh = lockable._provider._thread
+            self.assertTrue(refresh.is_alive())
+            lockable.lock({"id": 1}, timeout_s=0).unlock()
+            lockable.close()
+            self.assertFalse(refresh.is_alive())
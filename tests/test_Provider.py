@@ -1,15 +1,22 @@
+import hashlib
+import io
 import json
 import logging
 import os
+import time
 from tempfile import TemporaryDirectory
 from unittest import TestCase
+from unittest import mock
 from unittest.mock import MagicMock
 
+from lockable.lockable import Lockable
 from lockable.provider import Provider, ProviderError
 from lockable.provider_list import ProviderList
-from lockable.provider_http import ProviderHttp
-from lockable.provider_file import ProviderFile
+from lockable.provider_http import ProviderHttp, Endpoint
+from lockable.provider_file import ProviderFile, iter_json_array, _HashingReader
 from lockable.provider_helpers import create as create_provider
+from lockable.resource_index import ResourceIndex
+from lockable.watcher import PollingWatcher
 import httptest
 
 
@@ -83,6 +90,122 @@ class TestHTTPServerUserAgent(httptest.Handler):
         self.wfile.write(contents)
 
 
+class TestHTTPServerConditional(httptest.Handler):
+
+    etag = '"v1"'
+    last_modified = "Mon, 01 Jan 1970 00:00:00 GMT"
+    contents = "[{\"id\": \"abc\"}]"
+    requests = []
+
+    def do_GET(self):
+        TestHTTPServerConditional.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.etag)
+            self.end_headers()
+            return
+        contents = self.contents.encode()
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Last-Modified", self.last_modified)
+        self.send_header("Content-type", "text/json")
+        self.send_header("Content-length", len(contents))
+        self.end_headers()
+        self.wfile.write(contents)
+
+
+class TestHTTPServerMutable(httptest.Handler):
+
+    status = 200
+    contents = "[{\"id\": \"abc\"}]"
+    calls = 0
+    retry_after = None
+
+    def do_GET(self):
+        TestHTTPServerMutable.calls += 1
+        contents = self.contents.encode()
+        self.send_response(self.status)
+        if self.retry_after is not None:
+            self.send_header("Retry-After", str(self.retry_after))
+        self.send_header("Content-type", "text/json")
+        self.send_header("Content-length", len(contents))
+        self.end_headers()
+        self.wfile.write(contents)
+
+
+class TestHTTPServerSlow(httptest.Handler):
+
+    def do_GET(self):
+        time.sleep(1)
+        contents = "[{\"id\": \"abc\"}]".encode()
+        self.send_response(200)
+        self.send_header("Content-type", "text/json")
+        self.send_header("Content-length", len(contents))
+        self.end_headers()
+        self.wfile.write(contents)
+
+
+class TestHTTPServerHanging(httptest.Handler):
+
+    def do_GET(self):
+        time.sleep(3)
+        contents = "[{\"id\": \"abc\"}]".encode()
+        self.send_response(200)
+        self.send_header("Content-type", "text/json")
+        self.send_header("Content-length", len(contents))
+        self.end_headers()
+        self.wfile.write(contents)
+
+
+class DeltaInventory:
+    """ Reference delta protocol server state: all versions of resources """
+
+    def __init__(self, resources):
+        self.versions = [list(resources)]
+        self.corrupt = False
+
+    def update(self, resources):
+        self.versions.append(list(resources))
+
+    @property
+    def version(self) -> str:
+        return str(len(self.versions) - 1)
+
+    def delta(self, since: str):
+        """ Changes since version, None when version is unknown """
+        try:
+            before = {resource["id"]: resource for resource in self.versions[int(since)]}
+        except (ValueError, IndexError):
+            return None
+        current = {resource["id"]: resource for resource in self.versions[-1]}
+        upserts = [resource for ident, resource in current.items() if before.get(ident) != resource]
+        if self.corrupt:
+            upserts.append({"no": "id"})
+        return {"upserts": upserts,
+                "removes": [ident for ident in before if ident not in current]}
+
+
+class TestHTTPServerDelta(httptest.Handler):
+    """ Reference server of delta protocol """
+
+    inventory = None
+    requests = []
+
+    def do_GET(self):
+        since = self.headers.get('X-Lockable-Delta-Since')
+        delta = None if since is None else self.inventory.delta(since)
+        TestHTTPServerDelta.requests.append((since, delta is not None))
+        contents = json.dumps(self.inventory.versions[-1] if delta is None else delta).encode()
+        self.send_response(200)
+        self.send_header("X-Lockable-Version", self.inventory.version)
+        if delta is not None:
+            self.send_header("X-Lockable-Delta", "1")
+        self.send_header("Content-type", "text/json")
+        self.send_header("Content-length", len(contents))
+        self.end_headers()
+        self.wfile.write(contents)
+
+
 class ProviderTests(TestCase):
     def setUp(self) -> None:
         logger = logging.getLogger('lockable')
@@ -91,11 +214,17 @@ class ProviderTests(TestCase):
         # backup
         self._total_retries = ProviderHttp.TOTAL_RETRIES
         self._backoff_factor = ProviderHttp.BACKOFF_FACTOR
+        self._min_attempt_timeout = ProviderHttp.MIN_ATTEMPT_TIMEOUT
+        self._hedge_default_delay = ProviderHttp.HEDGE_DEFAULT_DELAY
+        self._revalidate_timeout = ProviderHttp.REVALIDATE_TIMEOUT
 
     def tearDown(self) -> None:
         # restore
         ProviderHttp.TOTAL_RETRIES = self._total_retries
         ProviderHttp.BACKOFF_FACTOR = self._backoff_factor
+        ProviderHttp.MIN_ATTEMPT_TIMEOUT = self._min_attempt_timeout
+        ProviderHttp.HEDGE_DEFAULT_DELAY = self._hedge_default_delay
+        ProviderHttp.REVALIDATE_TIMEOUT = self._revalidate_timeout
 
     def test_create_raises(self):
         with self.assertRaises(FileNotFoundError):
@@ -195,3 +324,514 @@ class ProviderTests(TestCase):
         ProviderHttp.BACKOFF_FACTOR = 0
         with self.assertRaises(ProviderError):
             create_provider('http://localhost/resource')
+
+    def test_data_version(self):
+        provider = create_provider([])
+        version = provider.data_version
+        provider.set_resources_list([])
+        self.assertEqual(provider.data_version, version)
+        provider.set_resources_list([{"id": "abc"}])
+        self.assertEqual(provider.data_version, version + 1)
+        provider.set_resources_list([{"id": "abc"}])
+        self.assertEqual(provider.data_version, version + 1)
+
+    @httptest.Server(TestHTTPServerConditional)
+    def test_provider_http_not_modified(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        TestHTTPServerConditional.requests = []
+        provider = create_provider(ts.url())
+        self.assertNotIn('If-None-Match', TestHTTPServerConditional.requests[0])
+        version = provider.data_version
+        provider.set_resources_list = MagicMock()
+        provider.reload()
+        headers = TestHTTPServerConditional.requests[1]
+        self.assertEqual(headers['If-None-Match'], '"v1"')
+        self.assertEqual(headers['If-Modified-Since'], "Mon, 01 Jan 1970 00:00:00 GMT")
+        provider.set_resources_list.assert_not_called()
+        self.assertEqual(provider.data, [{"id": "abc"}])
+        self.assertEqual(provider.data_version, version)
+
+    @httptest.Server(TestHTTPServerConditional)
+    def test_provider_http_modified(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        provider = create_provider(ts.url())
+        TestHTTPServerConditional.etag = '"v2"'
+        TestHTTPServerConditional.contents = "[{\"id\": \"abc\"}, {\"id\": \"def\"}]"
+        try:
+            provider.reload()
+            self.assertEqual(len(provider.data), 2)
+        finally:
+            TestHTTPServerConditional.etag = '"v1"'
+            TestHTTPServerConditional.contents = "[{\"id\": \"abc\"}]"
+
+    @httptest.Server(TestHTTPServerConditional)
+    def test_provider_http_invalid_list_not_cached(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        provider = create_provider(ts.url())
+        TestHTTPServerConditional.etag = '"v2"'
+        TestHTTPServerConditional.contents = "[{\"id\": \"abc\"}, {\"id\": \"abc\"}]"
+        try:
+            with self.assertRaises(ValueError):
+                provider.reload()
+            # rejected list is requested again instead of being treated as not modified
+            with self.assertRaises(ValueError):
+                provider.reload()
+        finally:
+            TestHTTPServerConditional.etag = '"v1"'
+            TestHTTPServerConditional.contents = "[{\"id\": \"abc\"}]"
+        self.assertEqual(provider.data, [{"id": "abc"}])
+
+    def wait_until(self, condition, timeout=5):
+        end = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), end, 'condition not met')
+            time.sleep(0.01)
+
+    @httptest.Server(TestHTTPServerMutable)
+    def test_provider_http_background_refresh(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        TestHTTPServerMutable.calls = 0
+        provider = create_provider(ts.url(), refresh_interval=0.05)
+        try:
+            self.assertEqual(TestHTTPServerMutable.calls, 1)
+            TestHTTPServerMutable.contents = "[{\"id\": \"def\"}]"
+            # served from last loaded resources without request
+            calls = TestHTTPServerMutable.calls
+            provider.reload()
+            self.assertLessEqual(TestHTTPServerMutable.calls, calls + 1)
+            self.wait_until(lambda: provider.data == [{"id": "def"}])
+        finally:
+            TestHTTPServerMutable.contents = "[{\"id\": \"abc\"}]"
+            provider.close()
+
+    @httptest.Server(TestHTTPServerMutable)
+    def test_provider_http_background_refresh_failure(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        ProviderHttp.TOTAL_RETRIES = 0
+        provider = create_provider(ts.url(), refresh_interval=0.05, max_staleness=0.3)
+        try:
+            TestHTTPServerMutable.status = 404
+            calls = TestHTTPServerMutable.calls
+            self.wait_until(lambda: TestHTTPServerMutable.calls > calls + 1)
+            # last good resources are served until they are too stale
+            provider.reload()
+            self.assertEqual(provider.data, [{"id": "abc"}])
+            time.sleep(0.35)
+            with self.assertRaises(ProviderError):
+                provider.reload()
+            TestHTTPServerMutable.status = 200
+            provider.reload()
+            self.assertEqual(provider.data, [{"id": "abc"}])
+        finally:
+            TestHTTPServerMutable.status = 200
+            provider.close()
+
+    @httptest.Server(TestHTTPServerMutable)
+    def test_provider_http_deadline_bounds_background_refresh(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        provider = create_provider(ts.url(), refresh_interval=0.5, max_staleness=0.1)
+        TestHTTPServerMutable.status = 503
+        try:
+            # background refresh is retrying
+            self.wait_until(provider._refresh_lock.locked)
+            start = time.monotonic()
+            with self.assertRaises(ProviderError):
+                provider.reload(deadline=time.monotonic() + 0.2)
+            # ongoing background refresh is not waited beyond the deadline
+            self.assertLess(time.monotonic() - start, 0.5)
+            # background refresh gives up within refresh interval
+            self.wait_until(lambda: not provider._refresh_lock.locked(), timeout=2)
+        finally:
+            TestHTTPServerMutable.status = 200
+            provider.close()
+
+    @httptest.Server(TestHTTPServerMutable)
+    def test_provider_http_deadline_bounds_retries(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        provider = create_provider(ts.url())
+        TestHTTPServerMutable.status = 503
+        try:
+            start = time.monotonic()
+            with self.assertRaises(ProviderError):
+                provider.reload(deadline=time.monotonic() + 1.5)
+            # default retry strategy would take minutes
+            self.assertLess(time.monotonic() - start, 2)
+        finally:
+            TestHTTPServerMutable.status = 200
+
+    @httptest.Server(TestHTTPServerMutable)
+    def test_provider_http_deadline_bounds_retry_after(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        with TemporaryDirectory() as tmpdirname:
+            lockable = Lockable(hostname='myhost', resource_list_file=ts.url(),
+                                lock_folder=tmpdirname)
+            TestHTTPServerMutable.status = 503
+            TestHTTPServerMutable.retry_after = 20
+            try:
+                start = time.monotonic()
+                with self.assertRaises(ProviderError):
+                    lockable.lock({"hostname": None, "online": None}, timeout_s=2)
+                # Retry-After beyond the deadline is not waited
+                self.assertLess(time.monotonic() - start, 2)
+            finally:
+                TestHTTPServerMutable.status = 200
+                TestHTTPServerMutable.retry_after = None
+
+    @httptest.Server(TestHTTPServerSlow)
+    def test_provider_http_deadline_attempt_timeout(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        ProviderHttp.MIN_ATTEMPT_TIMEOUT = 0.2
+        provider = create_provider(ts.url())
+        start = time.monotonic()
+        with self.assertRaises(ProviderError):
+            provider.reload(deadline=time.monotonic() + 0.3)
+        self.assertLess(time.monotonic() - start, 0.9)
+
+    def test_provider_http_timeouts(self):
+        with mock.patch.object(ProviderHttp, 'reload'):
+            provider = ProviderHttp('http://localhost/resources')
+        self.assertEqual(provider._timeouts(), (ProviderHttp.CONNECT_TIMEOUT,
+                                                 ProviderHttp.READ_TIMEOUT))
+        connect, read = provider._timeouts(time.monotonic() + 5)
+        self.assertLessEqual(connect, 5)
+        self.assertLessEqual(read, 5)
+        self.assertEqual(provider._timeouts(time.monotonic() - 1),
+                         (ProviderHttp.MIN_ATTEMPT_TIMEOUT, ProviderHttp.MIN_ATTEMPT_TIMEOUT))
+
+    def test_provider_http_endpoints(self):
+        with httptest.Server(TestHTTPServerSlow) as slow, \
+                httptest.Server(TestHTTPServerMutable) as fast:
+            ProviderHttp.HEDGE_DEFAULT_DELAY = 0.1
+            TestHTTPServerMutable.contents = "[{\"id\": \"fast\"}]"
+            try:
+                start = time.monotonic()
+                provider = create_provider([slow.url(), fast.url()])
+                # slow endpoint is hedged and faster answer wins
+                self.assertLess(time.monotonic() - start, 0.8)
+            finally:
+                TestHTTPServerMutable.contents = "[{\"id\": \"abc\"}]"
+            self.assertIsInstance(provider, ProviderHttp)
+            self.assertEqual(provider.data, [{"id": "fast"}])
+            self.assertEqual([endpoint.url for endpoint in provider.endpoints],
+                             [slow.url(), fast.url()])
+            provider.close()
+
+    def test_provider_http_hanging_endpoint(self):
+        with httptest.Server(TestHTTPServerHanging) as hanging, \
+                httptest.Server(TestHTTPServerMutable) as fast:
+            ProviderHttp.HEDGE_DEFAULT_DELAY = 0.1
+            provider = create_provider([hanging.url(), fast.url()])
+            hanging_endpoint, fast_endpoint = provider.endpoints
+            self.assertEqual(hanging_endpoint.in_flight, 1)
+            # measured endpoint is preferred over unmeasured and busy one
+            self.assertEqual(sorted(provider.endpoints, key=Endpoint.priority)[0], fast_endpoint)
+            for _ in range(2):
+                start = time.monotonic()
+                provider.reload()
+                self.assertLess(time.monotonic() - start, 1)
+            provider.close()
+
+    @httptest.Server(TestHTTPServer200)
+    def test_provider_http_endpoint_failover(self, ts=httptest.NoServer()):
+        ProviderHttp.TOTAL_RETRIES = 0
+        ProviderHttp.HEDGE_DEFAULT_DELAY = 10
+        dead = 'http://127.0.0.1:1/'
+        start = time.monotonic()
+        provider = ProviderHttp([dead, ts.url()])
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(provider.data, [{"id": "abc"}])
+        dead_endpoint, alive_endpoint = provider.endpoints
+        self.assertEqual(dead_endpoint.failures, 1)
+        self.assertEqual(alive_endpoint.failures, 0)
+        # unhealthy endpoint is deprioritized
+        self.assertEqual(sorted(provider.endpoints, key=Endpoint.priority)[0], alive_endpoint)
+        provider.close()
+
+    def test_endpoint_statistics(self):
+        endpoint = Endpoint('http://localhost/', None)
+        self.assertIsNone(endpoint.latency())
+        for latency in range(1, 201):
+            endpoint.record_success(latency / 200)
+        # only recent samples are kept
+        for latency in range(1, Endpoint.SAMPLES + 1):
+            endpoint.record_success(latency / Endpoint.SAMPLES)
+        self.assertAlmostEqual(endpoint.latency(), 0.5, delta=0.02)
+        self.assertAlmostEqual(endpoint.latency(0.95), 0.95, delta=0.02)
+        slow = Endpoint('http://slow/', None)
+        slow.record_success(2)
+        self.assertEqual(sorted([slow, endpoint], key=Endpoint.priority), [endpoint, slow])
+        endpoint.record_failure()
+        self.assertEqual(sorted([slow, endpoint], key=Endpoint.priority), [slow, endpoint])
+
+    def test_apply_changes(self):
+        provider = create_provider([{"id": 1, "a": 1}, {"id": 2, "a": 2}, {"id": 3, "a": 3}])
+        version = provider.data_version
+        index = provider.index
+        provider.apply_changes(upserts=[{"id": 2, "a": 5}, {"id": 4, "a": 4}], removes=[1])
+        self.assertEqual(provider.data, [{"id": 2, "a": 5}, {"id": 3, "a": 3}, {"id": 4, "a": 4}])
+        self.assertEqual(provider.data_version, version + 1)
+        self.assertEqual(provider.index.equal("a", 5), {1})
+        self.assertEqual(provider.index.equal("a", 2), set())
+        # previous snapshot is not modified
+        self.assertEqual(index.equal("a", 2), {1})
+        provider.apply_changes(removes=[10])
+        self.assertEqual(provider.data_version, version + 1)
+        with self.assertRaises(ValueError):
+            provider.apply_changes(upserts=[{"a": 1}])
+
+    @httptest.Server(TestHTTPServerDelta)
+    def test_provider_http_delta(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        inventory = DeltaInventory([{"id": "a", "online": True},
+                                    {"id": "b", "online": True},
+                                    {"id": "c", "online": True}])
+        TestHTTPServerDelta.inventory = inventory
+        TestHTTPServerDelta.requests = []
+        provider = create_provider(ts.url(), delta=True)
+        inventory.update([{"id": "a", "online": True},
+                          {"id": "b", "online": False},
+                          {"id": "d", "online": True}])
+        provider.set_resources_list = MagicMock()
+        provider.reload()
+        provider.set_resources_list.assert_not_called()
+        self.assertEqual(TestHTTPServerDelta.requests, [(None, False), ("0", True)])
+        self.assertEqual(provider.data, inventory.versions[-1])
+        self.assertEqual(provider.index.equal("online", True), provider.index.equal("id", "a") |
+                         provider.index.equal("id", "d"))
+        provider.reload()
+        self.assertEqual(TestHTTPServerDelta.requests[-1], ("1", True))
+        self.assertEqual(provider.data, inventory.versions[-1])
+
+    @httptest.Server(TestHTTPServerDelta)
+    def test_provider_http_delta_fallback(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        inventory = DeltaInventory([{"id": "a"}])
+        TestHTTPServerDelta.inventory = inventory
+        TestHTTPServerDelta.requests = []
+        provider = create_provider(ts.url(), delta=True)
+        inventory.update([{"id": "b"}])
+        inventory.corrupt = True
+        provider.reload()
+        # invalid delta is replaced by full list
+        self.assertEqual(TestHTTPServerDelta.requests, [(None, False), ("0", True), (None, False)])
+        self.assertEqual(provider.data, [{"id": "b"}])
+        # unknown version gets full list
+        inventory.versions = [[{"id": "c"}]]
+        inventory.corrupt = False
+        provider.reload()
+        self.assertEqual(TestHTTPServerDelta.requests[-1], ("1", False))
+        self.assertEqual(provider.data, [{"id": "c"}])
+
+    @httptest.Server(TestHTTPServerConditional)
+    def test_provider_http_delta_not_supported(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        TestHTTPServerConditional.requests = []
+        provider = create_provider(ts.url(), delta=True)
+        provider.reload()
+        self.assertNotIn('X-Lockable-Delta-Since', TestHTTPServerConditional.requests[-1])
+        self.assertEqual(provider.data, [{"id": "abc"}])
+
+    @httptest.Server(TestHTTPServerMutable)
+    def test_provider_http_cache(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        ProviderHttp.TOTAL_RETRIES = 0
+        with TemporaryDirectory() as tmpdirname:
+            cache_file = os.path.join(tmpdirname, 'cache', 'resources.json')
+            provider = create_provider(ts.url(), cache_file=cache_file)
+            self.assertTrue(os.path.exists(cache_file))
+            self.assertEqual(os.listdir(os.path.dirname(cache_file)), ['resources.json'])
+            try:
+                # starts from cache while server is down and keeps serving it
+                TestHTTPServerMutable.status = 503
+                provider = create_provider(ts.url(), cache_file=cache_file)
+                self.assertEqual(provider.data, [{"id": "abc"}])
+                provider.reload()
+                self.assertEqual(provider.data, [{"id": "abc"}])
+                # too old cache is not used
+                provider = create_provider(ts.url(), cache_file=cache_file, cache_max_age=0.1)
+                os.utime(cache_file, (time.time() - 1, time.time() - 1))
+                with self.assertRaises(ProviderError):
+                    provider.reload()
+                with self.assertRaises(ProviderError):
+                    create_provider(ts.url(), cache_file=cache_file, cache_max_age=0.1)
+                # cache of other source is not used
+                with self.assertRaises(ProviderError):
+                    create_provider(ts.url() + '?other', cache_file=cache_file)
+                # cached resources are revalidated in background
+                TestHTTPServerMutable.status = 200
+                TestHTTPServerMutable.contents = "[{\"id\": \"def\"}]"
+                provider = create_provider(ts.url(), cache_file=cache_file)
+                self.wait_until(lambda: provider.data == [{"id": "def"}])
+                with open(cache_file, encoding='utf-8') as file:
+                    self.assertEqual(json.load(file)['resources'], [{"id": "def"}])
+            finally:
+                TestHTTPServerMutable.status = 200
+                TestHTTPServerMutable.contents = "[{\"id\": \"abc\"}]"
+
+    @httptest.Server(TestHTTPServerMutable)
+    def test_provider_http_cache_outage(self, ts=httptest.NoServer()):
+        ts.server_name = 'localhost'
+        ProviderHttp.REVALIDATE_TIMEOUT = 5
+        with TemporaryDirectory() as tmpdirname:
+            cache_file = os.path.join(tmpdirname, 'resources.json')
+            create_provider(ts.url(), cache_file=cache_file).close()
+            TestHTTPServerMutable.status = 503
+            try:
+                lockable = Lockable(hostname='myhost', resource_list_file=ts.url(),
+                                    lock_folder=tmpdirname,
+                                    provider_options={'cache_file': cache_file})
+                # revalidation keeps retrying in background
+                self.wait_until(lockable._provider._refresh_lock.locked)
+                start = time.monotonic()
+                allocation = lockable.lock({"hostname": None, "online": None}, timeout_s=2)
+                # cached resources are served without waiting for revalidation
+                self.assertLess(time.monotonic() - start, 1)
+                self.assertEqual(allocation.resource_id, "abc")
+                allocation.unlock()
+            finally:
+                TestHTTPServerMutable.status = 200
+
+    def test_provider_file_content_hash(self):
+        with TemporaryDirectory() as tmpdirname:
+            list_file = os.path.join(tmpdirname, 'test.json')
+            with open(list_file, 'w') as fp:
+                fp.write('[{"id": "abc"}]')
+            provider = create_provider(list_file)
+            version = provider.data_version
+            # rewrite with same content does not reload resources
+            os.utime(list_file, (time.time() + 5, time.time() + 5))
+            provider.reload()
+            self.assertEqual(provider.data_version, version)
+            with open(list_file, 'w') as fp:
+                fp.write('[{"id": "def"}]')
+            provider.reload()
+            self.assertEqual(provider.data, [{"id": "def"}])
+
+    def test_provider_file_watch_polling(self):
+        with mock.patch('lockable.provider_file.create_watcher', PollingWatcher):
+            self.test_provider_file_watch()
+
+    def test_provider_file_watch(self):
+        with TemporaryDirectory() as tmpdirname:
+            list_file = os.path.join(tmpdirname, 'test.json')
+            with open(list_file, 'w') as fp:
+                fp.write('[{"id": "abc"}]')
+            provider = create_provider(list_file, watch=True)
+            try:
+                self.assertEqual(provider.data, [{"id": "abc"}])
+                # unchanged file is not accessed
+                with mock.patch('builtins.open') as open_mock, \
+                        mock.patch('os.stat') as stat_mock:
+                    provider.reload()
+                    open_mock.assert_not_called()
+                    stat_mock.assert_not_called()
+                with open(list_file + '.tmp', 'w') as fp:
+                    fp.write('[{"id": "def"}]')
+                os.replace(list_file + '.tmp', list_file)
+
+                def reloaded():
+                    provider.reload()
+                    return provider.data == [{"id": "def"}]
+                self.wait_until(reloaded)
+            finally:
+                provider.close()
+
+    def test_iter_json_array(self):
+        data = [{"id": "a", "nested": {"list": [1, 2.5, "x]"]}, "text": 'a"b,]'},
+                {"id": 12345, "online": True}, {}]
+        content = ' \n' + json.dumps(data, indent=2) + '\n'
+        for chunk_size in (1, 2, 3, 7, 64):
+            self.assertEqual(list(iter_json_array(io.StringIO(content), chunk_size)), data)
+        self.assertEqual(list(iter_json_array(io.StringIO('[ ]'), 1)), [])
+        self.assertEqual(list(iter_json_array(io.StringIO('[1,23]'), 1)), [1, 23])
+        for invalid in ('', '{}', '[', '[{}', '[{},]', '[{}] x', '[{} {}]', '[{"id": }]'):
+            with self.assertRaises(json.JSONDecodeError, msg=invalid):
+                list(iter_json_array(io.StringIO(invalid), 2))
+
+    def test_provider_file_streaming(self):
+        with TemporaryDirectory() as tmpdirname:
+            list_file = os.path.join(tmpdirname, 'test.json')
+            resources = [{"id": str(index), "value": index} for index in range(1000)]
+            with open(list_file, 'w') as fp:
+                json.dump(resources, fp)
+            provider = create_provider(list_file, streaming=True)
+            self.assertEqual(provider.data, resources)
+            self.assertEqual(provider.index.equal('value', 10), {10})
+            version = provider.data_version
+            os.utime(list_file, (time.time() + 5, time.time() + 5))
+            provider.reload()
+            self.assertEqual(provider.data_version, version)
+            for invalid in ('[{"id": 1}, {"id": 1}]', '[{"a": 1}]', '[1]', '[{"id": 1}'):
+                with open(list_file, 'w') as fp:
+                    fp.write(invalid)
+                with self.assertRaises(ValueError, msg=invalid):
+                    provider.reload()
+            # failed load keeps previous resources
+            self.assertEqual(provider.data, resources)
+
+    def test_provider_file_streaming_replaced_while_reading(self):
+        with TemporaryDirectory() as tmpdirname:
+            list_file = os.path.join(tmpdirname, 'test.json')
+
+            def write(resources):
+                with open(list_file + '.tmp', 'w') as fp:
+                    json.dump(resources, fp)
+                os.replace(list_file + '.tmp', list_file)
+
+            write([{"id": "a"}])
+            provider = create_provider(list_file, streaming=True)
+            read = ProviderFile._read_resources_list_file
+
+            def read_and_replace(json_file, streaming):
+                result = read(json_file, streaming)
+                write([{"id": "a"}])
+                return result
+
+            write([{"id": "b"}])
+            with mock.patch.object(ProviderFile, '_read_resources_list_file',
+                                   side_effect=read_and_replace):
+                provider.reload()
+            # parsed resources are the hashed ones
+            self.assertEqual(provider.data, [{"id": "b"}])
+            write([{"id": "c"}])
+            provider.reload()
+            self.assertEqual(provider.data, [{"id": "c"}])
+
+    def test_hashing_reader(self):
+        content = '[{"id": "\u00e4\u20ac"}, {"id": "x"}]'.encode()
+        reader = _HashingReader(io.BytesIO(content))
+        self.assertEqual(list(iter_json_array(reader, 1)), [{"id": "\u00e4\u20ac"}, {"id": "x"}])
+        self.assertEqual(reader.digest(), hashlib.sha256(content).digest())
+
+    def test_set_resources_list_diff(self):
+        resources = [{"id": str(ident), "value": ident} for ident in range(10)]
+        provider = create_provider(resources)
+        version = provider.data_version
+        changed = [dict(resource) for resource in resources]
+        changed[3]["value"] = "x"
+        del changed[5]
+        changed.append({"id": "new", "value": 3})
+        with mock.patch.object(ResourceIndex, '__init__') as rebuild:
+            provider.set_resources_list(changed)
+            rebuild.assert_not_called()
+        self.assertEqual(provider.data, changed)
+        self.assertEqual(provider.data_version, version + 1)
+        # unchanged resources are kept
+        self.assertIs(provider.data[0], resources[0])
+        self.assertIs(provider.data[3], changed[3])
+        self.assertEqual(provider.index.equal('value', 3), provider.index.equal('id', 'new'))
+        self.assertEqual(provider.index.rows(provider.index.equal('value', 3)), [{"id": "new", "value": 3}])
+        self.assertEqual(provider.index.equal('id', '5'), set())
+        # equal list does not change version
+        provider.set_resources_list([dict(resource) for resource in changed])
+        self.assertEqual(provider.data_version, version + 1)
+        # reordered list is re-indexed
+        provider.set_resources_list(list(reversed(changed)))
+        self.assertEqual(provider.data, list(reversed(changed)))
+        self.assertEqual(provider.index.rows(range(len(changed))), list(reversed(changed)))
+        self.assertEqual(provider.data_version, version + 2)
+        with self.assertRaisesRegex(ValueError, 'duplicate ids'):
+            provider.set_resources_list(changed + [{"id": "0"}])
+        with self.assertRaisesRegex(ValueError, 'id property is missing'):
+            provider.set_resources_list(changed + [{}])
+        self.assertEqual(provider.data, list(reversed(changed)))
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import threading
+import time
+from tempfile import TemporaryDirectory
+from unittest import IsolatedAsyncioTestCase
+
+from lockable import AsyncLockable
+from lockable.lock_backend import LockHandle
+from lockable.lockable import ResourceNotFound
+from lockable.retry_policy import ConstantRetry
+
+RESOURCES = [{"id": 1, "hostname": "myhost", "online": True},
+             {"id": 2, "hostname": "myhost", "online": True}]
+
+
+class AsyncLockableTests(IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        logger = logging.getLogger('lockable')
+        logger.handlers.clear()
+        logger.addHandler(logging.NullHandler())
+        self._tmpdir = TemporaryDirectory()
+        self.lockable = AsyncLockable(hostname='myhost', resource_list=RESOURCES,
+                                      lock_folder=self._tmpdir.name)
+
+    def tearDown(self) -> None:
+        self._tmpdir.cleanup()
+
+    async def test_lock(self):
+        allocation = await self.lockable.lock({"id": 1}, timeout_s=1)
+        self.assertEqual(allocation.resource_id, 1)
+        self.assertIsNotNone(allocation.allocation_queue_time)
+        with self.assertRaises(TimeoutError):
+            await self.lockable.lock({"id": 1}, timeout_s=0)
+        self.lockable.unlock(allocation)
+        allocation = await self.lockable.lock({"id": 1}, timeout_s=0)
+        allocation.unlock()
+
+    async def test_resource_not_found(self):
+        with self.assertRaises(ResourceNotFound):
+            await self.lockable.lock({"id": 3}, timeout_s=0)
+
+    async def test_auto_lock(self):
+        async with self.lockable.auto_lock({"id": 2}, timeout_s=1) as allocation:
+            self.assertEqual(allocation.resource_id, 2)
+            self.assertIn(2, self.lockable._allocations)
+        self.assertNotIn(2, self.lockable._allocations)
+        self.assertIsNotNone(allocation.release_time)
+
+    async def test_lock_many(self):
+        allocations = await self.lockable.lock_many([{}, {}], timeout_s=1)
+        self.assertEqual({allocation.resource_id for allocation in allocations}, {1, 2})
+        with self.assertRaises(TimeoutError):
+            await self.lockable.lock_many([{}], timeout_s=0)
+        for allocation in allocations:
+            allocation.unlock()
+        allocations = await self.lockable.lock_many([{}, {}], timeout_s=1, atomic=True)
+        self.assertEqual(len(allocations), 2)
+
+    async def test_wakes_up_on_release(self):
+        allocation = await self.lockable.lock({"id": 1}, timeout_s=1)
+        asyncio.get_running_loop().call_later(0.1, allocation.unlock)
+        begin = time.monotonic()
+        # retry interval is much longer than release delay
+        other = await self.lockable.lock({"id": 1}, timeout_s=10,
+                                         retry_policy=ConstantRetry(interval=10))
+        self.assertLess(time.monotonic() - begin, 5)
+        other.unlock()
+
+    async def test_release_from_other_thread(self):
+        allocation = await self.lockable.lock({"id": 1}, timeout_s=1)
+        threading.Timer(0.1, allocation.unlock).start()
+        other = await self.lockable.lock({"id": 1}, timeout_s=10,
+                                         retry_policy=ConstantRetry(interval=10))
+        other.unlock()
+
+    async def test_cancel_releases_partial_allocation(self):
+        allocation = await self.lockable.lock({"id": 2}, timeout_s=1)
+        task = asyncio.ensure_future(self.lockable.lock_many([{"id": 1}, {"id": 2}], timeout_s=10))
+        await asyncio.sleep(0.1)
+        self.assertIn(1, self.lockable._allocations)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertNotIn(1, self.lockable._allocations)
+        self.assertEqual(self.lockable._waiters, {})
+        allocation.unlock()
+
+    async def test_release_is_handed_over_in_order(self):
+        allocation = await self.lockable.lock({"id": 1}, timeout_s=1)
+        acquired = []
+
+        async def worker(name):
+            # progress does not depend on retry interval
+            async with self.lockable.auto_lock({"id": 1}, timeout_s=10,
+                                               retry_policy=ConstantRetry(interval=60)):
+                acquired.append(name)
+                await asyncio.sleep(0)
+
+        tasks = []
+        for name in ('a', 'b', 'c'):
+            tasks.append(asyncio.ensure_future(worker(name)))
+            await asyncio.sleep(0.01)
+        allocation.unlock()
+        # newcomer does not take resource handed over to waiter
+        with self.assertRaises(TimeoutError):
+            await self.lockable.lock({"id": 1}, timeout_s=0)
+        await asyncio.gather(*tasks)
+        self.assertEqual(acquired, ['a', 'b', 'c'])
+        self.assertEqual(self.lockable._handoffs, {})
+        self.assertEqual(self.lockable._waiters, {})
+
+    async def test_waiter_keeps_its_place(self):
+        allocation = await self.lockable.lock({"id": 1}, timeout_s=1)
+        retry_policy = ConstantRetry(interval=60)
+        first = asyncio.ensure_future(self.lockable.lock({"id": 1}, timeout_s=10,
+                                                         retry_policy=retry_policy))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(self.lockable.lock({"id": 1}, timeout_s=10,
+                                                          retry_policy=retry_policy))
+        await asyncio.sleep(0.01)
+        # other process takes resource before first waiter, which loses the hand-off
+        original = self.lockable._lock_backend.acquire_any
+        self.lockable._lock_backend.acquire_any = lambda resource_ids: None
+        allocation.unlock()
+        await asyncio.sleep(0.01)
+        self.lockable._lock_backend.acquire_any = original
+        self.assertFalse(first.done())
+        self.assertFalse(second.done())
+        self.assertEqual(self.lockable._handoffs, {})
+        # first waiter is still first in queue
+        queue = list(self.lockable._waiters[1])
+        self.assertEqual(len(queue), 2)
+        self.lockable._allocation({"id": 1}, RESOURCES[0], LockHandle('', lambda: None)).unlock()
+        self.assertIs(self.lockable._handoffs.get(1), queue[0])
+        (await first).unlock()
+        (await second).unlock()
+
+    async def test_concurrent_waiters(self):
+        reloads = []
+        original = self.lockable._provider.reload
+
+        def reload(deadline=None):
+            reloads.append(threading.current_thread())
+            time.sleep(0.05)
+            original(deadline=deadline)
+
+        self.lockable._provider.reload = reload
+        acquired = []
+
+        async def worker(index):
+            # released resources are handed over, retry interval is never waited
+            async with self.lockable.auto_lock({}, timeout_s=60,
+                                               retry_policy=ConstantRetry(interval=60)) \
+                    as allocation:
+                acquired.append((index, allocation.resource_id))
+                await asyncio.sleep(0)
+
+        await asyncio.gather(*[worker(index) for index in range(1000)])
+        self.assertEqual(len(acquired), 1000)
+        self.assertEqual(self.lockable._allocations, {})
+        self.assertEqual(self.lockable._waiters, {})
+        self.assertEqual(self.lockable._handoffs, {})
+        # concurrent allocations share reload which runs outside event loop thread
+        self.assertEqual(len(reloads), 1)
+        self.assertIsNot(reloads[0], threading.current_thread())
+
+    def test_fair_queue_not_supported(self):
+        with self.assertRaises(AssertionError):
+            AsyncLockable(hostname='myhost', resource_list=RESOURCES,
+                          lock_folder=self._tmpdir.name, fair_queue=True)
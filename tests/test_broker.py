@@ -0,0 +1,124 @@
+import logging
+import os
+import threading
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from lockable.broker import Broker
+from lockable.broker_client import BrokerClient, BrokerError
+from lockable.lockable import Lockable, ResourceNotFound
+
+RESOURCES = [{"id": "1", "hostname": "myhost", "online": True, "group": "a"},
+             {"id": "2", "hostname": "myhost", "online": True, "group": "a"},
+             {"id": "3", "hostname": "myhost", "online": True, "group": "b"}]
+
+
+class BrokerTests(TestCase):
+
+    def setUp(self) -> None:
+        logger = logging.getLogger('lockable')
+        logger.handlers.clear()
+        logger.addHandler(logging.NullHandler())
+        self._tmpdir = TemporaryDirectory()
+        self.socket_path = os.path.join(self._tmpdir.name, 'broker.sock')
+        self.broker = Broker(Lockable(resource_list=RESOURCES, lock_folder=self._tmpdir.name,
+                                      lock_backend='memory'), self.socket_path)
+        self.broker.start()
+
+    def tearDown(self) -> None:
+        self.broker.shutdown()
+        self._tmpdir.cleanup()
+
+    def client(self) -> Lockable:
+        return Lockable(hostname='myhost', broker=self.socket_path)
+
+    def test_lock_unlock(self):
+        lockable = self.client()
+        allocation = lockable.lock('group=b', timeout_s=0)
+        self.assertEqual(allocation.resource_id, "3")
+        self.assertEqual(allocation.resource_info, RESOURCES[2])
+        self.assertEqual(allocation.pid_file, self.socket_path)
+        with self.assertRaises(TimeoutError):
+            self.client().lock('group=b', timeout_s=0)
+        lockable.unlock(allocation)
+        self.assertEqual(lockable._allocations, {})
+        self.client().lock('group=b', timeout_s=0).unlock()
+
+    def test_resource_not_found(self):
+        with self.assertRaises(ResourceNotFound):
+            self.client().lock('group=c', timeout_s=0)
+
+    def test_lock_many(self):
+        lockable = self.client()
+        allocations = lockable.lock_many(['group=a', {}, {}], timeout_s=0)
+        self.assertEqual(sorted(a.resource_id for a in allocations), ["1", "2", "3"])
+        self.assertEqual(allocations[0].get('group'), 'a')
+        with self.assertRaises(TimeoutError):
+            self.client().lock({}, timeout_s=0)
+        for allocation in allocations:
+            allocation.unlock()
+        allocations = lockable.lock_many(['group=a', 'group=a'], timeout_s=0, atomic=True)
+        self.assertEqual(sorted(a.resource_id for a in allocations), ["1", "2"])
+        for allocation in allocations:
+            allocation.unlock()
+
+    def test_waiter_wakes_up_on_release(self):
+        allocation = self.client().lock('group=b', timeout_s=0)
+        timer = threading.Timer(0.2, allocation.unlock)
+        timer.start()
+        start = time.time()
+        self.client().lock('group=b', timeout_s=5).unlock()
+        self.assertLess(time.time() - start, 0.9)
+        timer.join()
+
+    def test_lease_released_when_connection_closes(self):
+        client = BrokerClient(self.socket_path)
+        leases = client.lock([{"group": "b"}], timeout_s=0)
+        self.assertEqual(leases[0][0]["id"], "3")
+        with self.assertRaises(TimeoutError):
+            self.client().lock('group=b', timeout_s=0)
+        # connection holding leases is not reused
+        self.assertEqual(client._idle, [])
+        connection = leases[0][1].args[0]
+        connection.close()
+        allocation = self.client().lock('group=b', timeout_s=1)
+        self.assertEqual(allocation.resource_id, "3")
+        allocation.unlock()
+
+    def test_fifo_order(self):
+        allocation = self.client().lock('group=b', timeout_s=0)
+        order = []
+
+        def worker(name):
+            lockable = self.client()
+            waiting = lockable.lock('group=b', timeout_s=10)
+            order.append(name)
+            time.sleep(0.05)
+            waiting.unlock()
+
+        threads = []
+        for name in range(3):
+            thread = threading.Thread(target=worker, args=(name,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.1)
+        allocation.unlock()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [0, 1, 2])
+
+    def test_unknown_operation(self):
+        client = BrokerClient(self.socket_path)
+        connection = client._take()
+        with self.assertRaises(BrokerError) as error:
+            connection.request({'op': 'unknown'})
+        self.assertEqual(error.exception.kind, 'ValueError')
+        with self.assertRaises(BrokerError) as error:
+            connection.request({'op': 'unlock', 'resource_id': '1'})
+        self.assertEqual(error.exception.kind, 'ResourceNotFound')
+        connection.close()
+
+    def test_already_running(self):
+        with self.assertRaises(OSError):
+            Broker(Lockable(resource_list=RESOURCES), self.socket_path).start()
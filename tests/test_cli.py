@@ -4,7 +4,9 @@ import logging
 from tempfile import TemporaryDirectory
 from unittest import TestCase
 from unittest.mock import patch
+from lockable.broker import Broker
 from lockable.cli import main
+from lockable.lockable import Lockable
 
 
 class LockableCliTests(TestCase):
@@ -61,3 +63,45 @@ class LockableCliTests(TestCase):
                 with patch.object(sys, 'argv', testargs):
                     main()
             self.assertEqual(cm.exception.code, 0)
+
+    def test_snapshot_cache(self):
+        with TemporaryDirectory() as tmpdirname:
+            list_file = os.path.join(tmpdirname, 'resources.json')
+            with open(list_file, 'w') as fp:
+                fp.write('[{"id": "abc", "hostname": "localhost", "online": true}]')
+            testargs = ["prog", "--validate-only", "--snapshot-cache", "--lock-folder", tmpdirname,
+                        "--resources", list_file, "echo", "$ID"]
+            for _ in range(2):
+                with self.assertRaises(SystemExit) as cm:
+                    with patch.object(sys, 'argv', testargs):
+                        main()
+                self.assertEqual(cm.exception.code, 0)
+            self.assertTrue([name for name in os.listdir(tmpdirname)
+                             if name.startswith('.lockable-snapshot-')])
+
+    def test_serve_broker(self):
+        with TemporaryDirectory() as tmpdirname:
+            list_file = os.path.join(tmpdirname, 'resources.json')
+            with open(list_file, 'w') as fp:
+                fp.write('[{"id": "abc", "hostname": "localhost", "online": true}]')
+            socket_path = os.path.join(tmpdirname, 'broker.sock')
+            testargs = ["prog", "--resources", list_file, "--serve-broker", socket_path]
+            with patch.object(Broker, 'serve_forever') as serve_forever:
+                with self.assertRaises(SystemExit) as cm:
+                    with patch.object(sys, 'argv', testargs):
+                        main()
+            self.assertEqual(cm.exception.code, 0)
+            serve_forever.assert_called_once_with()
+
+    def test_broker(self):
+        with TemporaryDirectory() as tmpdirname:
+            socket_path = os.path.join(tmpdirname, 'broker.sock')
+            lockable = Lockable(resource_list=[{"id": "abc", "hostname": "localhost", "online": True}],
+                                lock_backend='memory')
+            with Broker(lockable, socket_path):
+                testargs = ["prog", "--hostname", "localhost", "--broker", socket_path, "exit", "3"]
+                with self.assertRaises(SystemExit) as cm:
+                    with patch.object(sys, 'argv', testargs):
+                        main()
+                self.assertEqual(cm.exception.code, 3)
+                self.assertEqual(lockable._allocations, {})
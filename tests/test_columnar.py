@@ -0,0 +1,130 @@
+import logging
+import random
+from unittest import TestCase, skipUnless
+
+from mongoquery import Query
+
+from lockable.columnar import ColumnarEngine, is_available
+from lockable.lockable import Lockable
+from lockable.query_cache import QueryCache
+
+VALUES = ['a', 'b', 'ab', '', 0, 1, 2, -1, 1.5, 2.0, True, False, None, float('nan'),
+          2 ** 60, 2 ** 60 + 1, ['a', 1], ['b'], [], {'name': 'a'}, {'name': 'b', 'x': 1}]
+CONDITIONS = ['a', 'ab', 0, 1, 1.5, True, False, None, 2 ** 60 + 1, float('nan'),
+              ['a', 1], {'name': 'a'}]
+
+
+def random_resources(rnd: random.Random, count: int) -> list:
+    resources = []
+    for position in range(count):
+        resource = {'id': position}
+        for key in ('x', 'y', 'z'):
+            if rnd.random() < 0.8:
+                resource[key] = rnd.choice(VALUES)
+        resources.append(resource)
+    return resources
+
+
+def random_term(rnd: random.Random):
+    choice = rnd.randrange(8)
+    value = rnd.choice(CONDITIONS)
+    if choice == 0:
+        return value
+    if choice == 1:
+        operator = rnd.choice(['$gt', '$gte', '$lt', '$lte'])
+        term = {operator: value}
+        if rnd.random() < 0.5:
+            term[rnd.choice(['$gt', '$gte', '$lt', '$lte'])] = rnd.choice(CONDITIONS)
+        return term
+    if choice == 2:
+        return {rnd.choice(['$eq', '$ne']): value}
+    if choice == 3:
+        return {rnd.choice(['$in', '$nin']): rnd.sample(CONDITIONS, 3)}
+    if choice == 4:
+        return {'$exists': rnd.choice([True, False, 0, 1])}
+    if choice == 5:
+        return {'$exists': True, '$ne': value}
+    if choice == 6:
+        return {'$in': value}
+    return {'$not': {'$eq': value}}
+
+
+def random_requirement(rnd: random.Random) -> dict:
+    requirement = {}
+    for _ in range(rnd.randrange(1, 3)):
+        requirement[rnd.choice(['x', 'y', 'z'])] = random_term(rnd)
+    if rnd.random() < 0.1:
+        requirement['x.name'] = rnd.choice(['a', 'b'])
+    if rnd.random() < 0.1:
+        requirement['$or'] = [{'y': rnd.choice(CONDITIONS)}, {'z': {'$exists': False}}]
+    return requirement
+
+
+def mongoquery_filter(resources: list, requirement: dict) -> list:
+    try:
+        query = Query(requirement)
+        return [resource for resource in resources if query.match(resource)]
+    except Exception as error:  # pylint: disable=broad-except
+        return type(error)
+
+
+def columnar_filter(resources: list, requirement: dict) -> list:
+    try:
+        return ColumnarEngine(resources).filter(requirement)
+    except Exception as error:  # pylint: disable=broad-except
+        return type(error)
+
+
+@skipUnless(is_available(), 'numpy is not installed')
+class ColumnarTests(TestCase):
+
+    def setUp(self) -> None:
+        logger = logging.getLogger('lockable')
+        logger.handlers.clear()
+        logger.addHandler(logging.NullHandler())
+
+    def test_filter(self):
+        resources = [{'id': 1, 'hostname': 'a', 'cpu': 4},
+                     {'id': 2, 'hostname': 'b', 'cpu': 8, 'type': ['x']},
+                     {'id': 3, 'hostname': 'c'}]
+        engine = ColumnarEngine(resources)
+        self.assertEqual(engine.filter({'hostname': 'b'}), [resources[1]])
+        self.assertEqual(engine.filter({'cpu': {'$gte': 4, '$lt': 8}}), [resources[0]])
+        self.assertEqual(engine.filter({'cpu': {'$exists': False}}), [resources[2]])
+        self.assertEqual(engine.filter({'hostname': {'$in': ['a', 'c']}}),
+                         [resources[0], resources[2]])
+        self.assertEqual(engine.filter({'cpu': {'$ne': 4}}), [resources[1], resources[2]])
+        self.assertEqual(engine.filter({'type': 'x'}), [resources[1]])
+        self.assertEqual(engine.filter({'hostname': {'$regex': '^[ab]$'}, 'cpu': 8}),
+                         [resources[1]])
+        self.assertEqual(engine.filter({}), resources)
+
+    def test_same_results_as_mongoquery(self):
+        rnd = random.Random(23)
+        for _ in range(20):
+            resources = random_resources(rnd, 60)
+            for _ in range(50):
+                requirement = random_requirement(rnd)
+                self.assertEqual(columnar_filter(resources, requirement),
+                                 mongoquery_filter(resources, requirement),
+                                 f'requirement: {requirement}')
+
+    def test_query_cache_reuses_engine(self):
+        resources = [{'id': 1, 'hostname': 'a'}, {'id': 2, 'hostname': 'b'}]
+        cache = QueryCache(columnar=True)
+        self.assertEqual(cache.filter(resources, {'hostname': 'a'}, version=1), [resources[0]])
+        engine = cache._engine[2]  # pylint: disable=protected-access
+        self.assertEqual(cache.filter(resources, {'hostname': 'b'}, version=1), [resources[1]])
+        self.assertIs(cache._engine[2], engine)  # pylint: disable=protected-access
+        resources = [{'id': 3, 'hostname': 'a'}]
+        self.assertEqual(cache.filter(resources, {'hostname': 'a'}, version=2), resources)
+        self.assertIsNot(cache._engine[2], engine)  # pylint: disable=protected-access
+
+    def test_lockable(self):
+        resources = [{'id': str(position), 'hostname': 'myhost', 'online': True,
+                      'cpu': position % 8} for position in range(100)]
+        lockable = Lockable(hostname='myhost', resource_list=resources, columnar=True,
+                            lock_backend='memory')
+        allocation = lockable.lock({'cpu': {'$gt': 6}}, timeout_s=1)
+        self.assertEqual(allocation.resource_info['cpu'], 7)
+        allocation.unlock()
@@ -0,0 +1,93 @@
+import copy
+import json
+import logging
+from collections.abc import Mapping
+from unittest import TestCase
+
+from mongoquery import Query
+
+from lockable.compact import CompactResource, Compactor, json_default
+from lockable.lockable import Lockable
+from lockable.provider_list import ProviderList
+
+RESOURCES = [
+    {"id": 1, "hostname": "a", "online": True, "type": ["x", "y"]},
+    {"id": 2, "hostname": "a", "online": 1, "nested": {"name": "x"}},
+    {"id": 3, "hostname": "b", "online": True, "type": ["x", "y"]},
+    {"id": 4, "hostname": "a", "online": 1.0, "value": None},
+]
+
+
+class CompactTests(TestCase):
+
+    def setUp(self) -> None:
+        logger = logging.getLogger('lockable')
+        logger.handlers.clear()
+        logger.addHandler(logging.NullHandler())
+
+    def test_mapping(self):
+        resource = next(Compactor().compact([RESOURCES[0]]))
+        self.assertIsInstance(resource, Mapping)
+        self.assertEqual(resource, RESOURCES[0])
+        self.assertEqual(RESOURCES[0], resource)
+        self.assertEqual(resource["hostname"], "a")
+        self.assertEqual(resource.get("missing", 5), 5)
+        self.assertIn("id", resource)
+        self.assertEqual(list(resource.items()), list(RESOURCES[0].items()))
+        self.assertEqual(repr(resource), repr(RESOURCES[0]))
+        with self.assertRaises(KeyError):
+            resource["missing"]
+        with self.assertRaises(TypeError):
+            resource["id"] = 2
+        with self.assertRaises(AttributeError):
+            resource.extra = 1
+        self.assertEqual(copy.deepcopy(resource), RESOURCES[0])
+        self.assertIsInstance(copy.copy(resource), dict)
+
+    def test_sharing(self):
+        compacted = Compactor().compact_list([RESOURCES[0], RESOURCES[2], RESOURCES[1]])
+        self.assertIs(compacted[0]._layout, compacted[1]._layout)
+        self.assertIsNot(compacted[0]._layout, compacted[2]._layout)
+        # equal values of same type are shared
+        self.assertIs(compacted[0]["hostname"], compacted[2]["hostname"])
+        self.assertIs(compacted[1]["online"], True)
+        self.assertIs(compacted[2]["online"], 1)
+        with self.assertRaises(ValueError):
+            Compactor().compact_list([[1]])
+
+    def test_mongoquery(self):
+        compacted = Compactor().compact_list(RESOURCES)
+        for requirement in [{"hostname": "a"}, {"online": True}, {"type": "x"},
+                            {"type": ["x", "y"]}, {"nested.name": "x"},
+                            {"value": {"$exists": True}}, {"value": None},
+                            {"id": {"$gt": 1}}, {"$or": [{"id": 1}, {"hostname": "b"}]}]:
+            query = Query(requirement)
+            self.assertEqual(list(filter(query.match, compacted)),
+                             list(filter(query.match, RESOURCES)), requirement)
+
+    def test_json(self):
+        compacted = Compactor().compact_list(RESOURCES)
+        self.assertEqual(json.loads(json.dumps(compacted, default=json_default)), RESOURCES)
+        with self.assertRaises(TypeError):
+            json.dumps(object(), default=json_default)
+
+    def test_provider(self):
+        provider = ProviderList([dict(resource) for resource in RESOURCES], compact=True)
+        self.assertTrue(all(isinstance(resource, CompactResource) for resource in provider.data))
+        self.assertEqual(provider.data, RESOURCES)
+        version = provider.data_version
+        provider.set_resources_list([dict(resource) for resource in RESOURCES])
+        self.assertEqual(provider.data_version, version)
+        provider.apply_changes([{"id": 5, "hostname": "c"}], [1])
+        self.assertIsInstance(provider.data[-1], CompactResource)
+        self.assertEqual(provider.index.rows(provider.index.equal("hostname", "c")),
+                         [{"id": 5, "hostname": "c"}])
+
+    def test_lockable(self):
+        resources = [{"id": "1", "hostname": "myhost", "online": True}]
+        lockable = Lockable(hostname='myhost', resource_list=resources,
+                            provider_options={"compact": True})
+        with lockable.auto_lock({}) as allocation:
+            self.assertIsInstance(allocation.resource_info, CompactResource)
+            self.assertEqual(allocation.resource_info, resources[0])
+            self.assertEqual(allocation.resource_id, "1")
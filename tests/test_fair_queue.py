@@ -0,0 +1,77 @@
+import logging
+import os
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from lockable.fair_queue import FairQueue, list_tickets
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+class FairQueueTests(TestCase):
+
+    def setUp(self) -> None:
+        logger = logging.getLogger('lockable')
+        logger.handlers.clear()
+        logger.addHandler(logging.NullHandler())
+
+    def test_requirement_class(self):
+        self.assertEqual(FairQueue.requirement_class([{"a": 1, "b": 2}]),
+                         FairQueue.requirement_class([{"b": 2, "a": 1}]))
+        self.assertNotEqual(FairQueue.requirement_class([{"a": 1}]),
+                            FairQueue.requirement_class([{"a": 2}]))
+
+    def test_fifo_order(self):
+        with TemporaryDirectory() as tmpdirname:
+            queue = FairQueue(tmpdirname)
+            first = queue.enqueue([{"a": 1}])
+            second = queue.enqueue([{"a": 1}])
+            other = queue.enqueue([{"a": 2}])
+            self.assertTrue(first.is_head())
+            self.assertEqual(second.ahead(), first.name)
+            self.assertTrue(other.is_head())
+            first.leave()
+            self.assertTrue(second.is_head())
+            third = queue.enqueue([{"a": 1}])
+            self.assertGreater(third.name, second.name)
+            self.assertFalse(third.is_head())
+            for ticket in [second, third, other]:
+                ticket.leave()
+            self.assertEqual(list_tickets(first.folder), [])
+
+    def test_wait(self):
+        with TemporaryDirectory() as tmpdirname:
+            queue = FairQueue(tmpdirname)
+            first = queue.enqueue([{}])
+            with queue.enqueue([{}]) as second:
+                self.assertFalse(second.wait(first.name, 0.1))
+                first.leave()
+                self.assertTrue(second.wait(first.name, 1))
+                self.assertTrue(second.is_head())
+            self.assertFalse(os.path.exists(second.path))
+
+    def test_stale_ticket(self):
+        with TemporaryDirectory() as tmpdirname:
+            queue = FairQueue(tmpdirname)
+            crashed = queue.enqueue([{}])
+            with open(crashed.path, 'w') as fp:
+                fp.write(f'{dead_pid()}\n')
+            with queue.enqueue([{}]) as ticket:
+                self.assertTrue(ticket.is_head())
+                self.assertFalse(os.path.exists(crashed.path))
+
+    def test_empty_ticket_is_alive(self):
+        with TemporaryDirectory() as tmpdirname:
+            queue = FairQueue(tmpdirname)
+            writing = queue.enqueue([{}])
+            open(writing.path, 'w').close()
+            with queue.enqueue([{}]) as ticket:
+                self.assertEqual(ticket.ahead(), writing.name)
+                os.utime(writing.path, (0, 0))
+                self.assertTrue(ticket.is_head())
@@ -0,0 +1,213 @@
+import logging
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipIf
+
+from lockable.lock_backend import LockBackend, PidFileBackend, FlockBackend, SqliteBackend, \
+    MemoryBackend, create
+from lockable.watcher import InotifyWatcher, _libc
+
+
+HOLD_LOCK = '''
+import sys, time
+from lockable.lock_backend import FlockBackend
+handle = FlockBackend(sys.argv[1]).acquire(sys.argv[2])
+print(handle is not None, flush=True)
+time.sleep(30)
+'''
+
+
+class LockBackendTestsMixin:
+
+    def setUp(self) -> None:
+        logger = logging.getLogger('lockable')
+        logger.handlers.clear()
+        logger.addHandler(logging.NullHandler())
+
+    def create_backend(self, lock_folder) -> LockBackend:
+        raise NotImplementedError()
+
+    def test_acquire_release(self):
+        with TemporaryDirectory() as tmpdirname:
+            backend = self.create_backend(tmpdirname)
+            other = self.create_backend(tmpdirname)
+            handle = backend.acquire('a')
+            self.assertIsNotNone(handle)
+            self.assertTrue(os.path.exists(handle.path))
+            self.assertIsNone(other.acquire('a'))
+            handle.release()
+            handle = other.acquire('a')
+            self.assertIsNotNone(handle)
+            handle.release()
+            backend.close()
+            other.close()
+
+    def test_acquire_any(self):
+        with TemporaryDirectory() as tmpdirname:
+            backend = self.create_backend(tmpdirname)
+            other = self.create_backend(tmpdirname)
+            handle = backend.acquire('a')
+            resource_id, other_handle = other.acquire_any(['a', 'b'])
+            self.assertEqual(resource_id, 'b')
+            self.assertIsNone(other.acquire_any(['a', 'b']))
+            handle.release()
+            other_handle.release()
+
+
+class PidFileBackendTests(LockBackendTestsMixin, TestCase):
+
+    def create_backend(self, lock_folder) -> LockBackend:
+        return PidFileBackend(lock_folder)
+
+    def test_release_removes_file(self):
+        with TemporaryDirectory() as tmpdirname:
+            handle = PidFileBackend(tmpdirname).acquire('a')
+            self.assertTrue(os.path.exists(handle.path))
+            handle.release()
+            self.assertFalse(os.path.exists(handle.path))
+
+
+@skipIf(sys.platform == 'win32', 'flock is not supported')
+class FlockBackendTests(LockBackendTestsMixin, TestCase):
+
+    def create_backend(self, lock_folder) -> LockBackend:
+        return FlockBackend(lock_folder)
+
+    def test_lock_file_content(self):
+        with TemporaryDirectory() as tmpdirname:
+            backend = FlockBackend(tmpdirname)
+            handle = backend.acquire('a')
+            self.assertEqual(os.path.basename(handle.path), backend.lock_file_name('a'))
+            with open(handle.path) as fp:
+                self.assertEqual(fp.read(), f'{os.getpid()}\n')
+            handle.release()
+            self.assertTrue(os.path.exists(handle.path))
+
+    def test_released_when_owner_dies(self):
+        with TemporaryDirectory() as tmpdirname:
+            env = dict(os.environ, PYTHONPATH=os.getcwd())
+            process = subprocess.Popen([sys.executable, '-c', HOLD_LOCK, tmpdirname, 'a'],
+                                       stdout=subprocess.PIPE, env=env, text=True)
+            try:
+                self.assertEqual(process.stdout.readline().strip(), 'True')
+                backend = FlockBackend(tmpdirname)
+                self.assertIsNone(backend.acquire('a'))
+            finally:
+                process.kill()
+                process.wait()
+                process.stdout.close()
+            handle = backend.acquire('a')
+            self.assertIsNotNone(handle)
+            handle.release()
+            backend.close()
+
+    def test_replaced_lock_file(self):
+        with TemporaryDirectory() as tmpdirname:
+            backend = FlockBackend(tmpdirname)
+            handle = backend.acquire('a')
+            handle.release()
+            os.unlink(handle.path)
+            other = FlockBackend(tmpdirname)
+            other_handle = other.acquire('a')
+            # cached descriptor of removed file must not be used
+            self.assertIsNone(backend.acquire('a'))
+            other_handle.release()
+            backend.close()
+            other.close()
+
+    @skipIf(not _libc(), 'inotify not available')
+    def test_release_notifies_watcher(self):
+        with TemporaryDirectory() as tmpdirname:
+            backend = FlockBackend(tmpdirname)
+            handle = backend.acquire('a')
+            other = FlockBackend(tmpdirname)
+            name = backend.lock_file_name('a')
+            with InotifyWatcher(tmpdirname, FlockBackend.release_events) as watcher:
+                # failed attempts do not wake up waiters
+                self.assertIsNone(other.acquire('a'))
+                start = time.time()
+                self.assertFalse(watcher.wait([name], 0.1))
+                self.assertGreaterEqual(time.time() - start, 0.09)
+                handle.release()
+                self.assertTrue(watcher.wait([name], 1))
+            backend.close()
+            other.close()
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+class SqliteBackendTests(LockBackendTestsMixin, TestCase):
+
+    def create_backend(self, lock_folder) -> LockBackend:
+        return SqliteBackend(lock_folder)
+
+    def test_wal_mode(self):
+        with TemporaryDirectory() as tmpdirname:
+            backend = SqliteBackend(tmpdirname)
+            handle = backend.acquire(1)
+            connection = sqlite3.connect(backend.path)
+            self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(connection.execute('SELECT resource_id, pid FROM locks').fetchall(),
+                             [('1', os.getpid())])
+            connection.close()
+            handle.release()
+            backend.close()
+
+    def test_reclaim_dead_pids(self):
+        with TemporaryDirectory() as tmpdirname:
+            backend = SqliteBackend(tmpdirname)
+            connection = sqlite3.connect(backend.path)
+            pid = dead_pid()
+            connection.executemany('INSERT INTO locks VALUES (?, ?, ?, 0)',
+                                   [('a', pid, 'x'), ('b', pid, 'y'), ('c', os.getpid(), 'z')])
+            connection.commit()
+            self.assertIsNone(backend.acquire('c'))
+            resource_id, handle = backend.acquire_any(['a', 'b'])
+            self.assertEqual(resource_id, 'a')
+            # all locks of dead process are reclaimed at once
+            rows = connection.execute('SELECT resource_id FROM locks ORDER BY 1').fetchall()
+            self.assertEqual(rows, [('a',), ('c',)])
+            connection.close()
+            handle.release()
+            backend.close()
+
+    def test_release_keeps_reacquired_lock(self):
+        with TemporaryDirectory() as tmpdirname:
+            backend = SqliteBackend(tmpdirname)
+            handle = backend.acquire('a')
+            handle.release()
+            other = backend.acquire('a')
+            handle.release()
+            self.assertIsNone(SqliteBackend(tmpdirname).acquire('a'))
+            other.release()
+            backend.close()
+
+
+class CreateTests(TestCase):
+
+    def test_create(self):
+        self.assertIsInstance(create(None, '.'), PidFileBackend)
+        self.assertIsInstance(create('pid', '.'), PidFileBackend)
+        backend = PidFileBackend('.')
+        self.assertIs(create(backend, '.'), backend)
+        with self.assertRaises(AssertionError):
+            create('unknown', '.')
+
+    def test_shared(self):
+        self.assertTrue(PidFileBackend.shared)
+        self.assertTrue(SqliteBackend.shared)
+        self.assertFalse(MemoryBackend.shared)
+
+    def test_benchmark(self):
+        benchmark = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'lock_backend.py')
+        output = subprocess.run([sys.executable, benchmark, '--number', '10'],
+                                check=True, capture_output=True, text=True).stdout
+        self.assertEqual(len(output.splitlines()), 4)
@@ -0,0 +1,50 @@
+import itertools
+import random
+from unittest import TestCase
+
+from lockable.matching import hopcroft_karp
+
+
+def brute_force_size(graph):
+    lefts = list(graph)
+    for size in range(len(lefts), 0, -1):
+        for subset in itertools.combinations(lefts, size):
+            for rights in itertools.product(*(graph[left] for left in subset)):
+                if len(set(rights)) == size:
+                    return size
+    return 0
+
+
+class MatchingTests(TestCase):
+
+    def assertValidMatching(self, graph, matching):
+        self.assertEqual(len(set(matching.values())), len(matching))
+        for left, right in matching.items():
+            self.assertIn(right, graph[left])
+
+    def test_empty(self):
+        self.assertEqual(hopcroft_karp({}), {})
+        self.assertEqual(hopcroft_karp({0: []}), {})
+
+    def test_augmenting_path(self):
+        # greedy in order would give a to 0 and leave 1 without resource
+        graph = {0: ["a", "b"], 1: ["a"]}
+        self.assertEqual(hopcroft_karp(graph), {0: "b", 1: "a"})
+
+    def test_initial_matching(self):
+        graph = {0: ["a", "b"], 1: ["a"]}
+        self.assertEqual(hopcroft_karp(graph, {0: "a"}), {0: "b", 1: "a"})
+        # invalid initial entries are ignored
+        self.assertEqual(hopcroft_karp(graph, {0: "x", 1: "a"}), {0: "b", 1: "a"})
+
+    def test_preference_order(self):
+        self.assertEqual(hopcroft_karp({0: ["b", "a"]}), {0: "b"})
+
+    def test_random_graphs(self):
+        rand = random.Random(3)
+        rights = list("abcdef")
+        for _ in range(200):
+            graph = {left: rand.sample(rights, rand.randint(0, 3)) for left in range(5)}
+            matching = hopcroft_karp(graph)
+            self.assertValidMatching(graph, matching)
+            self.assertEqual(len(matching), brute_force_size(graph))
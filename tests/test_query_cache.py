@@ -0,0 +1,57 @@
+import logging
+from unittest import TestCase
+from unittest.mock import patch
+
+from mongoquery import Query
+
+from lockable.query_cache import QueryCache
+
+
+class QueryCacheTests(TestCase):
+
+    def setUp(self) -> None:
+        logger = logging.getLogger('lockable')
+        logger.handlers.clear()
+        logger.addHandler(logging.NullHandler())
+
+    def test_canonical_key(self):
+        self.assertEqual(QueryCache.canonical_key({"a": 1, "b": True}),
+                         QueryCache.canonical_key({"b": True, "a": 1}))
+        self.assertNotEqual(QueryCache.canonical_key({"a": 1}),
+                            QueryCache.canonical_key({"a": True}))
+        self.assertIsNone(QueryCache.canonical_key({"a": object()}))
+
+    def test_filter(self):
+        cache = QueryCache()
+        resources = [{"id": 1, "a": 1}, {"id": 2, "a": 2}]
+        self.assertEqual(cache.filter(resources, {"a": 2}, 1), [{"id": 2, "a": 2}])
+        self.assertEqual(cache.filter(resources, {"a": {"$gt": 0}}), resources)
+
+    def test_filter_memoized_per_version(self):
+        cache = QueryCache()
+        resources = [{"id": 1, "a": 1}]
+        with patch('lockable.query_cache.Query', wraps=Query) as query:
+            cache.filter(resources, {"a": 1}, 1)
+            cache.filter(resources, {"a": 1}, 1)
+            self.assertEqual(query.call_count, 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        resources.append({"id": 2, "a": 1})
+        self.assertEqual(len(cache.filter(resources, {"a": 1}, 1)), 1)
+        self.assertEqual(len(cache.filter(resources, {"a": 1}, 2)), 2)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_filter_returns_copy(self):
+        cache = QueryCache()
+        result = cache.filter([{"id": 1}], {}, 1)
+        result.clear()
+        self.assertEqual(cache.filter([{"id": 1}], {}, 1), [{"id": 1}])
+
+    def test_lru_eviction(self):
+        cache = QueryCache(maxsize=2)
+        cache.filter([], {"a": 1}, 1)
+        cache.filter([], {"a": 2}, 1)
+        cache.filter([], {"a": 1}, 1)
+        cache.filter([], {"a": 3}, 1)
+        self.assertEqual(len(cache), 2)
+        self.assertIn(QueryCache.canonical_key({"a": 1}), cache._entries)
+        self.assertNotIn(QueryCache.canonical_key({"a": 2}), cache._entries)
@@ -0,0 +1,90 @@
+import logging
+import random
+from unittest import TestCase
+
+from mongoquery import Query
+
+from lockable.query_planner import QueryPlanner
+from lockable.resource_index import ResourceIndex
+
+
+def create_resources(count, seed=1):
+    rand = random.Random(seed)
+    resources = []
+    for ident in range(count):
+        resources.append({
+            "id": ident,
+            "memory_gb": rand.choice([8, 16, 32, 64, 128, 64.5, True, "64", None, [128]]),
+            "type": rand.choice(["a", "b", "c", ["a", "b"], 1]),
+            "online": rand.choice([True, False])
+        })
+    return resources
+
+
+class QueryPlannerTests(TestCase):
+
+    def setUp(self) -> None:
+        logger = logging.getLogger('lockable')
+        logger.handlers.clear()
+        logger.addHandler(logging.NullHandler())
+
+    def assertPlanMatches(self, resources, requirement):
+        plan = QueryPlanner(ResourceIndex(resources)).plan(requirement)
+        candidates = resources if plan.candidates is None else plan.candidates
+        expected = list(filter(Query(requirement).match, resources))
+        self.assertEqual(list(filter(Query(plan.residual).match, candidates)), expected,
+                         requirement)
+        return plan
+
+    def test_range(self):
+        resources = [{"id": i, "memory_gb": i * 8} for i in range(20)]
+        plan = self.assertPlanMatches(resources, {"memory_gb": {"$gt": 64, "$lte": 96}})
+        self.assertEqual([r["id"] for r in plan.candidates], [9, 10, 11, 12])
+        self.assertEqual(plan.residual, {})
+
+    def test_range_strictest_bound(self):
+        resources = [{"id": i, "memory_gb": i} for i in range(10)]
+        plan = self.assertPlanMatches(resources, {"memory_gb": {"$gte": 5, "$gt": 5}})
+        self.assertEqual([r["id"] for r in plan.candidates], [6, 7, 8, 9])
+
+    def test_in_and_equal(self):
+        resources = create_resources(50)
+        plan = self.assertPlanMatches(resources, {"type": {"$in": ["a", "c"]}, "online": True})
+        self.assertEqual(plan.residual, {"type": {"$in": ["a", "c"]}})
+        plan = self.assertPlanMatches(resources, {"type": {"$eq": "a"}, "online": True})
+        self.assertEqual(plan.residual, {})
+
+    def test_not_indexable(self):
+        resources = create_resources(10)
+        for requirement in [{"memory_gb": {"$exists": True}},
+                            {"memory_gb": {"$gt": None}},
+                            {"memory_gb": {"$gt": 1, "$lt": "a"}},
+                            {"type": {"$in": "a"}},
+                            {"type": {"$eq": ["a", "b"]}},
+                            {"$or": [{"type": "a"}]}]:
+            plan = QueryPlanner(ResourceIndex(resources)).plan(requirement)
+            self.assertIsNone(plan.candidates)
+            self.assertEqual(plan.residual, requirement)
+
+    def test_selectivity_order(self):
+        resources = [{"id": i, "online": True, "memory_gb": i} for i in range(100)]
+        plan = self.assertPlanMatches(resources, {"online": True, "id": 3,
+                                                  "memory_gb": {"$gte": 0}})
+        self.assertEqual(plan.candidates, [resources[3]])
+        # broad range term is left for mongoquery
+        self.assertEqual(plan.residual, {"memory_gb": {"$gte": 0}})
+
+    def test_matches_mongoquery(self):
+        rand = random.Random(2)
+        resources = create_resources(300)
+        conditions = {
+            "memory_gb": [{"$gt": 64}, {"$gte": 16, "$lt": 128}, {"$lte": True},
+                          {"$gt": "6"}, {"$in": [8, 128]}, 64, {"$eq": 64}],
+            "type": ["a", {"$in": ["a", 1, ["a", "b"]]}, {"$gte": "b"}, ["a", "b"]],
+            "online": [True, False, {"$in": [True]}],
+        }
+        for _ in range(300):
+            requirement = {}
+            for key in rand.sample(sorted(conditions.keys()), rand.randint(1, 3)):
+                requirement[key] = rand.choice(conditions[key])
+            self.assertPlanMatches(resources, requirement)
@@ -0,0 +1,124 @@
+import logging
+import marshal
+import random
+from unittest import TestCase
+from unittest import mock
+
+from mongoquery import Query
+
+from lockable.query_planner import QueryPlanner
+from lockable.resource_index import ResourceIndex
+
+
+def candidates(index, requirement):
+    return QueryPlanner(index).plan(requirement).candidates
+
+
+RESOURCES = [
+    {"id": 1, "hostname": "a", "online": True, "type": "x"},
+    {"id": 2, "hostname": "a", "online": False, "type": "y"},
+    {"id": 3, "hostname": "b", "online": True, "type": ["x", "y"]},
+    {"id": 4, "hostname": "b", "online": 1, "type": {"name": "x"}},
+    {"id": 5, "hostname": "a", "online": True},
+]
+
+
+class ResourceIndexTests(TestCase):
+
+    def setUp(self) -> None:
+        logger = logging.getLogger('lockable')
+        logger.handlers.clear()
+        logger.addHandler(logging.NullHandler())
+
+    def assertMatchesQuery(self, index, resources, requirement):
+        selected = candidates(index, requirement)
+        if selected is None:
+            selected = resources
+        query = Query(requirement)
+        self.assertEqual(list(filter(query.match, selected)),
+                         list(filter(query.match, resources)), requirement)
+
+    def test_keys(self):
+        self.assertEqual(ResourceIndex(RESOURCES).keys, ["hostname", "id", "online", "type"])
+        self.assertEqual(ResourceIndex(RESOURCES, keys=["type"]).keys, ["type"])
+
+    def test_no_indexable_terms(self):
+        index = ResourceIndex(RESOURCES)
+        self.assertIsNone(candidates(index, {}))
+        self.assertIsNone(candidates(index, {"a.b": 1, "$or": [{"id": 1}]}))
+        self.assertIsNone(candidates(index, {"type": ["x", "y"]}))
+        self.assertIsNone(candidates(ResourceIndex(RESOURCES, keys=["type"]), {"id": 1}))
+
+    def test_candidates(self):
+        index = ResourceIndex(RESOURCES)
+        self.assertEqual(candidates(index, {"id": 2}), [RESOURCES[1]])
+        self.assertEqual(candidates(index, {"hostname": "a", "online": True}),
+                         [RESOURCES[0], RESOURCES[4]])
+        self.assertEqual(candidates(index, {"hostname": "b", "type": "x"}),
+                         [RESOURCES[2], RESOURCES[3]])
+        self.assertEqual(candidates(index, {"hostname": "c"}), [])
+        self.assertEqual(candidates(index, {"unknown": "c"}), [])
+
+    def test_candidates_match_mongoquery(self):
+        rand = random.Random(1)
+        values = ["a", "b", 1, 0, True, False, 1.0, None, ["a", 1], {"a": 1}]
+        resources = []
+        for ident in range(200):
+            resource = {"id": ident}
+            for key in ["k1", "k2", "k3"]:
+                if rand.random() < 0.8:
+                    resource[key] = rand.choice(values)
+            resources.append(resource)
+        index = ResourceIndex(resources)
+        for _ in range(200):
+            requirement = {}
+            for key in rand.sample(["k1", "k2", "k3", "k4"], rand.randint(1, 3)):
+                requirement[key] = rand.choice(values)
+            self.assertMatchesQuery(index, resources, requirement)
+
+    def test_updated_sorted_again(self):
+        with mock.patch.object(ResourceIndex, 'PATCH_LIMIT', 0):
+            self.test_updated()
+
+    def test_updated(self):
+        rand = random.Random(2)
+        values = ["a", "b", 1, 0, 2.5, True, None, ["a", 1]]
+
+        def create(ident):
+            resource = {"id": ident}
+            for key in ["k1", "k2"]:
+                if rand.random() < 0.8:
+                    resource[key] = rand.choice(values)
+            return resource
+
+        resources = [create(ident) for ident in range(100)]
+        index = ResourceIndex(resources)
+        for _ in range(20):
+            removes = rand.sample([resource["id"] for resource in resources], 5)
+            upserts = [create(rand.randrange(120)) for _ in range(5)]
+            updated = index.updated(removes, upserts)
+            pending = {resource["id"]: resource for resource in upserts}
+            expected = [pending.pop(resource["id"], resource) for resource in resources
+                        if resource["id"] not in removes] + list(pending.values())
+            for requirement in [{"k1": "a"}, {"k2": 1}, {"k1": {"$in": ["b", None]}},
+                                {"k2": {"$gt": 0}}, {"k1": {"$lte": "a"}}, {"k1": 2.5, "k2": "a"}]:
+                self.assertMatchesQuery(updated, expected, requirement)
+                self.assertEqual(candidates(updated, requirement),
+                                 candidates(ResourceIndex(expected), requirement), requirement)
+                # original index is not modified
+                self.assertMatchesQuery(index, resources, requirement)
+            self.assertEqual(len(updated), len(expected))
+            index, resources = updated, expected
+
+    def test_state(self):
+        index = ResourceIndex(RESOURCES, keys=["hostname", "online", "type"])
+        restored = ResourceIndex.from_state(marshal.loads(marshal.dumps(index.to_state())))
+        self.assertEqual(restored.keys, index.keys)
+        self.assertEqual(len(restored), len(index))
+        for requirement in [{"hostname": "a"}, {"online": True}, {"type": "x"},
+                            {"hostname": {"$gt": "a"}}, {"id": 1}]:
+            self.assertEqual(candidates(restored, requirement), candidates(index, requirement))
+            self.assertMatchesQuery(restored, RESOURCES, requirement)
+        # restored index can be updated
+        updated = restored.updated([1], [{"id": 6, "hostname": "c"}])
+        self.assertEqual(candidates(updated, {"hostname": "c"}), [{"id": 6, "hostname": "c"}])
@@ -0,0 +1,45 @@
+import itertools
+import random
+from unittest import TestCase
+
+from lockable.retry_policy import ConstantRetry, ExponentialBackoff, DecorrelatedJitter
+
+
+def take(policy, count):
+    return list(itertools.islice(policy.delays(), count))
+
+
+class RetryPolicyTests(TestCase):
+
+    def test_constant(self):
+        self.assertEqual(take(ConstantRetry(0.5), 3), [0.5, 0.5, 0.5])
+        self.assertEqual(take(ConstantRetry(2, cap=1), 2), [1, 1])
+
+    def test_exponential(self):
+        policy = ExponentialBackoff(base=0.1, factor=2, cap=0.5, jitter=False)
+        self.assertEqual(take(policy, 5), [0.1, 0.2, 0.4, 0.5, 0.5])
+
+    def test_exponential_jitter(self):
+        policy = ExponentialBackoff(base=0.1, factor=2, cap=0.5, rand=random.Random(1))
+        delays = take(policy, 20)
+        for delay, limit in zip(delays, [0.1, 0.2, 0.4] + [0.5] * 17):
+            self.assertTrue(0 <= delay <= limit)
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_decorrelated_jitter(self):
+        policy = DecorrelatedJitter(base=0.1, cap=1, rand=random.Random(1))
+        delays = take(policy, 50)
+        previous = 0.1
+        for delay in delays:
+            self.assertTrue(0.1 <= delay <= min(1, previous * 3))
+            previous = delay
+
+    def test_independent_iterators(self):
+        policy = ExponentialBackoff(base=1, factor=2, cap=10, jitter=False)
+        take(policy, 3)
+        self.assertEqual(take(policy, 2), [1, 2])
+
+    def test_repr(self):
+        self.assertEqual(repr(ConstantRetry(1)), 'ConstantRetry(interval=1, cap=None)')
+        self.assertIn('ExponentialBackoff', repr(ExponentialBackoff()))
+        self.assertIn('DecorrelatedJitter', repr(DecorrelatedJitter()))
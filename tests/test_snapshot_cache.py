@@ -0,0 +1,71 @@
+import hashlib
+import json
+import logging
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest import mock
+
+from lockable.provider_file import ProviderFile
+from lockable.snapshot_cache import SnapshotCache
+
+
+class SnapshotCacheTests(TestCase):
+
+    def setUp(self) -> None:
+        logger = logging.getLogger('lockable')
+        logger.handlers.clear()
+        logger.addHandler(logging.NullHandler())
+
+    def create_file(self, folder, resources):
+        list_file = os.path.join(folder, 'resources.json')
+        with open(list_file, 'w') as fp:
+            json.dump(resources, fp)
+        return list_file
+
+    def test_provider_uses_snapshot(self):
+        resources = [{"id": str(ident), "hostname": "a", "serial": ident} for ident in range(10)]
+        with TemporaryDirectory() as tmpdirname:
+            list_file = self.create_file(tmpdirname, resources)
+            provider = ProviderFile(list_file, snapshot_folder=tmpdirname)
+            snapshot = SnapshotCache(tmpdirname, list_file)
+            self.assertTrue(os.path.exists(snapshot.path))
+            with mock.patch.object(ProviderFile, '_parse_resources_list') as parse:
+                cached = ProviderFile(list_file, snapshot_folder=tmpdirname)
+                parse.assert_not_called()
+            self.assertEqual(cached.data, resources)
+            self.assertEqual(cached.index.equal('serial', 3), provider.index.equal('serial', 3))
+            self.assertEqual(cached.index.sorted_column('serial', 'number').count(2, True, 5),
+                             4)
+
+    def test_outdated_snapshot(self):
+        with TemporaryDirectory() as tmpdirname:
+            list_file = self.create_file(tmpdirname, [{"id": "a"}])
+            ProviderFile(list_file, snapshot_folder=tmpdirname)
+            list_file = self.create_file(tmpdirname, [{"id": "b"}])
+            self.assertEqual(ProviderFile(list_file, snapshot_folder=tmpdirname).data, [{"id": "b"}])
+            # index keys are part of the key
+            provider = ProviderFile(list_file, snapshot_folder=tmpdirname, index_keys=['x'])
+            self.assertEqual(provider.index.keys, [])
+
+    def test_invalid_snapshot(self):
+        with TemporaryDirectory() as tmpdirname:
+            list_file = self.create_file(tmpdirname, [{"id": "a"}])
+            snapshot = SnapshotCache(tmpdirname, list_file)
+            for content in (b'', b'garbage'):
+                with open(snapshot.path, 'wb') as fp:
+                    fp.write(content)
+                provider = ProviderFile(list_file, snapshot_folder=tmpdirname)
+                self.assertEqual(provider.data, [{"id": "a"}])
+
+    def test_untrusted_snapshot(self):
+        with TemporaryDirectory() as tmpdirname:
+            list_file = self.create_file(tmpdirname, [{"id": "a"}])
+            ProviderFile(list_file, snapshot_folder=tmpdirname)
+            snapshot = SnapshotCache(tmpdirname, list_file)
+            with open(list_file, 'rb') as fp:
+                stat = os.fstat(fp.fileno())
+                digest = hashlib.sha256(fp.read()).digest()
+            self.assertIsNotNone(snapshot.load(stat, digest))
+            os.chmod(snapshot.path, 0o666)
+            self.assertIsNone(snapshot.load(stat, digest))
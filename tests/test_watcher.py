@@ -0,0 +1,89 @@
+import logging
+import os
+import threading
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase, skipUnless
+
+from lockable.watcher import InotifyWatcher, PollingWatcher, create_watcher, _libc, \
+    IN_CLOSE_WRITE, IN_DELETE
+
+
+def touch(path):
+    with open(path, 'w') as fp:
+        fp.write('1')
+
+
+def delayed(delay, func, *args):
+    thread = threading.Timer(delay, func, args)
+    thread.start()
+    return thread
+
+
+class WatcherTestsMixin:
+    watcher_class = None
+
+    def setUp(self) -> None:
+        logger = logging.getLogger('lockable')
+        logger.handlers.clear()
+        logger.addHandler(logging.NullHandler())
+
+    def test_wait_timeout(self):
+        with TemporaryDirectory() as tmpdirname:
+            touch(os.path.join(tmpdirname, 'a.pid'))
+            with self.watcher_class(tmpdirname) as watcher:
+                start = time.monotonic()
+                self.assertFalse(watcher.wait(['a.pid'], 0.2))
+                self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_wait_release(self):
+        with TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, 'a.pid')
+            touch(path)
+            with self.watcher_class(tmpdirname) as watcher:
+                self.assertFalse(watcher.wait(['a.pid'], 0))
+                thread = delayed(0.1, os.unlink, path)
+                start = time.monotonic()
+                self.assertTrue(watcher.wait(['a.pid'], 5))
+                self.assertLess(time.monotonic() - start, 1)
+                thread.join()
+
+    def test_wait_ignores_other_files(self):
+        with TemporaryDirectory() as tmpdirname:
+            touch(os.path.join(tmpdirname, 'a.pid'))
+            touch(os.path.join(tmpdirname, 'b.pid'))
+            with self.watcher_class(tmpdirname) as watcher:
+                self.assertFalse(watcher.wait(['a.pid', 'b.pid'], 0))
+                os.unlink(os.path.join(tmpdirname, 'b.pid'))
+                self.assertFalse(watcher.wait(['a.pid'], 0.2))
+
+    def test_wait_modification(self):
+        with TemporaryDirectory() as tmpdirname:
+            path = os.path.join(tmpdirname, 'data.json')
+            touch(path)
+            with self.watcher_class(tmpdirname, IN_CLOSE_WRITE | IN_DELETE) as watcher:
+                self.assertFalse(watcher.wait(['data.json'], 0))
+                with open(path, 'w') as fp:
+                    fp.write('changed content')
+                self.assertTrue(watcher.wait(['data.json'], 1))
+
+
+@skipUnless(_libc(), 'inotify not available')
+class InotifyWatcherTests(WatcherTestsMixin, TestCase):
+    watcher_class = InotifyWatcher
+
+
+class PollingWatcherTests(WatcherTestsMixin, TestCase):
+    watcher_class = PollingWatcher
+
+
+class CreateWatcherTests(TestCase):
+
+    def test_create_watcher(self):
+        with TemporaryDirectory() as tmpdirname:
+            with create_watcher(tmpdirname) as watcher:
+                self.assertIsInstance(watcher, InotifyWatcher if _libc() else PollingWatcher)
+
+    def test_create_watcher_fallback(self):
+        with create_watcher('/not/existing/folder') as watcher:
+            self.assertIsInstance(watcher, PollingWatcher)